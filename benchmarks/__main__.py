@@ -0,0 +1,143 @@
+"""
+Benchmarks of the simulation hot paths.
+
+Usage:
+    python -m benchmarks list
+    python -m benchmarks run --suite quick --save before
+    python -m benchmarks run --suite quick --only model-arrays --out after.json
+    python -m benchmarks compare benchmarks/baselines/before.json after.json
+    python -m benchmarks check
+
+Every scenario runs in a fresh process. ``compare`` exits with status 1 when a
+headline metric got worse by more than ``--threshold``; a positive change is
+always a slowdown (or more memory), whichever way the metric itself points.
+``check`` exits with status 1 when event scheduling changes the epidemic,
+see benchmarks.equivalence.
+"""
+
+import argparse
+import os
+import sys
+
+from benchmarks.compare import compare, format_changes, load, save
+from benchmarks.equivalence import T_LIMIT, check_scheduling
+from benchmarks.harness import run_suite
+from benchmarks.scenarios import SUITES, get_scenarios
+
+
+BASELINES_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+
+def _format_metrics(metrics: dict) -> str:
+    parts = []
+    for name in ("steps_per_sec", "finds_per_sec", "is_allowed_per_sec", "fps"):
+        if name in metrics:
+            parts.append(f"{name}={metrics[name]:.1f}")
+    for name in ("step_ms", "cold_find_ms", "decay_ms", "frame_ms"):
+        if name in metrics:
+            parts.append(f"{name}={metrics[name]['mean']:.3f}")
+    if metrics.get("peak_rss_mb") is not None:
+        parts.append(f"peak_rss_mb={metrics['peak_rss_mb']:.0f}")
+    return " ".join(parts)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="List the scenarios of a suite")
+    list_parser.add_argument("--suite", choices=SUITES, default="full")
+
+    run_parser = commands.add_parser("run", help="Run a suite")
+    run_parser.add_argument("--suite", choices=SUITES, default="quick")
+    run_parser.add_argument(
+        "--only", nargs="+", default=None, help="Only scenarios whose name contains one of these"
+    )
+    run_parser.add_argument("--out", default=None, help="Write the results to this JSON file")
+    run_parser.add_argument(
+        "--save", default=None, help="Write the results as baselines/<SAVE>.json"
+    )
+    run_parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Run all scenarios in this process, e.g. for a profiler; peak RSS is then shared",
+    )
+
+    compare_parser = commands.add_parser("compare", help="Diff two result files")
+    compare_parser.add_argument("base", help="Baseline results, a path or a name in baselines/")
+    compare_parser.add_argument("new", help="New results, a path or a name in baselines/")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1, help="Relative change that counts as a regression"
+    )
+    compare_parser.add_argument(
+        "--verbose", action="store_true", help="Also show phase times, tail latencies and setup times"
+    )
+
+    check_parser = commands.add_parser(
+        "check", help="Check that event scheduling gives the same epidemic as step scheduling"
+    )
+    check_parser.add_argument("--agents", type=int, default=300)
+    check_parser.add_argument("--steps", type=int, default=1200)
+    check_parser.add_argument("--seeds", type=int, default=8, help="Runs per scheduling")
+    return parser.parse_args(argv)
+
+
+def _resolve(path_or_name: str) -> str:
+    if os.path.exists(path_or_name):
+        return path_or_name
+    return os.path.join(BASELINES_DIR, f"{path_or_name}.json")
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    if args.command == "list":
+        for scenario in SUITES[args.suite]:
+            print(f"{scenario.name:<28} {scenario.params()}")
+        return 0
+
+    if args.command == "run":
+        scenarios = get_scenarios(args.suite, args.only)
+        results = run_suite(
+            scenarios,
+            isolated=not args.in_process,
+            on_result=lambda s, m: print(f"{s.name:<28} {_format_metrics(m)}", flush=True),
+        )
+        results["environment"]["suite"] = args.suite
+        paths = []
+        if args.out is not None:
+            paths.append(args.out)
+        if args.save is not None:
+            os.makedirs(BASELINES_DIR, exist_ok=True)
+            paths.append(os.path.join(BASELINES_DIR, f"{args.save}.json"))
+        for path in paths:
+            save(results, path)
+            print(f"results written to {path}")
+        return 0
+
+    if args.command == "check":
+        results = check_scheduling(args.agents, args.steps, args.seeds)
+        for result in results:
+            print(
+                f"mobility={result['mobility']:<9} "
+                f"infections step={result['step_mean']:.1f} event={result['event_mean']:.1f} "
+                f"t={result['t']:+.2f} {'ok' if result['passed'] else 'DIFFERENT'}"
+            )
+        failed = [r for r in results if not r["passed"]]
+        if failed:
+            print(f"\n{len(failed)} check(s) with |t| above {T_LIMIT}")
+            return 1
+        return 0
+
+    base, new = load(_resolve(args.base)), load(_resolve(args.new))
+    changes = compare(base, new)
+    print(format_changes(changes, args.threshold, args.verbose))
+    regressions = [c for c in changes if c.is_regression(args.threshold)]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
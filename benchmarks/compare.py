@@ -0,0 +1,121 @@
+from __future__ import annotations
+import json
+from typing import Optional
+
+
+# metrics ending like this are better when higher, all others when lower
+HIGHER_IS_BETTER = ("_per_sec", "fps")
+# single measurements and constants of the scenario, shown but never failing a comparison
+CONTEXT_METRICS = ("setup_s", "map_cells")
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(results: dict, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+
+
+def flatten(metrics: dict, prefix: str = "") -> dict[str, float]:
+    """
+    Nested metrics as one level, e.g. ``{"step_ms.p50": 1.2}``.
+    """
+    flat = {}
+    for name, value in metrics.items():
+        key = f"{prefix}{name}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[key] = float(value)
+    return flat
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.split(".")[0].endswith(HIGHER_IS_BETTER)
+
+
+def is_headline(metric: str) -> bool:
+    """
+    Metrics that can fail a comparison. Phase times, tail percentiles and
+    the one-off setup time are noisier and only shown for diagnosis.
+    """
+    return (
+        not metric.startswith("phases_ms.")
+        and not metric.endswith(".p95")
+        and metric not in CONTEXT_METRICS
+    )
+
+
+class Change:
+    """
+    One metric of one scenario in both result sets.
+    """
+
+    def __init__(self, scenario: str, metric: str, base: float, new: float):
+        self.scenario = scenario
+        self.metric = metric
+        self.base = base
+        self.new = new
+
+    @property
+    def ratio(self) -> Optional[float]:
+        """
+        How much worse (> 1) or better (< 1) the new value is.
+        """
+        if self.base == 0 or self.new == 0:
+            return None
+        if higher_is_better(self.metric):
+            return self.base / self.new
+        return self.new / self.base
+
+    def is_regression(self, threshold: float) -> bool:
+        ratio = self.ratio
+        return is_headline(self.metric) and ratio is not None and ratio > 1 + threshold
+
+    def is_improvement(self, threshold: float) -> bool:
+        ratio = self.ratio
+        return is_headline(self.metric) and ratio is not None and ratio < 1 / (1 + threshold)
+
+
+def compare(base: dict, new: dict) -> list[Change]:
+    """
+    Every metric of every scenario present in both result sets.
+    """
+    changes = []
+    for scenario, result in new["results"].items():
+        if scenario not in base["results"]:
+            continue
+        base_metrics = flatten(base["results"][scenario]["metrics"])
+        for metric, value in flatten(result["metrics"]).items():
+            if metric in base_metrics:
+                changes.append(Change(scenario, metric, base_metrics[metric], value))
+    return changes
+
+
+def format_changes(changes: list[Change], threshold: float, verbose: bool = False) -> str:
+    """
+    A table of the changes, only the headline metrics unless ``verbose``.
+    """
+    lines = [f"{'scenario':<28} {'metric':<28} {'base':>12} {'new':>12} {'change':>8}"]
+    for change in changes:
+        if not verbose and not is_headline(change.metric):
+            continue
+        ratio = change.ratio
+        if ratio is None:
+            delta = "n/a"
+        else:
+            delta = f"{(ratio - 1) * 100:+.1f}%"
+        flag = ""
+        if change.is_regression(threshold):
+            flag = "  REGRESSION"
+        elif change.is_improvement(threshold):
+            flag = "  improved"
+        lines.append(
+            f"{change.scenario:<28} {change.metric:<28} "
+            f"{change.base:>12.4g} {change.new:>12.4g} {delta:>8}{flag}"
+        )
+    return "\n".join(lines)
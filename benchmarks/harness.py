@@ -0,0 +1,318 @@
+from __future__ import annotations
+import contextlib
+import io
+import multiprocessing as mp
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from benchmarks.scenarios import BASE_MAP, Scenario, tiled_map
+from sim.src.model import CovidModel
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of this process so far, None where it cannot be read.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+class PhaseTimer:
+    """
+    Accumulates the time spent in methods of the objects it wraps, per phase.
+    """
+
+    def __init__(self):
+        self.totals: defaultdict[str, float] = defaultdict(float)
+
+    def wrap(self, obj, method: str, phase: str) -> None:
+        original = getattr(obj, method)
+        totals = self.totals
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                totals[phase] += time.perf_counter() - start
+
+        setattr(obj, method, timed)
+
+
+def _summary_ms(times: list[float]) -> dict[str, float]:
+    ms = np.array(times) * 1000
+    return {"mean": float(ms.mean()), "p50": float(np.median(ms)), "p95": float(np.percentile(ms, 95))}
+
+
+def _new_model(scenario: Scenario, mapa) -> CovidModel:
+    return CovidModel(
+        N=scenario.agents,
+        width=mapa.width,
+        height=mapa.height,
+        map=mapa,
+        seed=scenario.seed,
+        engine=scenario.engine,
+        scheduling=scenario.scheduling,
+        transmission=scenario.transmission,
+        mobility=scenario.mobility,
+        # a bounded ring keeps recording in the measurement without growing memory
+        record_every=1,
+        record_capacity=max(16 * scenario.agents, 1),
+    )
+
+
+def bench_model(scenario: Scenario) -> dict:
+    mapa = tiled_map(scenario.tiles)
+    start = time.perf_counter()
+    model = _new_model(scenario, mapa)
+    setup_s = time.perf_counter() - start
+    for _ in range(scenario.warmup):
+        model.step()
+
+    phases = PhaseTimer()
+    if model.population is not None:
+        phases.wrap(model.population, "step", "agents")
+    elif model.scheduler is not None:
+        phases.wrap(model.scheduler, "step", "agents")
+    else:
+        phases.wrap(model, "_step_agents", "agents")
+    phases.wrap(model.virus, "deposit", "deposit")
+    phases.wrap(model.virus, "decay", "decay")
+    if model.recorder is not None:
+        phases.wrap(model.recorder, "record", "record")
+
+    times = []
+    for _ in range(scenario.steps):
+        start = time.perf_counter()
+        model.step()
+        times.append(time.perf_counter() - start)
+    total = sum(times)
+
+    phases_ms = {phase: 1000 * t / scenario.steps for phase, t in phases.totals.items()}
+    phases_ms["other"] = 1000 * total / scenario.steps - sum(phases_ms.values())
+    return {
+        "steps_per_sec": scenario.steps / total,
+        "step_ms": _summary_ms(times),
+        "phases_ms": phases_ms,
+        "setup_s": setup_s,
+        "map_cells": mapa.width * mapa.height,
+    }
+
+
+def bench_pathfinding(scenario: Scenario) -> dict:
+    import mesa
+
+    from sim.src.generators import DestinationPathFinder
+
+    mapa = tiled_map(scenario.tiles)
+    finder = DestinationPathFinder(mesa.space.MultiGrid(mapa.width, mapa.height, True), mapa)
+    walkable = np.argwhere(mapa.walkable)
+    rng = np.random.default_rng(scenario.seed)
+    pairs = [
+        (tuple(map(int, walkable[a])), tuple(map(int, walkable[b])))
+        for a, b in rng.integers(0, len(walkable), (scenario.steps, 2))
+    ]
+
+    # every destination is new, so every call searches a whole field
+    cold = []
+    for start_pos, end_pos in pairs:
+        t = time.perf_counter()
+        finder.find(start_pos, end_pos)
+        cold.append(time.perf_counter() - t)
+    warm = []
+    for start_pos, end_pos in pairs:
+        t = time.perf_counter()
+        finder.find(start_pos, end_pos)
+        warm.append(time.perf_counter() - t)
+    return {
+        "cold_find_ms": _summary_ms(cold),
+        "warm_find_ms": _summary_ms(warm),
+        "finds_per_sec": len(pairs) / sum(warm),
+        "map_cells": mapa.width * mapa.height,
+    }
+
+
+def bench_is_allowed(scenario: Scenario) -> dict:
+    mapa = tiled_map(scenario.tiles)
+    rng = np.random.default_rng(scenario.seed)
+    # a margin of positions outside the map on every side
+    positions = np.column_stack(
+        (
+            rng.integers(-2, mapa.width + 2, scenario.repeat),
+            rng.integers(-2, mapa.height + 2, scenario.repeat),
+        )
+    )
+    as_tuples = [tuple(p) for p in positions.tolist()]
+
+    scalar = []
+    vectorized = []
+    for _ in range(scenario.steps):
+        t = time.perf_counter()
+        for pos in as_tuples:
+            mapa.is_allowed(pos)
+        scalar.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        mapa.allowed_mask(positions)
+        vectorized.append(time.perf_counter() - t)
+    n = scenario.steps * scenario.repeat
+    return {
+        "is_allowed_per_sec": n / sum(scalar),
+        "allowed_mask_per_sec": n / sum(vectorized),
+    }
+
+
+def bench_decay(scenario: Scenario) -> dict:
+    mapa = tiled_map(scenario.tiles)
+    model = _new_model(scenario, mapa)
+    rng = np.random.default_rng(scenario.seed)
+    contamination = rng.uniform(0, 255, (mapa.width, mapa.height))
+    contamination[rng.random((mapa.width, mapa.height)) < 0.5] = 0.0
+
+    times = []
+    for _ in range(scenario.steps):
+        model.virus.data[...] = contamination
+        t = time.perf_counter()
+        for _ in range(scenario.repeat):
+            model.virus.decay()
+        times.append((time.perf_counter() - t) / scenario.repeat)
+    return {
+        "decay_ms": _summary_ms(times),
+        "map_cells": mapa.width * mapa.height,
+    }
+
+
+def bench_render(scenario: Scenario) -> dict:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+
+    from maps.heatmap import VirusHeatmap
+    from maps.map import TILE_SIZE, Map
+
+    pygame.init()
+    # the display has to exist before the map's tile images are loaded
+    size = Map(BASE_MAP, headless=True)
+    screen = pygame.display.set_mode((size.width * TILE_SIZE, size.height * TILE_SIZE))
+    mapa = Map(BASE_MAP)
+    model = _new_model(scenario, mapa)
+    heatmap = VirusHeatmap(mapa.width, mapa.height, TILE_SIZE)
+    for _ in range(scenario.warmup):
+        model.step()
+
+    if model.population is not None:
+        agents = lambda: model.population.views()  # noqa: E731
+    else:
+        agents = lambda: model.custom_agents  # noqa: E731
+
+    mapa.draw_map()
+    pygame.display.update()
+    dirty_rects = []
+    times = []
+    for _ in range(scenario.steps):
+        model.step()
+        t = time.perf_counter()
+        mapa.restore(dirty_rects)
+        drawn_rects = [
+            agent.render(screen, TILE_SIZE, TILE_SIZE, TILE_SIZE // 2) for agent in agents()
+        ]
+        drawn_rects.extend(heatmap.draw(screen, model.virus.data))
+        pygame.display.update(dirty_rects + drawn_rects)
+        dirty_rects = drawn_rects
+        times.append(time.perf_counter() - t)
+    pygame.quit()
+    return {
+        "frame_ms": _summary_ms(times),
+        "fps": scenario.steps / sum(times),
+    }
+
+
+BENCHMARKS: dict[str, Callable[[Scenario], dict]] = {
+    "model": bench_model,
+    "pathfinding": bench_pathfinding,
+    "is_allowed": bench_is_allowed,
+    "decay": bench_decay,
+    "render": bench_render,
+}
+
+
+def run_scenario(scenario: Scenario) -> dict:
+    """
+    Run one scenario in this process and return its metrics.
+    The model's console output is swallowed.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        metrics = BENCHMARKS[scenario.kind](scenario)
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def run_isolated(scenario: Scenario) -> dict:
+    """
+    Run one scenario in a fresh process, so its peak RSS and timings
+    are not influenced by the scenarios that ran before it.
+    """
+    with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as executor:
+        return executor.submit(run_scenario, scenario).result()
+
+
+def environment() -> dict:
+    """
+    Where the results were measured, stored next to them.
+    """
+    import mesa
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "mesa": mesa.__version__,
+    }
+
+
+def run_suite(
+    scenarios: list[Scenario],
+    isolated: bool = True,
+    on_result: Optional[Callable[[Scenario, dict], None]] = None,
+) -> dict:
+    """
+    Run scenarios one after another.
+    Args:
+        scenarios (list[Scenario]): What to run.
+        isolated (bool): Run every scenario in a fresh process.
+        on_result (Optional[Callable]): Called with every scenario and its metrics.
+    Returns:
+        The environment and, per scenario name, its parameters and metrics.
+    """
+    results = {}
+    for scenario in scenarios:
+        metrics = run_isolated(scenario) if isolated else run_scenario(scenario)
+        results[scenario.name] = {"params": scenario.params(), "metrics": metrics}
+        if on_result is not None:
+            on_result(scenario, metrics)
+    return {"environment": environment(), "results": results}
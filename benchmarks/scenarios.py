@@ -0,0 +1,141 @@
+from __future__ import annotations
+from typing import Optional
+
+from maps.compiler import load_map
+from maps.map import Map
+
+
+BASE_MAP = "maps/walkway_map.tmx"
+
+
+class Scenario:
+    """
+    One reproducible benchmark: what to run, on which map, with which seed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        agents: int = 0,
+        engine: str = "agents",
+        tiles: int = 1,
+        steps: int = 200,
+        warmup: int = 100,
+        seed: int = 1,
+        scheduling: str = "step",
+        repeat: int = 1,
+        transmission: str = "virus",
+        mobility: str = "random",
+    ):
+        """
+        Args:
+            name (str): Unique name, the key of the scenario in result files.
+            kind (str): "model", "pathfinding", "is_allowed", "decay" or "render".
+            agents (int): Number of agents.
+            engine (str): Model engine, "agents" or "arrays".
+            tiles (int): The map is walkway_map tiled ``tiles`` x ``tiles`` times.
+            steps (int): Measured steps, frames or calls.
+            warmup (int): Steps run before measuring; the default covers
+                the infection of patient zero at step 100.
+            seed (int): Seed of the model.
+            scheduling (str): Model scheduling, "step" or "event".
+            repeat (int): Calls per measured operation, for operations too
+                fast to time one by one.
+            transmission (str): Model transmission, "virus", "contact" or "both".
+            mobility (str): Model mobility, "random" or "schedule".
+        """
+        self.name = name
+        self.kind = kind
+        self.agents = agents
+        self.engine = engine
+        self.tiles = tiles
+        self.steps = steps
+        self.warmup = warmup
+        self.seed = seed
+        self.scheduling = scheduling
+        self.repeat = repeat
+        self.transmission = transmission
+        self.mobility = mobility
+
+    def params(self) -> dict:
+        return dict(vars(self))
+
+    def __repr__(self) -> str:
+        return f"Scenario({self.name})"
+
+
+def tiled_map(tiles: int, base: Optional[Map] = None) -> Map:
+    """
+    Synthetic map of ``tiles`` x ``tiles`` copies of the base map.
+    The copies are separated by one tile wide roads, which every copy's road
+    network touches at its top edge, so all copies form one connected town.
+    """
+    if base is None:
+        base = load_map(BASE_MAP)
+    if tiles == 1:
+        return base
+
+    cell_w, cell_h = base.width + 1, base.height + 1
+    width, height = tiles * cell_w, tiles * cell_h
+    layers: dict[str, list[tuple[int, int]]] = {
+        name: [] for name in base.layer_positions
+    }
+    for i in range(tiles):
+        for j in range(tiles):
+            ox, oy = i * cell_w + 1, j * cell_h + 1
+            for name, positions in base.layer_positions.items():
+                layers[name].extend((x + ox, y + oy) for x, y in positions)
+    # the separating roads
+    layers["road"].extend(
+        (x, y) for x in range(width) for y in range(height) if x % cell_w == 0 or y % cell_h == 0
+    )
+    return Map.from_layers(width, height, layers)
+
+
+def _model(name, agents, engine="agents", tiles=1, steps=200, **kwargs) -> Scenario:
+    return Scenario(name, "model", agents, engine, tiles, steps, **kwargs)
+
+
+SUITES: dict[str, list[Scenario]] = {
+    "quick": [
+        _model("model-agents-30", 30),
+        _model("model-agents-300", 300),
+        _model("model-agents-300-event", 300, scheduling="event"),
+        _model("model-arrays-10k", 10_000, "arrays"),
+        _model("model-arrays-10k-tiled2", 10_000, "arrays", tiles=2),
+        _model("model-arrays-10k-contact", 10_000, "arrays", transmission="both"),
+        _model("model-agents-300-schedule-event", 300, scheduling="event", mobility="schedule"),
+        Scenario("pathfinding-cold", "pathfinding", steps=200, warmup=0),
+        Scenario("is_allowed", "is_allowed", steps=100, warmup=0, repeat=1000),
+        Scenario("decay", "decay", steps=200, warmup=0, repeat=10),
+        Scenario("render-agents-30", "render", 30, steps=200),
+    ],
+}
+SUITES["full"] = SUITES["quick"] + [
+    _model("model-agents-3000", 3000, steps=100),
+    _model("model-agents-3000-event", 3000, steps=100, scheduling="event"),
+    _model("model-agents-300-tiled2", 300, tiles=2),
+    _model("model-arrays-30", 30, "arrays"),
+    _model("model-arrays-1k", 1000, "arrays"),
+    _model("model-arrays-100k", 100_000, "arrays"),
+    _model("model-arrays-100k-tiled4", 100_000, "arrays", tiles=4),
+    _model("model-arrays-100k-tiled4-contact", 100_000, "arrays", tiles=4, transmission="both"),
+    _model("model-agents-300-contact", 300, transmission="both"),
+    _model("model-agents-3000-schedule-event", 3000, steps=100, scheduling="event", mobility="schedule"),
+    _model("model-arrays-100k-schedule", 100_000, "arrays", mobility="schedule"),
+    Scenario("pathfinding-cold-tiled4", "pathfinding", tiles=4, steps=200, warmup=0),
+    Scenario("decay-tiled4", "decay", tiles=4, steps=200, warmup=0, repeat=10),
+    Scenario("render-agents-300", "render", 300, steps=200),
+    Scenario("render-arrays-10k", "render", 10_000, "arrays", steps=50),
+]
+
+
+def get_scenarios(suite: str, only: Optional[list[str]] = None) -> list[Scenario]:
+    """
+    The scenarios of a suite, optionally only those whose name contains one of ``only``.
+    """
+    scenarios = SUITES[suite]
+    if only:
+        scenarios = [s for s in scenarios if any(part in s.name for part in only)]
+    return scenarios
@@ -1,6 +1,11 @@
+import argparse
+import time
+
 import pygame
+from maps.heatmap import VirusHeatmap
 from maps.map import Map, TILE_SIZE
 from sim.src.agents import HumanAgent
+from sim.src.live import UNLIMITED, LiveSimulation
 from sim.src.model import CovidModel
 from sim.src.params import IllnessStates
 
@@ -10,6 +15,9 @@ SCREEN_HEIGHT = 736
 FPS = 60  # 60
 
 SCREEN_WIDTH_PLUS = SCREEN_WIDTH + 250
+# above this many dirty rects a single full display update is cheaper
+MAX_DIRTY_RECTS = 2000
+MAX_STEPS_PER_FRAME = 64
 
 def draw_combined_chart(surface, data_dict, origin_x, origin_y, width, height, font, y_label="Liczba osób"):
     if all(len(data) == 0 for data in data_dict.values()):
@@ -66,44 +74,96 @@ def draw_combined_chart(surface, data_dict, origin_x, origin_y, width, height, f
         surface.blit(text, (origin_x - leftval2, y_pos - 10))
 
 
-def draw_virus_progress_bar(screen, i, j, val, thickness=2):
-    pygame.draw.rect(
-        screen,
-        (0, 0, 0),
-        pygame.Rect(
-            i * TILE_SIZE,
-            j * TILE_SIZE,
-            TILE_SIZE,
-            thickness,
-        ),
-    )
-    pygame.draw.rect(
-        screen,
-        (255, 0, 0),
-        pygame.Rect(
-            i * TILE_SIZE,
-            j * TILE_SIZE,
-            min(TILE_SIZE, val / 255 * TILE_SIZE),
-            thickness,
-        ),
-    )
+def draw_profile_overlay(surface, profile, frame_ms, font):
+    """
+    Times of the phases of the last model step and its counters,
+    in the top left corner of the map. Returns the area drawn over.
+    """
+    lines = [f"frame (render): {frame_ms:.2f} ms"]
+    if profile is not None:
+        lines.append(f"step {profile.step}: {profile.duration * 1000:.2f} ms")
+        lines += [f"  {name}: {seconds * 1000:.2f} ms" for name, seconds in profile.times.items()]
+        lines += [f"  {name}: {n}" for name, n in profile.counts.items()]
+    line_height = font.get_linesize()
+    rect = pygame.Rect(0, 0, 260, line_height * len(lines) + 10)
+    background = pygame.Surface(rect.size, pygame.SRCALPHA)
+    background.fill((0, 0, 0, 180))
+    surface.blit(background, rect)
+    for i, line in enumerate(lines):
+        surface.blit(font.render(line, True, (255, 255, 255)), (5, 5 + i * line_height))
+    return rect
+
+
+def set_caption(live_sim=None):
+    caption = "Simulation of virus spread"
+    if live_sim is not None:
+        if live_sim.paused:
+            speed = "paused"
+        elif live_sim.steps_per_frame == UNLIMITED:
+            speed = "unlimited"
+        else:
+            speed = f"{live_sim.steps_per_frame} steps/frame"
+        caption += f" ({speed})"
+    pygame.display.set_caption(caption)
+
+
+def handle_live_key(live_sim, key):
+    """
+    Speed controls of the live mode:
+    SPACE pauses, +/- double or halve the steps per frame,
+    0 lets the simulation run unlimited and 1 goes back to a step per frame.
+    """
+    if key == pygame.K_SPACE:
+        live_sim.paused = not live_sim.paused
+    elif key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+        if live_sim.steps_per_frame != UNLIMITED:
+            live_sim.steps_per_frame = min(MAX_STEPS_PER_FRAME, live_sim.steps_per_frame * 2)
+    elif key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+        if live_sim.steps_per_frame != UNLIMITED:
+            live_sim.steps_per_frame = max(1, live_sim.steps_per_frame // 2)
+    elif key == pygame.K_0:
+        live_sim.steps_per_frame = UNLIMITED
+    elif key == pygame.K_1:
+        live_sim.steps_per_frame = 1
+    else:
+        return
+    set_caption(live_sim)
 
-def main():
+
+def main(live=False, agents=30):
+    """
+    Args:
+        live (bool): Run the simulation in a separate process, so that rendering
+            never waits for it, with keyboard speed controls.
+        agents (int): Number of agents.
+    """
     pygame.init()
     screen = pygame.display.set_mode((SCREEN_WIDTH_PLUS, SCREEN_HEIGHT))
-    pygame.display.set_caption("Simulation of virus spread")
     clock = pygame.time.Clock()
     font = pygame.font.SysFont("Arial", 18, bold=True)  # Font do liczników
     mapa = Map("maps/walkway_map.tmx")
-    model = CovidModel(
-        N=30,
-        width=SCREEN_WIDTH // TILE_SIZE,
-        height=SCREEN_HEIGHT // TILE_SIZE,
-        map=mapa,
-    )
-
-    virus_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-    virus_surface.set_alpha(254 // 5)
+    model = None
+    live_sim = None
+    if live:
+        live_sim = LiveSimulation("maps/walkway_map.tmx", agents)
+        live_sim.start()
+    else:
+        model = CovidModel(
+            N=agents,
+            width=SCREEN_WIDTH // TILE_SIZE,
+            height=SCREEN_HEIGHT // TILE_SIZE,
+            map=mapa,
+        )
+    set_caption(live_sim)
+
+    heatmap = VirusHeatmap(mapa.width, mapa.height, TILE_SIZE, bar_thickness=3)
+
+    sidebar_rect = pygame.Rect(SCREEN_WIDTH, 0, SCREEN_WIDTH_PLUS - SCREEN_WIDTH, SCREEN_HEIGHT)
+    # areas of the map drawn over in the previous frame
+    dirty_rects = []
+    screen.fill((0, 0, 0))
+    mapa.draw_map()
+    pygame.display.update()
 
     infected_history = []
     recovered_history = []
@@ -111,6 +171,9 @@ def main():
     cumulative_infections = []
     cumulative_recoveries = []
 
+    profile_font = pygame.font.SysFont("Consolas", 13)
+    frame_ms = 0.0
+
     running = True
     while running:
         for event in pygame.event.get():
@@ -129,28 +192,49 @@ def main():
                 grid_x = mouse_x // TILE_SIZE
                 grid_y = mouse_y // TILE_SIZE
                 print(f"Clicked tile coordinates: ({grid_x}, {grid_y})")
-        model.step()
-        screen.fill((0, 0, 0))
-        mapa.draw_map()
-        for agent in model.agents:
-            if isinstance(agent, HumanAgent):
+            elif event.type == pygame.KEYDOWN and live_sim is not None:
+                handle_live_key(live_sim, event.key)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_p:
+                # P shows or hides the profiling overlay
+                if model.profiler is None:
+                    model.enable_profiling()
+                else:
+                    model.disable_profiling()
+
+        if live_sim is not None:
+            live_sim.request_frame()
+            snapshot = live_sim.snapshot()
+            agents_to_draw = snapshot.agents()
+            virus = snapshot.virus
+        else:
+            model.step()
+            agents_to_draw = [a for a in model.agents if isinstance(a, HumanAgent)]
+            virus = model.grid.properties["Virus"].data
+
+        frame_start = time.perf_counter()
+        mapa.restore(dirty_rects)
+        screen.fill((0, 0, 0), sidebar_rect)
+        drawn_rects = []
+        for agent in agents_to_draw:
+            drawn_rects.append(
                 agent.render(screen, TILE_SIZE, TILE_SIZE, TILE_SIZE // 2)
+            )
 
-        prop = model.grid.properties["Virus"]
-        for i, row in enumerate(prop.data):
-            for j, val in enumerate(row):
-                if val > 0.0:
-                    intensity = min(255, int(val))  # ogranicz wartość do 0–255
-                    overlay = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
-                    overlay.fill((255, 0, 0, intensity // 2))  # czerwona półprzezroczysta
-                    screen.blit(overlay, (i * TILE_SIZE, j * TILE_SIZE))
-                    draw_virus_progress_bar(screen, i, j, val, 3)
+        drawn_rects.extend(heatmap.draw(screen, virus))
 
         # 🔢 Liczniki w prawym górnym rogu
-        sus = sum(1 for a in model.agents if a.status == IllnessStates.SUSCEPTIBLE)
-        inf = sum(1 for a in model.agents if a.status == IllnessStates.INFECTED)
-        rec = sum(1 for a in model.agents if a.status == IllnessStates.RECOVERED)
-        ded = sum(1 for a in model.agents if a.status == IllnessStates.DEAD)
+        if live_sim is not None:
+            counts = snapshot.counts
+            total_infections = snapshot.cumulative_infections
+            total_recoveries = snapshot.cumulative_recoveries
+        else:
+            counts = model.status_counts()
+            total_infections = model.counters.cumulative_infections
+            total_recoveries = model.counters.cumulative_recoveries
+        sus = counts[IllnessStates.SUSCEPTIBLE]
+        inf = counts[IllnessStates.INFECTED]
+        rec = counts[IllnessStates.RECOVERED]
+        ded = counts[IllnessStates.DEAD]
 
         text_sus = font.render(f"Susceptible: {sus}", True, (0, 255, 0))
         text_inf = font.render(f"Infected: {inf}", True, (255, 0, 0))
@@ -176,17 +260,8 @@ def main():
         recovered_history.append(rec)
         dead_history.append(ded)
 
-        if not cumulative_infections:
-            cumulative_infections.append(inf)
-        else:
-            delta = max(0, inf - infected_history[-2]) if len(infected_history) > 1 else inf
-            cumulative_infections.append(cumulative_infections[-1] + delta)
-
-        if not cumulative_recoveries:
-            cumulative_recoveries.append(rec)
-        else:
-            delta = max(0, rec - recovered_history[-2]) if len(recovered_history) > 1 else rec
-            cumulative_recoveries.append(cumulative_recoveries[-1] + delta)
+        cumulative_infections.append(total_infections)
+        cumulative_recoveries.append(total_recoveries)
 
         # if len(infected_history) > 200:
         #    infected_history.pop(0)
@@ -225,12 +300,36 @@ def main():
             "Recovered": cumulative_recoveries
         }, chart_x, SCREEN_HEIGHT-190, chart_w, chart_h, font, y_label="Liczba wyzdrowień")
 
-        pygame.display.update()
+        if model is not None and model.profiler is not None:
+            drawn_rects.append(
+                draw_profile_overlay(screen, model.profiler.last, frame_ms, profile_font)
+            )
+        frame_ms = (time.perf_counter() - frame_start) * 1000
+
+        update_rects = dirty_rects + drawn_rects + [sidebar_rect]
+        if len(update_rects) > MAX_DIRTY_RECTS:
+            pygame.display.update()
+        else:
+            pygame.display.update(update_rects)
+        dirty_rects = drawn_rects
         clock.tick(FPS)
+    if live_sim is not None:
+        live_sim.stop()
     pygame.quit()
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulation of virus spread")
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Run the simulation in a separate process (SPACE pauses, +/- change speed, 0 unlimited, 1 resets). "
+        "Without it P toggles the profiling overlay.",
+    )
+    parser.add_argument("--agents", type=int, default=30, help="Number of agents.")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(live=args.live, agents=args.agents)
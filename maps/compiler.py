@@ -0,0 +1,218 @@
+"""
+Compiled maps: a Tiled map parsed once into a directory of NumPy arrays.
+
+Usage:
+    python -m maps.compiler maps/walkway_map.tmx
+    python -m maps.compiler maps/walkway_map.tmx --no-routes
+
+Parsing the XML of a ``.tmx`` and searching the routes to every building takes
+a while; reading the compiled arrays takes milliseconds. An artifact is named
+after the hash of the map and its tilesets, so editing the map in Tiled makes
+``load_map`` compile a new one instead of reading a stale one.
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from typing import Optional
+
+import mesa
+import numpy as np
+
+from maps.map import Map
+
+
+# bump when the layout of an artifact changes, older ones are then compiled again
+COMPILER_VERSION = 1
+CACHE_DIR_NAME = ".mapcache"
+# the buildings CovidModel routes agents to
+ROUTED_LAYERS = ("houses", "fastfood", "library", "shop", "hospital")
+
+_TILESET_SOURCE = re.compile(rb'<tileset[^>]*\ssource="([^"]+)"')
+
+
+def map_hash(tmx_file: str) -> str:
+    """
+    Hash of the contents of a Tiled map, its external tilesets and the compiler version.
+    """
+    digest = hashlib.sha256(str(COMPILER_VERSION).encode())
+    with open(tmx_file, "rb") as f:
+        data = f.read()
+    digest.update(data)
+    directory = os.path.dirname(os.path.abspath(tmx_file))
+    for source in _TILESET_SOURCE.findall(data):
+        path = os.path.join(directory, source.decode())
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def artifact_path(tmx_file: str, cache_dir: Optional[str] = None) -> str:
+    """
+    Where the compiled form of the map in its current state is, or would be, stored.
+    Args:
+        tmx_file (str): Path to the Tiled map.
+        cache_dir (Optional[str]): Directory of compiled maps, ``.mapcache``
+            next to the map by default.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(tmx_file)), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(tmx_file))[0]
+    return os.path.join(cache_dir, f"{stem}-{map_hash(tmx_file)}")
+
+
+def route_fields(map: Map) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Distance and next-hop fields of the routes to every building tile, as
+    DestinationPathFinder computes them on the torus grid CovidModel uses.
+    """
+    from sim.src.generators import DestinationPathFinder
+
+    finder = DestinationPathFinder(mesa.space.MultiGrid(map.width, map.height, True), map)
+    destinations = list(
+        dict.fromkeys(pos for name in ROUTED_LAYERS for pos in map.layer_positions[name])
+    )
+    finder.precompute(destinations)
+    indices = np.array([x * map.height + y for x, y in destinations], dtype=np.int32)
+    size = map.width * map.height
+    distance = np.zeros((len(indices), size), dtype=np.int32)
+    next_hop = np.zeros((len(indices), size), dtype=np.int32)
+    for row, index in enumerate(indices.tolist()):
+        distance[row], next_hop[row] = finder._fields[index]
+    return indices, distance, next_hop
+
+
+def save_compiled(map: Map, path: str, routes: bool = True, source: Optional[str] = None) -> None:
+    """
+    Write the grids and tile lists of a map, and optionally its route fields,
+    as a compiled map. The directory is written under a temporary name and
+    renamed when complete, so readers never see half an artifact.
+    Args:
+        map (Map): The map to compile.
+        path (str): Directory of the compiled map.
+        routes (bool): Also store the route fields, see ``route_fields``.
+        source (Optional[str]): The Tiled file the map was read from, for reference.
+    """
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    layers = list(map.layer_positions)
+    positions = [
+        np.array(map.layer_positions[name], dtype=np.int32).reshape(-1, 2) for name in layers
+    ]
+    np.save(os.path.join(tmp_path, "layer_grid.npy"), np.asarray(map.layer_grid))
+    np.save(os.path.join(tmp_path, "walkable.npy"), np.asarray(map.walkable))
+    np.save(os.path.join(tmp_path, "positions.npy"), np.concatenate(positions))
+    if routes:
+        for name, array in zip(("route_cells", "route_distance", "route_next"), route_fields(map)):
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    meta = {
+        "version": COMPILER_VERSION,
+        "source": source,
+        "width": map.width,
+        "height": map.height,
+        "layers": layers,
+        "layer_sizes": [len(p) for p in positions],
+        "routes": routes,
+        "torus": True,
+    }
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # another process compiled the same map first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            raise
+
+
+def load_compiled(path: str, mmap: bool = True) -> Map:
+    """
+    Read a compiled map as a headless Map, with its route fields if it has them.
+    Args:
+        path (str): Directory of the compiled map.
+        mmap (bool): Map the arrays into memory read-only instead of reading them,
+            so processes reading the same artifact share one copy of them.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta["version"] != COMPILER_VERSION:
+        raise ValueError(f"Compiled map version {meta['version']} is not {COMPILER_VERSION}")
+    mode = "r" if mmap else None
+
+    def array(name: str) -> np.ndarray:
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+
+    positions = np.load(os.path.join(path, "positions.npy")).tolist()
+    layer_positions = {}
+    start = 0
+    for name, size in zip(meta["layers"], meta["layer_sizes"]):
+        layer_positions[name] = [tuple(p) for p in positions[start:start + size]]
+        start += size
+
+    map = Map.from_grids(
+        meta["width"],
+        meta["height"],
+        layer_positions,
+        array("layer_grid"),
+        array("walkable"),
+    )
+    map.compiled_path = path
+    if meta["routes"]:
+        map.route_fields = (array("route_cells"), array("route_distance"), array("route_next"))
+    return map
+
+
+def compile_map(
+    tmx_file: str, cache_dir: Optional[str] = None, routes: bool = True
+) -> str:
+    """
+    Compile a Tiled map unless a compiled map of its current contents exists.
+    Returns:
+        The directory of the compiled map.
+    """
+    path = artifact_path(tmx_file, cache_dir)
+    if os.path.exists(os.path.join(path, "meta.json")):
+        with open(os.path.join(path, "meta.json")) as f:
+            if json.load(f)["routes"] or not routes:
+                return path
+        shutil.rmtree(path, ignore_errors=True)
+    save_compiled(Map(tmx_file, headless=True), path, routes, source=tmx_file)
+    return path
+
+
+def load_map(
+    tmx_file: str, cache_dir: Optional[str] = None, routes: bool = True, mmap: bool = True
+) -> Map:
+    """
+    A headless Map of a Tiled map, read from its compiled form, which is
+    compiled first when the map is new or changed. Drop-in replacement for
+    ``Map(tmx_file, headless=True)``.
+    """
+    return load_compiled(compile_map(tmx_file, cache_dir, routes), mmap)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m maps.compiler", description="Compile Tiled maps for fast loading."
+    )
+    parser.add_argument("maps", nargs="+", help="Tiled .tmx files")
+    parser.add_argument("--cache-dir", default=None, help="Where to store compiled maps")
+    parser.add_argument("--no-routes", action="store_true", help="Do not precompute routes")
+    args = parser.parse_args(argv)
+    for tmx_file in args.maps:
+        print(compile_map(tmx_file, args.cache_dir, not args.no_routes))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
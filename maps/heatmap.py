@@ -0,0 +1,97 @@
+import numpy as np
+import pygame
+
+from maps.map import TILE_SIZE
+
+
+class VirusHeatmap:
+    """
+    Renders the virus layer as a translucent red overlay with a progress bar
+    on top of every contaminated tile.
+    The whole layer is written into one surface with a pixel per tile,
+    scaled up to the map in one go, and all progress bars are drawn
+    into a second surface in the same vectorized way.
+    """
+
+    def __init__(self, width, height, tile_size=TILE_SIZE, bar_thickness=3):
+        """
+        Args:
+            width: Width of the virus layer in tiles.
+            height: Height of the virus layer in tiles.
+            tile_size: Size of a tile on screen in pixels.
+            bar_thickness: Height of the progress bars in pixels.
+        """
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.bar_thickness = min(bar_thickness, tile_size)
+        size = (width * tile_size, height * tile_size)
+
+        self.overlay = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.overlay.fill((255, 0, 0, 0))
+        self.scaled_overlay = pygame.Surface(size, pygame.SRCALPHA)
+
+        # only the top rows of every tile row ever hold a bar
+        self.bars = pygame.Surface((size[0], height * self.bar_thickness), pygame.SRCALPHA)
+        self._tile_offsets = np.arange(tile_size)
+
+    def draw(self, surface, data) -> list[pygame.Rect]:
+        """
+        Draw the virus levels onto the surface.
+        Args:
+            surface: The surface to draw on, usually the display.
+            data: Virus levels indexed by ``[x, y]``, as in PropertyLayer.data.
+        Returns:
+            The rects of the contaminated tiles.
+        """
+        contaminated = data > 0.0
+        if not contaminated.any():
+            return []
+
+        # overlay: red with alpha of half the (capped) virus level
+        intensity = np.minimum(255, data.astype(np.int64))
+        alpha = pygame.surfarray.pixels_alpha(self.overlay)
+        alpha[...] = np.where(contaminated, intensity // 2, 0)
+        del alpha
+        pygame.transform.scale(
+            self.overlay, self.scaled_overlay.get_size(), self.scaled_overlay
+        )
+        surface.blit(self.scaled_overlay, (0, 0))
+
+        self._draw_bars(data, contaminated)
+        ts, thickness = self.tile_size, self.bar_thickness
+        for j in range(self.height):
+            surface.blit(
+                self.bars,
+                (0, j * ts),
+                pygame.Rect(0, j * thickness, self.width * ts, thickness),
+            )
+
+        xs, ys = np.nonzero(contaminated)
+        return [
+            pygame.Rect(x * ts, y * ts, ts, ts)
+            for x, y in zip(xs.tolist(), ys.tolist())
+        ]
+
+    def _draw_bars(self, data, contaminated) -> None:
+        ts, thickness = self.tile_size, self.bar_thickness
+        # red part of every bar, in pixels, as pygame.Rect would truncate it
+        red_width = np.minimum(ts, data / 255 * ts).astype(np.int64)
+        # (width, tile_size, height) -> one value per pixel column and tile row
+        red = (self._tile_offsets[None, :, None] < red_width[:, None, :]).reshape(
+            self.width * ts, self.height
+        )
+        shown = np.repeat(contaminated, ts, axis=0)
+
+        # every tile row's bar is ``thickness`` identical pixel rows
+        red = np.repeat(red, thickness, axis=1)
+        shown = np.repeat(shown, thickness, axis=1)
+
+        pixels = pygame.surfarray.pixels3d(self.bars)
+        pixels[..., 0] = np.where(red, 255, 0)
+        pixels[..., 1] = 0
+        pixels[..., 2] = 0
+        del pixels
+        alpha = pygame.surfarray.pixels_alpha(self.bars)
+        alpha[...] = np.where(shown, 255, 0)
+        del alpha
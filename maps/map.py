@@ -1,9 +1,14 @@
+from typing import Optional
+
+import numpy as np
 import pygame
-from pytmx import TiledTileLayer
+from pytmx import TiledMap, TiledTileLayer
 from pytmx.util_pygame import load_pygame
 
 TILE_SIZE = 32
 
+WALKABLE_LAYERS = ["road", "fastfood", "shop", "library", "hospital", "houses"]
+
 
 class Tile(pygame.sprite.Sprite):
     def __init__(self, x, y, image):
@@ -13,10 +18,84 @@ class Tile(pygame.sprite.Sprite):
 
 
 class Map:
-    def __init__(self, tmx_file):
-        self.display_surface = pygame.display.get_surface()
-        self.tmx_data = load_pygame(tmx_file)
+    def __init__(self, tmx_file, headless: bool = False):
+        """
+        Args:
+            tmx_file: Path to the Tiled map.
+            headless (bool): Only parse the layer data, without a display or
+                tile images. Such a map can be simulated on but not drawn.
+        """
+        self.headless = headless
+        if headless:
+            self.display_surface = None
+            self.tmx_data = TiledMap(tmx_file)
+        else:
+            self.display_surface = pygame.display.get_surface()
+            self.tmx_data = load_pygame(tmx_file)
+        self.width: int = self.tmx_data.width
+        self.height: int = self.tmx_data.height
+
+        self._init_layers()
+        self.load_layers()
+        self.build_grids()
+        if not headless:
+            self.bake_background()
+
+    @classmethod
+    def from_layers(
+        cls,
+        width: int,
+        height: int,
+        layer_positions: dict[str, list[tuple[int, int]]],
+    ) -> "Map":
+        """
+        Build a headless map from the tiles of every layer instead of a Tiled
+        file, e.g. a synthetic map for benchmarks.
+        Args:
+            width (int): Width of the map in tiles.
+            height (int): Height of the map in tiles.
+            layer_positions (dict[str, list[tuple[int, int]]]): The (x, y) tiles
+                of every layer, layers not listed stay empty.
+        """
+        self = cls._headless(width, height, layer_positions)
+        self.build_grids()
+        return self
+
+    @classmethod
+    def from_grids(
+        cls,
+        width: int,
+        height: int,
+        layer_positions: dict[str, list[tuple[int, int]]],
+        layer_grid: np.ndarray,
+        walkable: np.ndarray,
+    ) -> "Map":
+        """
+        Build a headless map from already rasterized grids, e.g. read from a
+        compiled map, see maps.compiler. The grids are used as they are, so
+        they may be read-only memory maps.
+        """
+        self = cls._headless(width, height, layer_positions)
+        self.layer_grid = layer_grid
+        self.walkable = walkable
+        return self
+
+    @classmethod
+    def _headless(
+        cls, width: int, height: int, layer_positions: dict[str, list[tuple[int, int]]]
+    ) -> "Map":
+        self = cls.__new__(cls)
+        self.headless = True
+        self.display_surface = None
+        self.tmx_data = None
+        self.width = width
+        self.height = height
+        self._init_layers()
+        for layer_name, positions in layer_positions.items():
+            self.layer_positions[layer_name] = list(positions)
+        return self
 
+    def _init_layers(self):
         self.tile_layers = {
             "grass": pygame.sprite.Group(),
             "road": pygame.sprite.Group(),
@@ -26,46 +105,134 @@ class Map:
             "fastfood": pygame.sprite.Group(),
             "hospital": pygame.sprite.Group(),
         }
+        # bit i of layer_grid[x, y] is set when tile_layers' i-th layer covers (x, y)
+        self.layer_bits: dict[str, int] = {
+            name: 1 << i for i, name in enumerate(self.tile_layers)
+        }
+        self.layer_grid = np.zeros((self.width, self.height), dtype=np.uint8)
+        self.walkable = np.zeros((self.width, self.height), dtype=bool)
+        self.layer_positions: dict[str, list[tuple[int, int]]] = {
+            name: [] for name in self.tile_layers
+        }
 
-        self.load_layers()
+        self.background: Optional[pygame.Surface] = None
+        # set for maps read from a compiled map, see maps.compiler
+        self.compiled_path: Optional[str] = None
+        # (destinations, distance fields, next-hop fields) precomputed for
+        # DestinationPathFinder, flat cell indices, one row per destination
+        self.route_fields: Optional[tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def __getstate__(self):
+        # Only the grids travel between processes, the unpickled map is headless.
+        state = self.__dict__.copy()
+        state["headless"] = True
+        state["display_surface"] = None
+        state["tmx_data"] = None
+        state["background"] = None
+        state["tile_layers"] = list(self.tile_layers)
+        # the path finder copies what it needs, workers can map compiled_path themselves
+        state["route_fields"] = None
+        return state
+
+    def __setstate__(self, state):
+        state["tile_layers"] = {
+            name: pygame.sprite.Group() for name in state["tile_layers"]
+        }
+        self.__dict__.update(state)
 
     def load_layers(self):
         for layer in self.tmx_data.visible_layers:
             if isinstance(layer, TiledTileLayer):
-                for x, y, image in layer.tiles():
-                    tile = Tile(x, y, image)
-                    if layer.name in self.tile_layers:
-                        self.tile_layers[layer.name].add(tile)
+                if layer.name not in self.tile_layers:
+                    continue
+                for x, y, gid in layer.iter_data():
+                    if not gid:
+                        continue
+                    self.layer_positions[layer.name].append((x, y))
+                    if not self.headless:
+                        image = self.tmx_data.get_tile_image_by_gid(gid)
+                        self.tile_layers[layer.name].add(Tile(x, y, image))
 
-    def draw_map(self):
+    def build_grids(self):
+        """
+        Rasterize the loaded layers into dense lookup grids indexed by ``[x, y]``.
+        """
+        self.layer_grid.fill(0)
+        for layer_name, positions in self.layer_positions.items():
+            if not positions:
+                continue
+            xs, ys = np.array(positions, dtype=np.intp).T
+            self.layer_grid[xs, ys] |= self.layer_bits[layer_name]
+
+        walkable_bits = 0
+        for layer_name in WALKABLE_LAYERS:
+            walkable_bits |= self.layer_bits[layer_name]
+        np.not_equal(self.layer_grid & walkable_bits, 0, out=self.walkable)
+
+    def layer_mask(self, layer_name) -> np.ndarray:
+        """
+        Boolean grid of the cells covered by the given layer.
+        """
+        return (self.layer_grid & self.layer_bits[layer_name]) != 0
+
+    def bake_background(self):
+        """
+        Composite all tile layers once into a single surface.
+        The map never changes, so drawing it afterwards is one blit.
+        """
+        self.background = pygame.Surface(
+            (self.width * TILE_SIZE, self.height * TILE_SIZE)
+        )
+        if self.display_surface is not None:
+            self.background = self.background.convert()
+        self.background.fill((0, 0, 0))
         for group in self.tile_layers.values():
             for tile in group:
-                self.display_surface.blit(tile.image, tile.rect.topleft)
+                self.background.blit(tile.image, tile.rect.topleft)
 
-    def is_allowed(self, pos):
-        x, y = pos
-        walkable_layers = ["road", "fastfood", "shop", "library", "hospital", "houses"]
-        px, py = x * TILE_SIZE, y * TILE_SIZE
+    def draw_map(self):
+        self.display_surface.blit(self.background, (0, 0))
 
-        for layer_name in walkable_layers:
-            for tile in self.tile_layers[layer_name]:
-                if tile.rect.collidepoint(px, py):
-                    return True
-        return False
+    def restore(self, rects):
+        """
+        Redraw the map under the given areas of the display, e.g. where agents were drawn.
+        """
+        for rect in rects:
+            self.display_surface.blit(self.background, rect, rect)
 
-    def get_current_layers(self, x, y):
-        current_layers = []
-        px, py = x * TILE_SIZE, y * TILE_SIZE
+    def in_bounds(self, pos) -> bool:
+        x, y = pos
+        return 0 <= x < self.width and 0 <= y < self.height
 
-        for layer_name, group in self.tile_layers.items():
-            for tile in group:
-                if tile.rect.collidepoint(px, py):
-                    current_layers.append(layer_name)
+    def is_allowed(self, pos):
+        if not self.in_bounds(pos):
+            return False
+        return bool(self.walkable[pos[0], pos[1]])
+
+    def allowed_mask(self, positions) -> np.ndarray:
+        """
+        Vectorized form of ``is_allowed``.
+        Args:
+            positions: Sequence or (n, 2) array of (x, y) cells.
+        Returns:
+            Boolean array of length n, False for cells outside the map.
+        """
+        positions = np.asarray(positions, dtype=np.intp).reshape(-1, 2)
+        xs, ys = positions[:, 0], positions[:, 1]
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        mask = np.zeros(len(positions), dtype=bool)
+        mask[inside] = self.walkable[xs[inside], ys[inside]]
+        return mask
 
-        return current_layers
+    def get_current_layers(self, x, y):
+        if not self.in_bounds((x, y)):
+            return []
+        bits = self.layer_grid[x, y]
+        return [
+            layer_name
+            for layer_name, bit in self.layer_bits.items()
+            if bits & bit
+        ]
 
     def get_layer_positions_normalized(self, layer_name):
-        positions = []
-        for tile in self.tile_layers[layer_name]:
-            positions.append((tile.rect.x // TILE_SIZE, tile.rect.y // TILE_SIZE))
-        return positions
+        return list(self.layer_positions[layer_name])
@@ -1,11 +1,20 @@
-from src.model import CovidModel
+from maps.compiler import load_map
+from sim.src.model import CovidModel
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import numpy as np
 
 
 def main():
-    model = CovidModel(N=100, width=500, height=500)
+    mapa = load_map("maps/walkway_map.tmx")
+    model = CovidModel(
+        N=100,
+        width=mapa.width,
+        height=mapa.height,
+        map=mapa,
+        record_every=1,
+        record_capacity=100,
+    )
 
     # Create figure and axis for animation
     fig, ax = plt.subplots(figsize=(8, 8))
@@ -22,19 +31,9 @@ def main():
         model.step()
 
         # Get the data for the current frame
-        try:
-            positions = model.datacollector.get_agent_vars_dataframe().xs(
-                frame, level="Step"
-            )
-
-            # Extract x and y coordinates from positions
-            x = [pos[0] for pos in positions["pos"]]
-            y = [pos[1] for pos in positions["pos"]]
-
-            scatter.set_offsets(np.column_stack([x, y]))
-        except KeyError:
-            # If no data is available for this frame, keep the previous positions
-            pass
+        positions = model.recorder.latest_frame()
+        if positions is not None:
+            scatter.set_offsets(np.column_stack([positions["x"], positions["y"]]))
 
         return (scatter,)
 
@@ -0,0 +1,208 @@
+"""
+Headless simulation runner.
+
+Usage:
+    python -m sim.run --steps 1000 --agents 30 --map maps/walkway_map.tmx --seed 1
+    python -m sim.run --steps 1000 --agents 30 --replicates 64 --workers 32
+    python -m sim.run --steps 1000000 --agents 30 --results results/ --trajectories-every 100
+    python -m sim.run --steps 100 --agents 30 --save-checkpoint warm.ckpt
+    python -m sim.run --steps 1000 --resume warm.ckpt
+    python -m sim.run --steps 1000 --profile trace.json
+    python -m sim.run --steps 1000 --param mask_factor=0.2 --param immunity_time=300
+"""
+
+import argparse
+import time
+
+from maps.compiler import load_map
+from sim.src.checkpoint import load_checkpoint, save_checkpoint
+from sim.src.ensemble import run_ensemble
+from sim.src.model import CovidModel
+from sim.src.params import EpidemicParams
+from sim.src.runner import run_model, write_series
+from sim.src.sinks import existing_results, open_sink
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run the virus spread simulation without a display."
+    )
+    parser.add_argument("--steps", type=int, default=1000, help="Number of steps")
+    parser.add_argument("--agents", type=int, default=30, help="Number of agents")
+    parser.add_argument(
+        "--map", default="maps/walkway_map.tmx", help="Path to the Tiled map"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    parser.add_argument(
+        "--out", default="series.csv", help="Where to write the per-step SIR/D series"
+    )
+    parser.add_argument(
+        "--replicates",
+        type=int,
+        default=1,
+        help="Number of independently seeded replicates, summarised in --out",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Worker processes for replicates"
+    )
+    parser.add_argument(
+        "--results",
+        default=None,
+        help="Directory to stream series, events and trajectories to during the run",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("parquet", "csv"),
+        default="parquet",
+        help="Format of --results, CSV when pyarrow is not installed",
+    )
+    parser.add_argument(
+        "--trajectories-every",
+        type=int,
+        default=None,
+        help="Stream agent positions to --results every n-th step",
+    )
+    parser.add_argument(
+        "--scheduling",
+        choices=("step", "event"),
+        default="step",
+        help="Step every agent every step, or only the agents that have something to do",
+    )
+    parser.add_argument(
+        "--transmission",
+        choices=("virus", "contact", "both"),
+        default="virus",
+        help="Infect through virus on the ground, by direct contact between agents, or both",
+    )
+    parser.add_argument(
+        "--destinations",
+        choices=("random", "nearest"),
+        default="random",
+        help="Send agents to a random building of the chosen type, or to the nearest one",
+    )
+    parser.add_argument(
+        "--mobility",
+        choices=("random", "schedule"),
+        default="random",
+        help="Let agents decide every step whether to go out, or follow daily activity plans",
+    )
+    parser.add_argument(
+        "--resume",
+        default=None,
+        help="Continue from a checkpoint instead of a new model, --agents, --map and --seed are ignored",
+    )
+    parser.add_argument(
+        "--save-checkpoint",
+        default=None,
+        help="Write a checkpoint of the model after the last step",
+    )
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help=f"Override an epidemic parameter, one of: {', '.join(EpidemicParams.FIELDS)}",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        metavar="TRACE",
+        help="Time the phases of every step, print the last steps and write a Chrome trace to TRACE",
+    )
+    args = parser.parse_args(argv)
+    if args.replicates > 1 and (args.resume or args.save_checkpoint):
+        parser.error("checkpoints are only supported for a single replicate")
+    if args.replicates > 1 and args.profile:
+        parser.error("profiling is only supported for a single replicate")
+    if args.replicates > 1 and (
+        args.results is not None
+        or args.trajectories_every is not None
+        or args.format != parser.get_default("format")
+    ):
+        parser.error("streaming --results is only supported for a single replicate")
+    if args.results is not None and existing_results(args.results):
+        parser.error(f"{args.results} already holds results, choose an empty directory")
+    if args.resume and args.param:
+        parser.error("a resumed model keeps the parameters it was created with")
+    try:
+        args.params = EpidemicParams.from_dict(dict(parse_assignment(a) for a in args.param))
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def parse_assignment(text: str) -> tuple[str, str]:
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise ValueError(f"Expected NAME=VALUE, got {text!r}")
+    return name.strip(), value.strip()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    start = time.perf_counter()
+    if args.replicates > 1:
+        mapa = load_map(args.map)
+        result = run_ensemble(
+            mapa,
+            args.agents,
+            args.steps,
+            args.replicates,
+            base_seed=args.seed,
+            max_workers=args.workers,
+            params=args.params,
+            transmission=args.transmission,
+            destinations=args.destinations,
+            mobility=args.mobility,
+            scheduling=args.scheduling,
+        )
+        result.write_summary(args.out)
+    else:
+        if args.resume is not None:
+            model = load_checkpoint(args.resume)
+        else:
+            mapa = load_map(args.map)
+            model = CovidModel(
+                N=args.agents,
+                width=mapa.width,
+                height=mapa.height,
+                map=mapa,
+                seed=args.seed,
+                scheduling=args.scheduling,
+                params=args.params,
+                transmission=args.transmission,
+                destinations=args.destinations,
+                mobility=args.mobility,
+            )
+        if args.profile is not None:
+            profiler = model.enable_profiling(keep_steps=None)
+        if args.results is not None:
+            with open_sink(
+                args.results,
+                args.format,
+                trajectories_every=args.trajectories_every,
+            ) as sink:
+                series = run_model(model, args.steps, sink)
+            model.attach_sink(None)
+        else:
+            series = run_model(model, args.steps)
+        write_series(series, args.out)
+        if args.save_checkpoint is not None:
+            save_checkpoint(model, args.save_checkpoint)
+        if args.profile is not None:
+            model.disable_profiling()
+            print(profiler.format_table())
+            profiler.write_chrome_trace(args.profile)
+            print(f"trace of {len(profiler.steps)} steps written to {args.profile}")
+    elapsed = time.perf_counter() - start
+
+    total_steps = args.steps * args.replicates
+    print(
+        f"{total_steps} steps in {elapsed:.2f}s "
+        f"({total_steps / max(elapsed, 1e-9):.0f} steps/s), series written to {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,12 @@
 from __future__ import annotations
-import random
-from typing import Optional
+import time
+from typing import TYPE_CHECKING, Optional
 import mesa
 
 from pygame import Surface
 import pygame
 
-from sim.src.generators import DestinationPathFinder, SpawnPointGenerator
+from sim.src.generators import RouteTable, SpawnPointGenerator
 from sim.src.params import (
     ActivityLikelihoods,
     AgeGroups,
@@ -16,6 +16,9 @@ from sim.src.params import (
     SocialDistancingStates,
 )
 
+if TYPE_CHECKING:
+    from sim.src.profiler import Profiler
+
 
 class HumanAgent(mesa.Agent):
     """
@@ -60,34 +63,41 @@ class HumanAgent(mesa.Agent):
         self.hospital_time: int = 0
         self.recovered_time: int = 0
         self.likelihood_of_infection: float = 0.0
-        self.likelihood_of_recovery: float = 0.2
+        self.likelihood_of_recovery: float = self.model.params.recovery_rate
         # self.likelihood_of_death: float = 0.05
 
         # unsettable params
         self.age_group: AgeGroups = HumanAgent.determine_age_group(age)
-        self.likelihood_of_death = 0.05 * (self.age / 100)
+        self.likelihood_of_death = self.model.params.death_rate * (self.age / 100)
         self.move_likelihood_table: list[HumanAgentActions] = (
             HumanAgent.determine_likelihood_of_mooving(
                 active,
             )
         )
+        self.go_out_probability: float = self.move_likelihood_table.count(
+            HumanAgentActions.GO_OUT
+        ) / len(self.move_likelihood_table)
 
         # simulation helpers
         self.home: tuple[int, int] = home
         self.destination: Optional[tuple[int, int]] = None
         self.is_moving: bool = False
+        # id of the route in model.routes and the index of the next cell along it
+        self.route: int = -1
+        self.route_cursor: int = 0
 
         # pathfinding
         self.grid: mesa.space.MultiGrid = self.model.grid
-        self.path_finder = DestinationPathFinder(self.grid, self.model.map)
+        self.routes: RouteTable = self.model.routes
 
         # rendering
         self.radius = 0.3 + (self.age / 100) * 0.7
         #self.radius = random.randrange(5, 10, 1) / 10
+        rng = self.model.streams.demographics
         self.color = (
-            random.randint(0, 128),
-            random.randint(0, 128),
-            random.randint(0, 128),
+            rng.randint(0, 128),
+            rng.randint(0, 128),
+            rng.randint(0, 128),
         )
 
     def respawn(self) -> None:
@@ -96,11 +106,17 @@ class HumanAgent(mesa.Agent):
         """
         self.grid.place_agent(self, self.home)
 
-    def determine_action(self) -> HumanAgentActions:
+    def determine_action(self, draw: Optional[float] = None) -> HumanAgentActions:
         """
         Determine the action that the agent will take.
+        Args:
+            draw (Optional[float]): A uniform from [0, 1) to decide with,
+                drawn from the model's mobility stream when not given.
         """
-        return random.choice(self.move_likelihood_table)
+        if draw is None:
+            draw = self.model.streams.mobility.random()
+        table = self.move_likelihood_table
+        return table[int(draw * len(table))]
 
     def is_home(self) -> bool:
         """
@@ -108,11 +124,28 @@ class HumanAgent(mesa.Agent):
         """
         return self.pos == self.home
 
+    def set_status(self, status: IllnessStates) -> None:
+        """
+        Change the illness state of the agent and let the model know.
+        """
+        old = self.status
+        self.status = status
+        self.model.on_status_change(self, old, status)
+
     def _set_destination(self, dest) -> None:
         self.destination = dest
-        self.path = self.path_finder.find(self.pos, dest)
+        height = self.grid.height
+        self.route = self.routes.route(
+            self.pos[0] * height + self.pos[1], dest[0] * height + dest[1]
+        )
+        self.route_cursor = 0
 
-    def step(self, action: HumanAgentActions) -> None:
+    def step(
+        self,
+        action: HumanAgentActions,
+        infection_draw: Optional[float] = None,
+        planned: Optional[BuldingType] = None,
+    ) -> None:
         """
         Perform the action that the agent will take.
         The agent can either move to a new destination or stay in place.
@@ -120,57 +153,82 @@ class HumanAgent(mesa.Agent):
         If the agent reaches its destination, it will stop moving.
 
         This is the main function where all the logic of the agent is executed.
+        Args:
+            action (HumanAgentActions): The action chosen for this step.
+            infection_draw (Optional[float]): A uniform from [0, 1) for the infection check,
+                drawn from the model's infection stream when not given.
+            planned (Optional[BuldingType]): Where a GO_OUT leads when the trip
+                comes from a DailySchedule.
         """
         if self.status == IllnessStates.DEAD:
             return
 
+        profiler = self.model.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+
         # actions realted to movement, order matters
         if self.is_moving:
             # if the agent is already moving, continue moving
             # until destination is reached
-            new_x, new_y = self.path.pop(0)
+            section = "agent.move"
+            old_pos = self.pos
+            new_x, new_y = self.routes.position(self.route, self.route_cursor)
+            self.route_cursor += 1
             self.grid.move_agent(
                 self,
                 (new_x, new_y),
             )
+            self.model.on_agent_moved(self, old_pos)
             if self.pos == self.destination:
                 self._on_destination_reached()
         elif action == HumanAgentActions.STAY_IN_PLACE:
             # if the agent chose to stay in place, dont do anything
+            section = "agent.stay"
             self._on_stay_in_place()
         elif action == HumanAgentActions.GO_OUT:
             # if the agent chose to move set the destination
-            self._on_go_out()
+            section = "agent.go_out"
+            self._on_go_out(planned)
         else:
             raise ValueError(f"Unknown action: {action}")
+        if profiler is not None:
+            start = self._lap(profiler, section, start)
 
         # If agent is healthy, check for infection
-        if self.status == IllnessStates.SUSCEPTIBLE:
+        if self.status == IllnessStates.SUSCEPTIBLE and self.model.virus_transmission:
             virus_layer = self.grid.properties["Virus"]
             virus_level = virus_layer.data[self.pos]
-            infection_chance = virus_level / 1000  # skalowanie na szanse
+            params = self.model.params
+            infection_chance = virus_level / params.infection_scale  # skalowanie na szanse
             if self.face_cover:
-                infection_chance *= 0.05  # maseczka daje wam 5% szansy
-            if random.random() < infection_chance:
-                self.status = IllnessStates.INFECTED
+                infection_chance *= params.mask_factor  # maseczka daje wam 5% szansy
+            if infection_draw is None:
+                infection_draw = self.model.streams.infection.random()
+            if infection_draw < infection_chance:
+                self.set_status(IllnessStates.INFECTED)
+        if profiler is not None:
+            start = self._lap(profiler, "agent.infection", start)
 
         if self.status == IllnessStates.INFECTED:
             # update infection params
             self.infection_time += 1
 
             # interactions
-            if self.model.building_at_pos(self.pos) == BuldingType.HOSPITAL:
+            rng = self.model.streams.infection
+            params = self.model.params
+            if self.model.in_treatment(self):
                 self.hospital_time += 1
-                if self.hospital_time >= 300:  # musi siedzieć 100 kroków
-                    if random.random() < self.likelihood_of_death:
+                if self.hospital_time >= params.hospital_time:  # musi siedzieć 100 kroków
+                    death_chance, recovery_chance = self.model.outcome_chances(self)
+                    if rng.random() < death_chance:
                         print(f"Bąbelek {self.unique_id} kipnął na kroku {self.model.steps_elapsed}")
-                        self.status = IllnessStates.DEAD
+                        self.set_status(IllnessStates.DEAD)
                         self.is_moving = False
                         self.destination = None
-                        return
-                    elif random.random() < self.likelihood_of_recovery:
-                        self.status = IllnessStates.RECOVERED
-                        if not self.face_cover and random.random() < 0.4:
+                    elif rng.random() < recovery_chance:
+                        self.set_status(IllnessStates.RECOVERED)
+                        if not self.face_cover and rng.random() < params.mask_after_recovery:
                             self.face_cover = True
                         self.recovered_time = 0
             else:
@@ -178,33 +236,80 @@ class HumanAgent(mesa.Agent):
         # Obsługa czasu trwania ozdrowienia
         if self.status == IllnessStates.RECOVERED:
             self.recovered_time += 1
-            if self.recovered_time >= 500:
-                self.status = IllnessStates.SUSCEPTIBLE
+            if self.recovered_time >= self.model.params.immunity_time:
+                self.set_status(IllnessStates.SUSCEPTIBLE)
                 self.recovered_time = 0
 
-        if self.status == IllnessStates.DEAD:
-            return
+        if profiler is not None:
+            self._lap(profiler, "agent.illness", start)
+
+    @staticmethod
+    def _lap(profiler: Profiler, section: str, start: float) -> float:
+        # adds the time since start to a section of the step, returns the new start
+        now = time.perf_counter()
+        profiler.add_time(section, now - start)
+        return now
+
+    def catch_up(self, steps: int) -> None:
+        """
+        Apply ``steps`` steps the agent spent idle without being stepped, as
+        the event scheduler does. Only the illness timers advance while idle.
+        """
+        if self.status == IllnessStates.INFECTED:
+            self.infection_time += steps
+            if self.model.in_treatment(self):
+                self.hospital_time += steps
+            else:
+                self.hospital_time = 0
+        elif self.status == IllnessStates.RECOVERED:
+            self.recovered_time += steps
+
+    def steps_to_next_timer(self) -> Optional[int]:
+        """
+        Steps until the next step in which an illness timer of an idle agent
+        expires (the end of the hospital stay or of immunity), None if no timer runs.
+        """
+        if self.status == IllnessStates.INFECTED:
+            if self.model.in_treatment(self):
+                return max(1, self.model.params.hospital_time - self.hospital_time)
+        elif self.status == IllnessStates.RECOVERED:
+            return max(1, self.model.params.immunity_time - self.recovered_time)
+        return None
 
     def _on_stay_in_place(self):
         self.is_moving = False
         self.destination = None
 
-    def _on_go_out(self):
-        self._set_destination(self.model.destgen.next(self))
-        self.is_moving = True
+    def _on_go_out(self, planned: Optional[BuldingType] = None):
+        hospitals = self.model.hospitals
+        if hospitals is not None and hospitals.holds(self.unique_id - 1):
+            # patients keep their bed or their place in the queue
+            self._on_stay_in_place()
+            return
+        self._set_destination(self.model.destgen.next(self, planned))
+        # an unreachable destination has an empty route
+        self.is_moving = bool(self.routes.lengths[self.route] > 0)
+        if hospitals is not None and not self.is_moving and self.status == IllnessStates.INFECTED:
+            # already in the hospital it was sent to
+            self.model.on_hospital_arrival(self)
 
     def _on_destination_reached(self):
         self.is_moving = False
         self.destination = None
+        if self.model.hospitals is not None and self.status == IllnessStates.INFECTED:
+            self.model.on_hospital_arrival(self)
 
-    def render(self, surface: Surface, scale_x, scale_y, scale_r) -> None:
+    def render(self, surface: Surface, scale_x, scale_y, scale_r) -> pygame.Rect:
+        """
+        Draw the agent and return the area of the surface it covered.
+        """
         x, y = self.pos
         cx = x * scale_x + scale_x // 2
         cy = y * scale_y + scale_y // 2
         radius = int(self.radius * scale_r)
 
         # Rysuj kółko agenta
-        pygame.draw.circle(surface, self.color, (cx, cy), radius)
+        bounds = pygame.draw.circle(surface, self.color, (cx, cy), radius)
 
         # Rysuj czerwone X dla zarażonych
         if self.face_cover:
@@ -221,7 +326,8 @@ class HumanAgent(mesa.Agent):
             pygame.draw.circle(surface, (100, 100, 100), (cx, cy), radius)
             pygame.draw.line(surface, (0, 0, 0), (cx - radius, cy), (cx + radius, cy), 2)
 
-        pass
+        # the 2px wide lines can stick out of the circle by a pixel
+        return bounds.inflate(4, 4)
 
     @classmethod
     def determine_likelihood_of_mooving(
@@ -296,13 +402,14 @@ class HumanAgentGenerator:
         self.pos_generator = spawn_point_generator
 
     def next(self) -> HumanAgent:
-        # status = random.choice(list(IllnessStates))
+        rng = self.model.streams.demographics
+        # status = rng.choice(list(IllnessStates))
         status = IllnessStates.SUSCEPTIBLE
-        face_cover = random.random() < 0.2  # szansa na maseczkę
-        social_distance = random.choice(list(SocialDistancingStates))
-        vaccinated = random.choice([True, False])
-        age = random.randint(10, 100)
-        active = random.choice(list(ActivityLikelihoods))
+        face_cover = rng.random() < self.model.params.face_cover_rate  # szansa na maseczkę
+        social_distance = rng.choice(list(SocialDistancingStates))
+        vaccinated = rng.choice([True, False])
+        age = rng.randint(10, 100)
+        active = rng.choice(list(ActivityLikelihoods))
         home = self.pos_generator.next()
 
         return HumanAgent(
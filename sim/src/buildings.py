@@ -0,0 +1,98 @@
+from __future__ import annotations
+from typing import Optional
+
+import numpy as np
+
+from sim.src.params import BuldingType
+
+
+BUILDING_TYPES: list[BuldingType] = list(BuldingType)
+NO_BUILDING = -1
+
+
+class Building:
+    """
+    One building on the map: a connected group of tiles of the same type.
+    """
+
+    def __init__(self, id: int, type_: BuldingType, tiles: list[tuple[int, int]]):
+        """
+        Args:
+            id (int): Index of the building in ``BuildingIndex.instances``.
+            type_ (BuldingType): The type of the building.
+            tiles (list[tuple[int, int]]): The tiles the building covers.
+        """
+        self.id = id
+        self.type = type_
+        self.tiles = tiles
+
+    def __repr__(self) -> str:
+        return f"Building({self.id}, {self.type.name}, {len(self.tiles)} tiles)"
+
+
+class BuildingIndex:
+    """
+    Constant time lookups between tiles and buildings.
+    Keeps a dense grid of building type codes (positions in ``BUILDING_TYPES``,
+    ``NO_BUILDING`` elsewhere), the tiles of every type as arrays and the
+    building instance each tile belongs to.
+    """
+
+    def __init__(
+        self,
+        buildings: dict[BuldingType, list[tuple[int, int]]],
+        width: int,
+        height: int,
+    ):
+        """
+        Args:
+            buildings (dict[BuldingType, list[tuple[int, int]]]): Building tiles by type.
+                When a tile is listed under several types, the first one wins.
+            width (int): Width of the grid.
+            height (int): Height of the grid.
+        """
+        self.tiles: dict[BuldingType, np.ndarray] = {
+            type_: np.array(positions, dtype=np.intp).reshape(-1, 2)
+            for type_, positions in buildings.items()
+        }
+        self.grid = np.full((width, height), NO_BUILDING, dtype=np.int8)
+        for type_, tiles in reversed(self.tiles.items()):
+            self.grid[tiles[:, 0], tiles[:, 1]] = BUILDING_TYPES.index(type_)
+
+        self.instances: list[Building] = []
+        self.instance_at: dict[tuple[int, int], Building] = {}
+        for type_, positions in buildings.items():
+            self._group(type_, positions)
+
+    def _group(self, type_: BuldingType, positions: list[tuple[int, int]]) -> None:
+        remaining = set(positions) - self.instance_at.keys()
+        for start in positions:
+            if start not in remaining:
+                continue
+            remaining.discard(start)
+            tiles = [start]
+            for x, y in tiles:
+                for neighbor in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                    if neighbor in remaining:
+                        remaining.discard(neighbor)
+                        tiles.append(neighbor)
+            building = Building(len(self.instances), type_, tiles)
+            self.instances.append(building)
+            for tile in tiles:
+                self.instance_at[tile] = building
+
+    def code(self, type_: BuldingType) -> int:
+        return BUILDING_TYPES.index(type_)
+
+    def type_at(self, pos: tuple[int, int]) -> Optional[BuldingType]:
+        code = self.grid[pos[0], pos[1]]
+        return None if code == NO_BUILDING else BUILDING_TYPES[code]
+
+    def building_at(self, pos: tuple[int, int]) -> Optional[Building]:
+        return self.instance_at.get(pos)
+
+    def mask(self, type_: BuldingType) -> np.ndarray:
+        """
+        Boolean grid of the tiles of the given type.
+        """
+        return self.grid == self.code(type_)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+import os
+import pickle
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sim.src.model import CovidModel
+
+
+FORMAT_VERSION = 1
+MAGIC = b"COVIDCKPT"
+
+
+class CheckpointError(ValueError):
+    """
+    Raised when a checkpoint cannot be read.
+    """
+
+
+def snapshot(model: CovidModel) -> bytes:
+    """
+    Capture the full state of a model: agents with their paths and timers,
+    grid occupancy, the virus layer and the states of all random number
+    streams. The map is stored as its grids only.
+
+    What can be rebuilt is left out: route fields are searched again, or
+    mapped from the compiled map, when first needed, and a trajectory
+    recorder keeps its settings but starts empty. An attached results sink
+    is not part of the state, restored models start without one.
+    """
+    header = MAGIC + FORMAT_VERSION.to_bytes(2, "little")
+    return header + pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def restore(data: bytes) -> CovidModel:
+    """
+    Rebuild a model from ``snapshot`` data. Stepping the restored model gives
+    exactly the same results as stepping the model the snapshot was taken from.
+    Every call returns an independent model, so one snapshot can be branched
+    into any number of scenarios.
+    """
+    if not data.startswith(MAGIC):
+        raise CheckpointError("Not a model checkpoint")
+    version = int.from_bytes(data[len(MAGIC):len(MAGIC) + 2], "little")
+    if version != FORMAT_VERSION:
+        raise CheckpointError(
+            f"Checkpoint format {version} is not supported, expected {FORMAT_VERSION}"
+        )
+    return pickle.loads(data[len(MAGIC) + 2:])
+
+
+def save_checkpoint(model: CovidModel, path: str) -> None:
+    """
+    Write a ``snapshot`` of the model to ``path``.
+    The file is written under a temporary name first, so an interrupted
+    save never leaves a truncated checkpoint behind.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(snapshot(model))
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> CovidModel:
+    """
+    Read a model written by ``save_checkpoint``.
+    """
+    with open(path, "rb") as f:
+        return restore(f.read())
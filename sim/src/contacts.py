@@ -0,0 +1,237 @@
+from __future__ import annotations
+import math
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from sim.src.params import EpidemicParams, IllnessStates, SocialDistancingStates
+
+if TYPE_CHECKING:
+    from sim.src.agents import HumanAgent
+
+
+SUSCEPTIBLE = IllnessStates.SUSCEPTIBLE.value
+INFECTED = IllnessStates.INFECTED.value
+
+# share of EpidemicParams.contact_radius kept by every social distancing level,
+# indexed by SocialDistancingStates value; at 0 only agents on the same cell meet
+DISTANCING_FACTORS = np.zeros(len(SocialDistancingStates) + 1)
+DISTANCING_FACTORS[SocialDistancingStates.NO_SOCIAL_DISTANCING.value] = 1.0
+DISTANCING_FACTORS[SocialDistancingStates.AVERAGE_SOCIAL_DISTANCING.value] = 0.75
+DISTANCING_FACTORS[SocialDistancingStates.NORMAL_SOCIAL_DISTANCING.value] = 0.5
+DISTANCING_FACTORS[SocialDistancingStates.EXTREME_SOCIAL_DISTANCING.value] = 0.0
+
+
+def contact_radii(social_distance: np.ndarray, params: EpidemicParams) -> np.ndarray:
+    """
+    Contact radius in cells of agents with the given social distancing codes.
+    """
+    return params.contact_radius * DISTANCING_FACTORS[social_distance]
+
+
+def contact_pairs(
+    width: int,
+    height: int,
+    x: np.ndarray,
+    y: np.ndarray,
+    radius: np.ndarray,
+    susceptible: np.ndarray,
+    infected: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    All pairs of a susceptible and an infected agent that are at most the
+    smaller of their two radii apart.
+
+    The infected agents are bucketed by cell. Every susceptible agent near an
+    infected one then looks into the cells at the offsets within reach, and as
+    every offset has one distance, pairs out of reach are dropped before they
+    are formed. The cost is linear in the number of agents plus the number of
+    pairs in reach, whatever the size of the map.
+    Args:
+        width (int): Width of the grid.
+        height (int): Height of the grid.
+        x (np.ndarray): x of every agent.
+        y (np.ndarray): y of every agent.
+        radius (np.ndarray): Contact radius of every agent, in cells.
+        susceptible (np.ndarray): Indices of the susceptible agents.
+        infected (np.ndarray): Indices of the infected agents.
+    Returns:
+        Index of the susceptible and of the infected agent of every pair.
+    """
+    empty = np.zeros(0, dtype=np.intp)
+    if len(susceptible) == 0 or len(infected) == 0:
+        return empty, empty
+
+    reach = float(radius[infected].max())
+    span = math.floor(reach)
+    offsets = [
+        (dx, dy)
+        for dx in range(-span, span + 1)
+        for dy in range(-span, span + 1)
+        if dx * dx + dy * dy <= reach * reach
+    ]
+
+    infected_cells = x[infected] * height + y[infected]
+    order = np.argsort(infected_cells, kind="stable")
+    counts = np.bincount(infected_cells, minlength=width * height)
+    starts = np.cumsum(counts) - counts
+
+    # cells with an infected agent at one of the offsets
+    occupied = np.pad((counts > 0).reshape(width, height), span)
+    near = np.zeros((width, height), dtype=bool)
+    for dx, dy in offsets:
+        near |= occupied[span + dx:span + dx + width, span + dy:span + dy + height]
+    candidates = susceptible[near[x[susceptible], y[susceptible]]]
+    cx, cy = x[candidates], y[candidates]
+    reach2 = radius[candidates] ** 2
+
+    pairs_s = []
+    pairs_i = []
+    for dx, dy in offsets:
+        distance2 = dx * dx + dy * dy
+        nx, ny = cx + dx, cy + dy
+        selected = (
+            (reach2 >= distance2) & (nx >= 0) & (nx < width) & (ny >= 0) & (ny < height)
+        )
+        cells = nx[selected] * height + ny[selected]
+        n = counts[cells]
+        total = int(n.sum())
+        if total == 0:
+            continue
+        # one entry per (susceptible, infected in the cell) combination
+        first = np.repeat(starts[cells], n)
+        offsets_in_cell = np.arange(total) - np.repeat(np.cumsum(n) - n, n)
+        partners = infected[order[first + offsets_in_cell]]
+        keep = radius[partners] ** 2 >= distance2
+        pairs_s.append(np.repeat(candidates[selected], n)[keep])
+        pairs_i.append(partners[keep])
+    if not pairs_s:
+        return empty, empty
+    return np.concatenate(pairs_s), np.concatenate(pairs_i)
+
+
+def contact_infections(
+    width: int,
+    height: int,
+    x: np.ndarray,
+    y: np.ndarray,
+    radius: np.ndarray,
+    status: np.ndarray,
+    face_cover: np.ndarray,
+    params: EpidemicParams,
+    rng: np.random.Generator,
+) -> tuple[np.ndarray, int]:
+    """
+    Susceptible agents infected by direct contact in one step.
+    Every pair within reach transmits with ``params.contact_rate``, times
+    ``params.mask_factor`` for every one of the two wearing a face cover.
+    Args:
+        width (int): Width of the grid.
+        height (int): Height of the grid.
+        x (np.ndarray): x of every agent.
+        y (np.ndarray): y of every agent.
+        radius (np.ndarray): Contact radius of every agent, in cells.
+        status (np.ndarray): Illness state code of every agent.
+        face_cover (np.ndarray): Whether every agent wears a face cover.
+        params (EpidemicParams): Constants of the epidemic.
+        rng (np.random.Generator): Stream to draw the infections from.
+    Returns:
+        Indices of the newly infected agents and the number of pairs in contact.
+    """
+    s, i = contact_pairs(
+        width,
+        height,
+        x,
+        y,
+        radius,
+        np.flatnonzero(status == SUSCEPTIBLE),
+        np.flatnonzero(status == INFECTED),
+    )
+    if len(s) == 0:
+        return s, 0
+    chance = np.full(len(s), params.contact_rate)
+    chance[face_cover[s]] *= params.mask_factor
+    chance[face_cover[i]] *= params.mask_factor
+    # chance to escape all contacts, multiplied over the pairs of every agent
+    escape = np.bincount(s, weights=np.log1p(-chance), minlength=len(status))
+    exposed = np.unique(s)
+    infected = exposed[rng.random(len(exposed)) < -np.expm1(escape[exposed])]
+    return infected, len(s)
+
+
+class ContactIndex:
+    """
+    Positions, illness states, face covers and contact radii of HumanAgent
+    objects in flat arrays, kept up to date on every move and state change.
+    Finding the contacts of a step then takes a few whole-array operations,
+    instead of a walk over all agents or over grid neighbourhoods.
+    """
+
+    def __init__(self, width: int, height: int, params: EpidemicParams):
+        """
+        Args:
+            width (int): Width of the grid.
+            height (int): Height of the grid.
+            params (EpidemicParams): Constants of the epidemic.
+        """
+        self.width = width
+        self.height = height
+        self.params = params
+        self.agents: list[HumanAgent] = []
+        self._slots: dict[HumanAgent, int] = {}
+        self.x = np.zeros(0, dtype=np.int64)
+        self.y = np.zeros(0, dtype=np.int64)
+        self.status = np.zeros(0, dtype=np.int8)
+        self.face_cover = np.zeros(0, dtype=bool)
+        self.radius = np.zeros(0, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.agents)
+
+    def add(self, agents: list[HumanAgent]) -> None:
+        """
+        Start tracking agents that are placed on the grid.
+        """
+        for agent in agents:
+            self._slots[agent] = len(self.agents)
+            self.agents.append(agent)
+        positions = np.array([agent.pos for agent in agents], dtype=np.int64).reshape(-1, 2)
+        self.x = np.concatenate([self.x, positions[:, 0]])
+        self.y = np.concatenate([self.y, positions[:, 1]])
+        self.status = np.concatenate(
+            [self.status, np.array([a.status.value for a in agents], dtype=np.int8)]
+        )
+        self.face_cover = np.concatenate(
+            [self.face_cover, np.array([a.face_cover for a in agents], dtype=bool)]
+        )
+        distancing = np.array([a.social_distance.value for a in agents], dtype=np.int64)
+        self.radius = np.concatenate([self.radius, contact_radii(distancing, self.params)])
+
+    def moved(self, agent: HumanAgent) -> None:
+        slot = self._slots[agent]
+        self.x[slot], self.y[slot] = agent.pos
+
+    def status_changed(self, agent: HumanAgent) -> None:
+        # face covers are only put on while recovered, so refreshing them with
+        # the state keeps them right for susceptible and infected agents
+        slot = self._slots[agent]
+        self.status[slot] = agent.status.value
+        self.face_cover[slot] = agent.face_cover
+
+    def infections(self, rng: np.random.Generator) -> tuple[list[HumanAgent], int]:
+        """
+        Agents infected by direct contact in this step, see ``contact_infections``,
+        and the number of pairs in contact.
+        """
+        infected, pairs = contact_infections(
+            self.width,
+            self.height,
+            self.x,
+            self.y,
+            self.radius,
+            self.status,
+            self.face_cover,
+            self.params,
+            rng,
+        )
+        return [self.agents[slot] for slot in infected.tolist()], pairs
@@ -0,0 +1,223 @@
+from __future__ import annotations
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+from maps.compiler import load_compiled
+from maps.map import Map
+from sim.src.params import EpidemicParams
+from sim.src.runner import SERIES_COLUMNS, simulate
+
+
+STATE_COLUMNS = SERIES_COLUMNS[1:]
+
+# map shared by all replicates that run in a worker process
+_worker_map: Optional[Map] = None
+
+
+def _init_worker(map: Union[Map, str]) -> None:
+    global _worker_map
+    # a compiled map is memory mapped by every worker instead of sent to it
+    _worker_map = load_compiled(map) if isinstance(map, str) else map
+
+
+def _run_replicate(
+    index: int,
+    seed: int,
+    n_agents: int,
+    steps: int,
+    params: Optional[EpidemicParams],
+    transmission: str,
+    destinations: str,
+    mobility: str,
+    scheduling: str,
+) -> tuple[int, dict[str, np.ndarray]]:
+    series = simulate(
+        _worker_map,
+        n_agents,
+        steps,
+        seed=seed,
+        params=params,
+        transmission=transmission,
+        destinations=destinations,
+        mobility=mobility,
+        scheduling=scheduling,
+    )
+    return index, {
+        column: np.asarray(series[column], dtype=np.int32) for column in STATE_COLUMNS
+    }
+
+
+def replicate_seeds(base_seed: Optional[int], replicates: int) -> list[int]:
+    """
+    Independent seeds for the replicates of an ensemble, derived from one base seed.
+    """
+    children = np.random.SeedSequence(base_seed).spawn(replicates)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+class EnsembleResult:
+    """
+    The SIR/D series of all replicates of an ensemble, with summary statistics.
+    """
+
+    def __init__(self, seeds: Sequence[int], series: dict[str, np.ndarray]):
+        """
+        Args:
+            seeds (Sequence[int]): The seed of every replicate.
+            series (dict[str, np.ndarray]): Array of shape (replicates, steps) per state.
+        """
+        self.seeds = list(seeds)
+        self.series = series
+
+    @property
+    def replicates(self) -> int:
+        return len(self.seeds)
+
+    @property
+    def steps(self) -> int:
+        return self.series[STATE_COLUMNS[0]].shape[1]
+
+    def mean(self, column: str) -> np.ndarray:
+        """
+        Mean over replicates, per step.
+        """
+        return self.series[column].mean(axis=0)
+
+    def quantiles(
+        self, column: str, q: Sequence[float] = (0.05, 0.5, 0.95)
+    ) -> dict[float, np.ndarray]:
+        """
+        Quantile bands over replicates, per step.
+        """
+        bands = np.quantile(self.series[column], q, axis=0)
+        return dict(zip(q, bands))
+
+    def peak_times(self, column: str = "infected") -> np.ndarray:
+        """
+        Step at which every replicate reached its maximum.
+        """
+        return self.series[column].argmax(axis=1) + 1
+
+    def peak_values(self, column: str = "infected") -> np.ndarray:
+        """
+        Maximum reached by every replicate.
+        """
+        return self.series[column].max(axis=1)
+
+    def write_summary(self, path: str, q: Sequence[float] = (0.05, 0.5, 0.95)) -> None:
+        """
+        Write the per-step mean and quantile bands of every state to a CSV file.
+        """
+        header = ["step"]
+        columns = []
+        for column in STATE_COLUMNS:
+            header.append(f"{column}_mean")
+            columns.append(self.mean(column))
+            for quantile, band in self.quantiles(column, q).items():
+                header.append(f"{column}_q{round(quantile * 100):02d}")
+                columns.append(band)
+
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for step in range(self.steps):
+                writer.writerow([step + 1] + [float(c[step]) for c in columns])
+
+
+def iter_replicates(
+    map: Map,
+    n_agents: int,
+    steps: int,
+    seeds: Sequence[int],
+    max_workers: Optional[int] = None,
+    params: Optional[EpidemicParams] = None,
+    transmission: str = "virus",
+    destinations: str = "random",
+    mobility: str = "random",
+    scheduling: str = "step",
+) -> Iterator[tuple[int, dict[str, np.ndarray]]]:
+    """
+    Run one replicate per seed in a process pool and yield
+    ``(index, series)`` pairs as soon as each replicate finishes.
+    The map is sent to every worker once, not once per replicate; a compiled
+    map (see maps.compiler) is memory mapped by the workers instead.
+    """
+    with ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(map.compiled_path or map,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _run_replicate,
+                index,
+                seed,
+                n_agents,
+                steps,
+                params,
+                transmission,
+                destinations,
+                mobility,
+                scheduling,
+            )
+            for index, seed in enumerate(seeds)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def run_ensemble(
+    map: Map,
+    n_agents: int,
+    steps: int,
+    replicates: int,
+    base_seed: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    on_replicate: Optional[Callable[[int, dict[str, np.ndarray]], None]] = None,
+    params: Optional[EpidemicParams] = None,
+    transmission: str = "virus",
+    destinations: str = "random",
+    mobility: str = "random",
+    scheduling: str = "step",
+) -> EnsembleResult:
+    """
+    Run independently seeded replicates of the same scenario in parallel.
+    Args:
+        map (Map): The map to simulate on, usually from ``maps.compiler.load_map``.
+        n_agents (int): Number of agents.
+        steps (int): Number of steps per replicate.
+        replicates (int): Number of replicates.
+        base_seed (Optional[int]): Seed the replicate seeds are derived from.
+        max_workers (Optional[int]): Number of worker processes, all cores by default.
+        on_replicate (Callable): Called with ``(index, series)`` as every replicate finishes.
+        params (Optional[EpidemicParams]): Constants of the epidemic, the defaults when None.
+        transmission (str): "virus", "contact" or "both", see CovidModel.
+        destinations (str): "random" or "nearest" building tiles, see CovidModel.
+        mobility (str): "random" or "schedule", see CovidModel.
+        scheduling (str): "step" or "event", see CovidModel.
+    """
+    seeds = replicate_seeds(base_seed, replicates)
+    series = {
+        column: np.zeros((replicates, steps), dtype=np.int32) for column in STATE_COLUMNS
+    }
+    for index, result in iter_replicates(
+        map,
+        n_agents,
+        steps,
+        seeds,
+        max_workers,
+        params,
+        transmission,
+        destinations,
+        mobility,
+        scheduling,
+    ):
+        for column in STATE_COLUMNS:
+            series[column][index] = result[column]
+        if on_replicate is not None:
+            on_replicate(index, result)
+    return EnsembleResult(seeds, series)
@@ -0,0 +1,147 @@
+from __future__ import annotations
+from collections import deque
+
+import numpy as np
+
+from sim.src.buildings import BuildingIndex
+from sim.src.params import BuldingType, EpidemicParams
+
+
+class Hospitals:
+    """
+    Beds of the hospital buildings of a model.
+
+    Every hospital building has ``capacity`` beds. An infected agent arriving
+    at a hospital tile takes a free bed of that building, or joins its
+    admission queue when all are taken. A bed is freed when its patient stops
+    being infected, and goes to the first agent still waiting in the queue.
+    Arrivals and discharges take constant time; queue entries of agents that
+    stopped waiting are dropped when they come up.
+
+    Agents are identified by their index, ``unique_id - 1`` for HumanAgent
+    objects and the row for a Population.
+    """
+
+    def __init__(self, index: BuildingIndex, height: int, capacity: int, n_agents: int):
+        """
+        Args:
+            index (BuildingIndex): The buildings of the model.
+            height (int): Height of the grid, used to flatten (x, y) cells.
+            capacity (int): Beds per hospital building.
+            n_agents (int): Number of agents.
+        """
+        self.buildings = [b for b in index.instances if b.type == BuldingType.HOSPITAL]
+        self.height = height
+        # hospital building of every flat cell, -1 outside of hospitals
+        self.facility_at = np.full(index.grid.size, -1, dtype=np.int32)
+        for facility, building in enumerate(self.buildings):
+            for x, y in building.tiles:
+                self.facility_at[x * height + y] = facility
+
+        self.capacity = np.full(len(self.buildings), capacity, dtype=np.int64)
+        self.occupancy = np.zeros(len(self.buildings), dtype=np.int64)
+        self.queued = np.zeros(len(self.buildings), dtype=np.int64)
+        # (agent, ticket) entries, an entry is stale once the agent's ticket moved on
+        self.queues: list[deque[tuple[int, int]]] = [deque() for _ in self.buildings]
+        # hospital whose bed every agent holds, and the one it waits for, -1 for none
+        self.bed = np.full(n_agents, -1, dtype=np.int32)
+        self.waiting = np.full(n_agents, -1, dtype=np.int32)
+        self._tickets = np.zeros(n_agents, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.buildings)
+
+    def holds(self, agent: int) -> bool:
+        """
+        Whether the agent has a bed or a place in a queue, either of which it keeps by staying.
+        """
+        return self.bed[agent] >= 0 or self.waiting[agent] >= 0
+
+    def arrive(self, agent: int, cell: int) -> bool:
+        """
+        An infected agent arrived at a flat cell; on a hospital tile it is
+        admitted or queued.
+        Returns:
+            Whether the agent got a bed.
+        """
+        facility = int(self.facility_at[cell])
+        if facility < 0 or self.holds(agent):
+            return False
+        if self.occupancy[facility] < self.capacity[facility]:
+            self.admit(agent, facility)
+            return True
+        self.waiting[agent] = facility
+        self._tickets[agent] += 1
+        self.queues[facility].append((agent, int(self._tickets[agent])))
+        self.queued[facility] += 1
+        return False
+
+    def admit(self, agent: int, facility: int) -> None:
+        """
+        Give the agent a bed of the hospital, taking it out of the queue if it waits there.
+        """
+        if self.waiting[agent] >= 0:
+            self.queued[self.waiting[agent]] -= 1
+            self.waiting[agent] = -1
+        self.bed[agent] = facility
+        self.occupancy[facility] += 1
+
+    def release(self, agent: int) -> int:
+        """
+        The agent gives up its bed or its place in a queue.
+        Returns:
+            The hospital whose bed was freed, -1 if the agent had none.
+        """
+        facility = int(self.bed[agent])
+        if facility >= 0:
+            self.bed[agent] = -1
+            self.occupancy[facility] -= 1
+        elif self.waiting[agent] >= 0:
+            self.queued[self.waiting[agent]] -= 1
+            self.waiting[agent] = -1
+        return facility
+
+    def next_waiting(self, facility: int) -> int:
+        """
+        The first agent still waiting in the queue of a hospital with a free
+        bed, -1 if there is none. It stays queued until it is ``admit``-ted.
+        """
+        if self.occupancy[facility] >= self.capacity[facility]:
+            return -1
+        queue = self.queues[facility]
+        while queue:
+            agent, ticket = queue[0]
+            if self.waiting[agent] == facility and self._tickets[agent] == ticket:
+                return agent
+            queue.popleft()
+        return -1
+
+    def load(self, agents):
+        """
+        Share of taken beds in the hospital of an agent, or of every agent of
+        an array, 0 for agents without a bed.
+        """
+        facilities = self.bed[agents]
+        if not self.buildings:
+            return np.zeros(np.shape(facilities))
+        load = self.occupancy / self.capacity
+        return np.where(facilities >= 0, load[facilities], 0.0)
+
+    def totals(self) -> tuple[int, int]:
+        """
+        Taken beds and waiting agents over all hospitals.
+        """
+        return int(self.occupancy.sum()), int(self.queued.sum())
+
+
+def outcome_chances(death, recovery, load, params: EpidemicParams):
+    """
+    Chances to die and to recover at the end of a hospital stay, for a
+    hospital with the given share of taken beds, see
+    ``EpidemicParams.overload_mortality`` and ``overload_recovery``.
+    Takes and returns floats or arrays.
+    """
+    return (
+        np.minimum(death * (1.0 + params.overload_mortality * load), 1.0),
+        recovery * (1.0 - params.overload_recovery * load),
+    )
@@ -1,11 +1,15 @@
 from __future__ import annotations
 import random
+from collections import deque
+from typing import TYPE_CHECKING, Hashable, Iterable, Optional
+
 import mesa
-from typing import TYPE_CHECKING
+import numpy as np
 
 
 if TYPE_CHECKING:
     from sim.src.agents import HumanAgent
+    from sim.src.profiler import Profiler
 
 
 from maps.map import Map
@@ -21,15 +25,18 @@ class SpawnPointGenerator:
     def __init__(
         self,
         houses=list[tuple[int, int]],
+        rng: Optional[random.Random] = None,
     ):
         """
         Args:
             houses (list[tuple[int, int]]): The list of houses.
+            rng (Optional[random.Random]): The random stream to draw spawn points from.
         """
         self.houses: list[tuple[int, int]] = houses
+        self.rng: random.Random = rng or random.Random()
 
     def next(self) -> tuple:
-        return random.choice(self.houses)
+        return self.rng.choice(self.houses)
 
 
 class DestinationGenerator:
@@ -42,22 +49,40 @@ class DestinationGenerator:
     def __init__(
         self,
         buildings: dict[BuldingType, list[tuple[int, int]]],
+        rng: Optional[random.Random] = None,
+        choice: str = "random",
+        path_finder: Optional[DestinationPathFinder] = None,
     ):
         """
         Args:
             buildings (dict[BuldingType, list[tuple[int, int]]]): The list of buildings.
+            rng (Optional[random.Random]): The random stream to draw destinations from.
+            choice (str): "random" to go to a random tile of the chosen building type,
+                "nearest" to go to the nearest one, which needs a path finder with
+                ``precompute_nearest`` done for every type but houses.
+            path_finder (Optional[DestinationPathFinder]): Finds the nearest tiles.
         """
+        if choice not in ("random", "nearest"):
+            raise ValueError(f"Unknown destination choice: {choice}")
+        if choice == "nearest" and path_finder is None:
+            raise ValueError("Choosing the nearest destination needs a path finder")
         self.buildings: dict[BuldingType, list[tuple[int, int]]] = buildings
+        self.rng: random.Random = rng or random.Random()
+        self.choice = choice
+        self.path_finder = path_finder
 
     def _determine_building_type(
         self,
         agent: HumanAgent,
+        planned: Optional[BuldingType] = None,
     ) -> BuldingType:
         if agent.status == IllnessStates.INFECTED:
             return BuldingType.HOSPITAL
+        if planned is not None:
+            return planned
         if not agent.is_home():
             return BuldingType.HOUSE
-        return random.choice(
+        return self.rng.choice(
             [
                 BuldingType.SHOP,
                 BuldingType.LIBRARY,
@@ -72,21 +97,36 @@ class DestinationGenerator:
     ) -> tuple[int, int]:
         if building_type == BuldingType.HOUSE:
             return agent.home
-        return random.choice(self.buildings[building_type])
+        if self.choice == "nearest":
+            # nowhere to go when no building of the type can be reached
+            return self.path_finder.nearest(agent.pos, building_type) or agent.pos
+        return self.rng.choice(self.buildings[building_type])
 
     def next(
         self,
         agent: HumanAgent,
+        planned: Optional[BuldingType] = None,
     ) -> tuple[int, int]:
-        building_type = self._determine_building_type(agent)
+        """
+        Where the agent goes next. Infected agents go to hospital, the others
+        to the planned building type, see DailySchedule, or when there is no
+        plan home if away from it and out to a random kind of place otherwise.
+        """
+        building_type = self._determine_building_type(agent, planned)
         return self._get_destination(building_type, agent)
 
 
 class DestinationPathFinder:
     """
-    A path finder for the agent.
-    The path finder finds the path from the start position to the end position.
-    The path is found using a breadth-first search algorithm.
+    A path finder shared by all agents of a model.
+    For every destination it is asked about, the path finder runs a single
+    breadth-first search outward from that destination and caches the
+    resulting distance and next-hop fields. Paths are then read off the
+    next-hop field in time proportional to their length.
+
+    Groups of destinations, such as all tiles of a building type, get one
+    field from a single search started at all of them at once, which leads
+    every cell to the nearest destination of the group, see ``precompute_nearest``.
     """
 
     def __init__(
@@ -96,39 +136,286 @@ class DestinationPathFinder:
     ):
         """
         Args:
-            grid (mesa.space.MultiGrid): The grid that the agent is a part of.
-            map (Map): The map that the agent is a part of.
+            grid (mesa.space.MultiGrid): The grid that the agents move on.
+            map (Map): The map that the agents move on.
         """
         self.grid = grid
         self.map = map
+        self.width: int = grid.width
+        self.height: int = grid.height
+
+        cells = [(x, y) for x in range(self.width) for y in range(self.height)]
+        self._walkable: list[bool] = self.map.allowed_mask(cells).tolist()
+        self._neighbors: list[list[int]] = [
+            [self._index(n) for n in self._adjacent(pos)] for pos in cells
+        ]
+        # destination index -> (distance field, next-hop field), None for a
+        # field dropped by pickling that is searched again when first needed
+        self._fields: dict[int, Optional[tuple[np.ndarray, np.ndarray]]] = {}
+        # group key -> (distance field, next-hop field, nearest destination field)
+        self._nearest: dict[Hashable, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        # group key -> flat indices of its destinations, to rebuild _nearest from
+        self._nearest_ends: dict[Hashable, list[int]] = {}
+        self.profiler: Optional[Profiler] = None
+
+    def __getstate__(self):
+        # profiling is enabled per model, see CovidModel.enable_profiling;
+        # the fields follow from the grid, only which ones exist is kept, as
+        # that decides between a destination's own field and a group's
+        state = self.__dict__.copy()
+        state["profiler"] = None
+        state["_fields"] = dict.fromkeys(self._fields)
+        state["_nearest"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for key, ends in self._nearest_ends.items():
+            self._nearest[key] = self._nearest_field(ends)
+
+    def _index(self, pos: tuple[int, int]) -> int:
+        return pos[0] * self.height + pos[1]
 
-    def _available_moves(self, pos: tuple[int, int]) -> list[tuple[int, int]]:
-        adjecent = self.grid.get_neighborhood(
+    def _position(self, index: int) -> tuple[int, int]:
+        return divmod(index, self.height)
+
+    def _adjacent(self, pos: tuple[int, int]) -> list[tuple[int, int]]:
+        return self.grid.get_neighborhood(
             pos,
             moore=False,
             include_center=False,
         )
-        return list(filter(self.map.is_allowed, adjecent))
 
-    def _find(
-        self, start: tuple[int, int], end: tuple[int, int]
-    ) -> list[tuple[int, int]]:
-        queue = [(start, [start])]
-        visited = set()
+    def _search(self, ends: Iterable[int]) -> tuple[np.ndarray, np.ndarray]:
+        # Reverse BFS: a step from v onto u is allowed when u is walkable,
+        # so only walkable cells are expanded, but every neighbour of an
+        # expanded cell can use it as its next hop. With several ends, every
+        # cell is reached from the nearest one.
+        size = self.width * self.height
+        distance = [-1] * size
+        next_hop = [-1] * size
+        queue = deque()
+        for end in ends:
+            distance[end] = 0
+            next_hop[end] = end
+            if self._walkable[end]:
+                queue.append(end)
+        expanded = 0
 
         while queue:
-            current_pos, path = queue.pop(0)
-            if current_pos == end:
-                return path
+            current = queue.popleft()
+            expanded += 1
+            step = distance[current] + 1
+            for neighbor in self._neighbors[current]:
+                if next_hop[neighbor] == -1:
+                    next_hop[neighbor] = current
+                    distance[neighbor] = step
+                    if self._walkable[neighbor]:
+                        queue.append(neighbor)
 
-            for next_pos in self._available_moves(current_pos):
-                if next_pos not in visited:
-                    visited.add(next_pos)
-                    queue.append((next_pos, path + [next_pos]))
+        if self.profiler is not None:
+            self.profiler.count("bfs_searches")
+            self.profiler.count("bfs_nodes", expanded)
+        return (
+            np.array(distance, dtype=np.int32),
+            np.array(next_hop, dtype=np.int32),
+        )
+
+    def _field(self, end: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+        index = self._index(end)
+        field = self._fields.get(index)
+        if field is None:
+            if self.profiler is not None:
+                with self.profiler.span("bfs"):
+                    field = self._search([index])
+            else:
+                field = self._search([index])
+            self._fields[index] = field
+        return field
 
-        return []
+    def precompute_nearest(self, key: Hashable, destinations: Iterable[tuple[int, int]]) -> None:
+        """
+        Build the field that leads every cell to the nearest of ``destinations``,
+        with one search, and keep it under ``key``, e.g. a building type.
+        """
+        ends = [self._index(dest) for dest in destinations]
+        self._nearest_ends[key] = ends
+        self._nearest[key] = self._nearest_field(ends)
+
+    def _nearest_field(self, ends: list[int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self.profiler is not None:
+            with self.profiler.span("bfs"):
+                distance, next_hop = self._search(ends)
+        else:
+            distance, next_hop = self._search(ends)
+        # follow the next hops to the destination they end at, doubling the
+        # jump every round; destinations are their own next hop
+        cells = np.arange(len(next_hop), dtype=np.int32)
+        nearest = np.where(next_hop >= 0, next_hop, cells)
+        while True:
+            jumped = nearest[nearest]
+            if np.array_equal(jumped, nearest):
+                break
+            nearest = jumped
+        nearest[next_hop < 0] = -1
+        return distance, next_hop, nearest
+
+    def nearest(self, start: tuple[int, int], key: Hashable) -> Optional[tuple[int, int]]:
+        """
+        The destination of group ``key`` nearest to start, None if none is reachable.
+        """
+        index = int(self._nearest[key][2][self._index(start)])
+        return self._position(index) if index >= 0 else None
+
+    def nearest_cells(self, key: Hashable) -> np.ndarray:
+        """
+        Flat index of the nearest destination of group ``key`` for every flat cell, -1 if none.
+        """
+        return self._nearest[key][2]
+
+    def add_fields(
+        self, destinations: np.ndarray, distance: np.ndarray, next_hop: np.ndarray
+    ) -> None:
+        """
+        Use fields computed elsewhere, e.g. stored in a compiled map, instead of
+        searching for these destinations. Row ``i`` of ``distance`` and
+        ``next_hop`` belongs to the flat cell index ``destinations[i]``.
+        """
+        size = self.width * self.height
+        if distance.shape[1:] != (size,) or next_hop.shape[1:] != (size,):
+            raise ValueError(f"Route fields are not for a {self.width}x{self.height} grid")
+        for row, index in enumerate(destinations.tolist()):
+            self._fields.setdefault(index, (distance[row], next_hop[row]))
+
+    def reattach_fields(
+        self, destinations: np.ndarray, distance: np.ndarray, next_hop: np.ndarray
+    ) -> None:
+        """
+        ``add_fields`` for the fields dropped by pickling only, e.g. from the
+        compiled map the path finder was seeded from, so they need no search.
+        """
+        for row, index in enumerate(destinations.tolist()):
+            if index in self._fields and self._fields[index] is None:
+                self._fields[index] = (distance[row], next_hop[row])
+
+    def precompute(self, destinations: Iterable[tuple[int, int]]) -> None:
+        """
+        Build and cache the fields for all given destinations up front.
+        """
+        for dest in destinations:
+            self._field(dest)
+
+    def distance(self, start: tuple[int, int], end: tuple[int, int]) -> int:
+        """
+        Number of moves from start to end, or -1 if end is unreachable.
+        """
+        distance, _ = self._field(end)
+        return int(distance[self._index(start)])
+
+    def _next_hops(self, current: int, target: int) -> np.ndarray:
+        # the field of target itself, or the field of a group whose nearest
+        # destination from current is target, which is just as short
+        if target not in self._fields:
+            for _, next_hop, nearest in self._nearest.values():
+                if nearest[current] == target:
+                    return next_hop
+        return self._field(self._position(target))[1]
+
+    def _find(
+        self, start: tuple[int, int], end: tuple[int, int]
+    ) -> list[tuple[int, int]]:
+        current = self._index(start)
+        target = self._index(end)
+        next_hop = self._next_hops(current, target)
+        if next_hop[current] == -1:
+            return []
+
+        path = [start]
+        while current != target:
+            current = int(next_hop[current])
+            path.append(self._position(current))
+        return path
 
     def find(
         self, start: tuple[int, int], end: tuple[int, int]
     ) -> list[tuple[int, int]]:
+        if self.profiler is not None:
+            self.profiler.count("paths")
         return self._find(start, end)
+
+
+class RouteTable:
+    """
+    Interned routes between pairs of cells, shared by all agents of a model.
+    All routes live in one flat array of cell indices; a route is
+    identified by an integer id pointing at its slice of that array.
+    An agent walking a route only keeps its id and a cursor into it, so
+    a move costs the same whatever the length of the route, and agents
+    walking the same route share its cells.
+    """
+
+    def __init__(self, path_finder: DestinationPathFinder, height: int):
+        """
+        Args:
+            path_finder (DestinationPathFinder): Used to compute routes not seen yet.
+            height (int): Height of the grid, used to flatten (x, y) cells.
+        """
+        self.path_finder = path_finder
+        self.height = height
+        self.ids: dict[tuple[int, int], int] = {}
+        self.cells = np.zeros(1024, dtype=np.int32)
+        self.starts = np.zeros(64, dtype=np.int64)
+        self.lengths = np.zeros(64, dtype=np.int32)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _append(self, cells: np.ndarray) -> int:
+        route_id = len(self.ids)
+        if route_id == len(self.starts):
+            self.starts = np.resize(self.starts, 2 * len(self.starts))
+            self.lengths = np.resize(self.lengths, 2 * len(self.lengths))
+        end = self._size + len(cells)
+        if end > len(self.cells):
+            self.cells = np.resize(self.cells, max(end, 2 * len(self.cells)))
+        self.cells[self._size:end] = cells
+        self.starts[route_id] = self._size
+        self.lengths[route_id] = len(cells)
+        self._size = end
+        return route_id
+
+    def route(self, origin: int, destination: int) -> int:
+        """
+        Id of the route from origin to destination (flat cell indices).
+        The route starts at the origin cell and is empty when unreachable.
+        """
+        key = (origin, destination)
+        route_id = self.ids.get(key)
+        if route_id is None:
+            path = self.path_finder.find(
+                divmod(origin, self.height), divmod(destination, self.height)
+            )
+            cells = np.array(
+                [x * self.height + y for x, y in path], dtype=np.int32
+            )
+            route_id = self.ids[key] = self._append(cells)
+        return route_id
+
+    def position(self, route_id: int, cursor: int) -> tuple[int, int]:
+        """
+        The (x, y) cell at ``cursor`` along a route.
+        """
+        return divmod(int(self.cells[self.starts[route_id] + cursor]), self.height)
+
+    def routes(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        """
+        Vectorized ``route``; every distinct pair is looked up once.
+        """
+        keys = origins.astype(np.int64) * (1 << 32) + destinations
+        unique, inverse = np.unique(keys, return_inverse=True)
+        ids = np.array(
+            [self.route(int(key >> 32), int(key & 0xFFFFFFFF)) for key in unique],
+            dtype=np.int32,
+        )
+        return ids[inverse]
@@ -0,0 +1,346 @@
+from __future__ import annotations
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+import numpy as np
+
+from maps.map import Map
+from sim.src.agents import HumanAgent
+from sim.src.model import CovidModel
+from sim.src.params import IllnessStates
+
+
+UNLIMITED = 0
+
+
+class _SnapshotLayout:
+    """
+    Typed views onto one snapshot buffer in shared memory.
+    """
+
+    def __init__(self, buffer, n: int, width: int, height: int):
+        self.fields: dict[str, np.ndarray] = {}
+        offset = 0
+        for name, dtype, shape in (
+            ("step", np.int64, (1,)),
+            ("counts", np.int64, (len(IllnessStates),)),
+            ("cumulative", np.int64, (3,)),
+            ("virus", np.float64, (width, height)),
+            ("x", np.int32, (n,)),
+            ("y", np.int32, (n,)),
+            ("status", np.int8, (n,)),
+            ("face_cover", np.bool_, (n,)),
+        ):
+            dtype = np.dtype(dtype)
+            # keep every field aligned to 8 bytes
+            offset = (offset + 7) // 8 * 8
+            size = int(np.prod(shape)) * dtype.itemsize
+            if buffer is not None:
+                self.fields[name] = np.ndarray(shape, dtype, buffer, offset)
+            offset += size
+        self.nbytes = max(offset, 1)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.fields[name]
+
+
+class SnapshotAgent:
+    """
+    One agent of a ``Snapshot``, with the attributes ``HumanAgent.render`` needs.
+    """
+
+    render = HumanAgent.render
+
+    def __init__(self, pos, status, face_cover, radius, color):
+        self.pos = pos
+        self.status = status
+        self.face_cover = face_cover
+        self.radius = radius
+        self.color = color
+
+
+class Snapshot:
+    """
+    A consistent copy of the model state published by the simulation process.
+    """
+
+    def __init__(self, fields: dict[str, np.ndarray], radius: np.ndarray, color: np.ndarray):
+        self.step = int(fields["step"][0])
+        self.counts = {
+            status: int(fields["counts"][i]) for i, status in enumerate(IllnessStates)
+        }
+        self.cumulative_infections, self.cumulative_recoveries, self.cumulative_deaths = (
+            int(c) for c in fields["cumulative"]
+        )
+        self.virus = fields["virus"]
+        self.x = fields["x"]
+        self.y = fields["y"]
+        self.status = fields["status"]
+        self.face_cover = fields["face_cover"]
+        self.radius = radius
+        self.color = color
+
+    def agents(self) -> list[SnapshotAgent]:
+        statuses = {status.value: status for status in IllnessStates}
+        return [
+            SnapshotAgent(
+                (x, y),
+                statuses[status],
+                face_cover,
+                radius,
+                tuple(color),
+            )
+            for x, y, status, face_cover, radius, color in zip(
+                self.x.tolist(),
+                self.y.tolist(),
+                self.status.tolist(),
+                self.face_cover.tolist(),
+                self.radius.tolist(),
+                self.color.tolist(),
+            )
+        ]
+
+
+def _publish(model, layout: _SnapshotLayout) -> None:
+    agent_id, x, y, status = model._frame()
+    if model.population is not None:
+        face_cover = model.population.face_cover
+    else:
+        face_cover = [agent.face_cover for agent in model.custom_agents]
+    counts = model.status_counts()
+
+    layout["step"][0] = model.steps_elapsed
+    layout["counts"][:] = [counts[status] for status in IllnessStates]
+    layout["cumulative"][:] = (
+        model.counters.cumulative_infections,
+        model.counters.cumulative_recoveries,
+        model.counters.cumulative_deaths,
+    )
+    layout["virus"][:] = model.virus.data
+    layout["x"][:] = x
+    layout["y"][:] = y
+    layout["status"][:] = status
+    layout["face_cover"][:] = face_cover
+
+
+def _run_worker(
+    tmx_file: str,
+    n_agents: int,
+    model_kwargs: dict[str, Any],
+    buffer_names: list[str],
+    static_name: str,
+    front,
+    lock,
+    steps_per_frame,
+    frames,
+    paused,
+    stop,
+    ready,
+) -> None:
+    mapa = Map(tmx_file, headless=True)
+    model = CovidModel(
+        N=n_agents,
+        width=mapa.width,
+        height=mapa.height,
+        map=mapa,
+        **model_kwargs,
+    )
+
+    buffers = [shared_memory.SharedMemory(name=name) for name in buffer_names]
+    layouts = [
+        _SnapshotLayout(b.buf, n_agents, mapa.width, mapa.height) for b in buffers
+    ]
+    static = shared_memory.SharedMemory(name=static_name)
+    radius = np.ndarray((n_agents,), np.float64, static.buf, 0)
+    color = np.ndarray((n_agents, 3), np.uint8, static.buf, n_agents * 8)
+    if model.population is not None:
+        radius[:] = model.population.radius
+        color[:] = model.population.color
+    else:
+        radius[:] = [agent.radius for agent in model.custom_agents]
+        color[:] = [agent.color for agent in model.custom_agents]
+
+    def publish():
+        # the reader only ever copies the front buffer while holding the lock,
+        # so the back buffer can be written without it
+        back = 1 - front.value
+        _publish(model, layouts[back])
+        with lock:
+            front.value = back
+
+    publish()
+    ready.set()
+
+    frames_seen = 0
+    try:
+        while not stop.is_set():
+            if paused.value:
+                time.sleep(0.005)
+                continue
+            rate = steps_per_frame.value
+            requested = frames.value
+            if rate == UNLIMITED:
+                budget = 1
+            else:
+                # a backlog of frames is dropped, not caught up with
+                budget = (requested - frames_seen) * rate
+                if budget <= 0:
+                    time.sleep(0.0005)
+                    continue
+            frames_seen = requested
+            for _ in range(budget):
+                model.step()
+            publish()
+    finally:
+        # views into the shared memory must be gone before it is closed
+        layouts.clear()
+        radius = color = None
+        for b in buffers:
+            b.close()
+        static.close()
+
+
+class LiveSimulation:
+    """
+    Runs a ``CovidModel`` in a separate process, decoupled from rendering.
+    The simulation process publishes compact snapshots (positions, statuses,
+    virus levels and counts) through a double buffer in shared memory; the
+    renderer only ever reads the latest complete one.
+
+    The simulation runs ``steps_per_frame`` steps for every frame the renderer
+    requests with ``request_frame``, or as fast as it can when set to ``UNLIMITED``.
+    """
+
+    def __init__(
+        self,
+        tmx_file: str,
+        n_agents: int,
+        steps_per_frame: int = 1,
+        **model_kwargs,
+    ):
+        """
+        Args:
+            tmx_file (str): Path to the Tiled map.
+            n_agents (int): Number of agents.
+            steps_per_frame (int): Simulation steps per rendered frame, or UNLIMITED.
+            **model_kwargs: Passed on to ``CovidModel``.
+        """
+        self.tmx_file = tmx_file
+        self.n_agents = n_agents
+        self.model_kwargs = model_kwargs
+        mapa = Map(tmx_file, headless=True)
+        self.width, self.height = mapa.width, mapa.height
+
+        ctx = mp.get_context()
+        self._front = ctx.Value("i", 0, lock=False)
+        self._lock = ctx.Lock()
+        self._steps_per_frame = ctx.Value("i", steps_per_frame, lock=False)
+        self._frames = ctx.Value("q", 0, lock=False)
+        self._paused = ctx.Value("b", 0, lock=False)
+        self._stop = ctx.Event()
+        self._ready = ctx.Event()
+        self._ctx = ctx
+
+        nbytes = _SnapshotLayout(None, n_agents, self.width, self.height).nbytes
+        self._buffers = [
+            shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(2)
+        ]
+        self._layouts = [
+            _SnapshotLayout(b.buf, n_agents, self.width, self.height)
+            for b in self._buffers
+        ]
+        self._static = shared_memory.SharedMemory(
+            create=True, size=max(n_agents * 11, 1)
+        )
+        self._radius = np.ndarray((n_agents,), np.float64, self._static.buf, 0)
+        self._color = np.ndarray((n_agents, 3), np.uint8, self._static.buf, n_agents * 8)
+        self._process: Optional[mp.Process] = None
+
+    def start(self, timeout: Optional[float] = None) -> None:
+        """
+        Start the simulation process and wait for its first snapshot.
+        """
+        self._process = self._ctx.Process(
+            target=_run_worker,
+            args=(
+                self.tmx_file,
+                self.n_agents,
+                self.model_kwargs,
+                [b.name for b in self._buffers],
+                self._static.name,
+                self._front,
+                self._lock,
+                self._steps_per_frame,
+                self._frames,
+                self._paused,
+                self._stop,
+                self._ready,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._ready.wait(0.1):
+            if not self._process.is_alive():
+                raise RuntimeError("The simulation process exited before it started")
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("The simulation process did not start in time")
+
+    @property
+    def steps_per_frame(self) -> int:
+        return self._steps_per_frame.value
+
+    @steps_per_frame.setter
+    def steps_per_frame(self, value: int) -> None:
+        self._steps_per_frame.value = max(UNLIMITED, value)
+
+    @property
+    def paused(self) -> bool:
+        return bool(self._paused.value)
+
+    @paused.setter
+    def paused(self, value: bool) -> None:
+        self._paused.value = int(value)
+
+    def request_frame(self) -> None:
+        """
+        Allow the simulation to run the steps of one more frame.
+        """
+        self._frames.value += 1
+
+    def snapshot(self) -> Snapshot:
+        """
+        Copy of the latest published snapshot.
+        """
+        with self._lock:
+            layout = self._layouts[self._front.value]
+            fields = {name: array.copy() for name, array in layout.fields.items()}
+        return Snapshot(fields, self._radius, self._color)
+
+    def stop(self) -> None:
+        """
+        Stop the simulation process and free the shared memory.
+        """
+        self._stop.set()
+        if self._process is not None:
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+        if not self._buffers:
+            return
+        self._layouts = []
+        self._radius = self._color = None
+        for b in self._buffers + [self._static]:
+            b.close()
+            b.unlink()
+        self._buffers = []
+
+    def __enter__(self) -> LiveSimulation:
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -1,21 +1,45 @@
+import os
 from typing import Optional
 import mesa
-import mesa.datacollection
-import random
+import numpy as np
 
 
+from maps.compiler import load_compiled
 from maps.map import Map
+from sim.src.buildings import Building, BuildingIndex
+from sim.src.contacts import ContactIndex, contact_infections
+from sim.src.facilities import Hospitals, outcome_chances
 from sim.src.generators import (
     DestinationGenerator,
+    DestinationPathFinder,
+    RouteTable,
     SpawnPointGenerator,
 )
-from sim.src.params import BuldingType, IllnessStates
+from sim.src.params import BuldingType, EpidemicParams, HumanAgentActions, IllnessStates
+from sim.src.population import Population
+from sim.src.profiler import NO_SPAN, Profiler
+from sim.src.recorder import TrajectoryRecorder
+from sim.src.sinks import ResultsSink
+from sim.src.rng import RandomStreams
+from sim.src.schedules import PLACES, DailySchedule
+from sim.src.scheduler import EventScheduler
+from sim.src.stats import AGE_GROUPS, EpidemicCounters, location_codes
+from sim.src.virus import VirusField
 from .agents import (
     HumanAgent,
     HumanAgentGenerator,
 )
 
 
+# profiler counters of the transitions into every state
+TRANSITION_COUNTERS = {
+    IllnessStates.SUSCEPTIBLE: "immunity_lost",
+    IllnessStates.INFECTED: "infections",
+    IllnessStates.RECOVERED: "recoveries",
+    IllnessStates.DEAD: "deaths",
+}
+
+
 class CovidModel(mesa.Model):
     """
     Model class for the COVID-19 simulation.
@@ -23,7 +47,24 @@ class CovidModel(mesa.Model):
     including the grid, agents, and data collection.
     """
 
-    def __init__(self, N, width, height, map: Map):
+    def __init__(
+        self,
+        N,
+        width,
+        height,
+        map: Map,
+        virus_diffusion: Optional[dict[Optional[BuldingType], float]] = None,
+        virus_ventilation: Optional[dict[Optional[BuldingType], float]] = None,
+        seed: Optional[int] = None,
+        engine: str = "agents",
+        record_every: Optional[int] = None,
+        record_capacity: Optional[int] = None,
+        scheduling: str = "step",
+        params: Optional[EpidemicParams] = None,
+        transmission: str = "virus",
+        destinations: str = "random",
+        mobility: str = "random",
+    ):
         """
         Create a new model with the given parameters.
         Args:
@@ -31,33 +72,123 @@ class CovidModel(mesa.Model):
             width: Width of the grid
             height: Height of the grid
             map: Map object containing the layers and positions
+            virus_diffusion: Optional diffusion rate per building type, see VirusField
+            virus_ventilation: Optional ventilation rate per building type, see VirusField
+            seed: Optional seed for the model's random number generators
+            engine: "agents" to simulate every agent as a HumanAgent object,
+                "arrays" to keep them in an array-backed Population instead
+            record_every: Record agent positions every n-th step, never when None;
+                only for callers that read ``recorder``
+            record_capacity: Keep at most this many recorded rows, see TrajectoryRecorder
+            scheduling: "step" to step every agent every step, "event" to step
+                only the agents that have something to do, see EventScheduler.
+                Only for the "agents" engine
+            params: Optional constants of the epidemic, the defaults of EpidemicParams when None
+            transmission: "virus" to infect through the virus agents shed on the ground,
+                "contact" to infect directly between agents within reach of each other,
+                see ContactIndex, or "both"
+            destinations: "random" to send agents going out, or infected, to a random
+                tile of the chosen building type, "nearest" to the nearest one
+            mobility: "random" for agents to decide every step whether to go out,
+                "schedule" to follow daily activity plans, see DailySchedule
         """
+        if engine not in ("agents", "arrays"):
+            raise ValueError(f"Unknown engine: {engine}")
+        if scheduling not in ("step", "event"):
+            raise ValueError(f"Unknown scheduling: {scheduling}")
+        if scheduling == "event" and engine != "agents":
+            raise ValueError('Event scheduling needs the "agents" engine')
+        if transmission not in ("virus", "contact", "both"):
+            raise ValueError(f"Unknown transmission: {transmission}")
+        if destinations not in ("random", "nearest"):
+            raise ValueError(f"Unknown destination choice: {destinations}")
+        if mobility not in ("random", "schedule"):
+            raise ValueError(f"Unknown mobility: {mobility}")
 
-        super().__init__()
+        super().__init__(seed=seed)
+        self.params = params if params is not None else EpidemicParams()
+        self.transmission = transmission
+        self.virus_transmission = transmission != "contact"
+        self.destinations = destinations
+        self.mobility = mobility
+        self.streams = RandomStreams(seed)
         self.width = width
         self.height = height
         self.num_agents = N
         self.grid = mesa.space.MultiGrid(width, height, True)
         self.map = map
         self.__init_buildings(self.map)
-        self.destgen = DestinationGenerator(self.buildings)
+        self.path_finder = DestinationPathFinder(self.grid, self.map)
+        if self.map.route_fields is not None:
+            self.path_finder.add_fields(*self.map.route_fields)
+        if destinations == "nearest":
+            # one field per building type instead of one per tile; agents
+            # still go home to their own house, so houses keep theirs
+            for type_, positions in self.buildings.items():
+                if type_ != BuldingType.HOUSE:
+                    self.path_finder.precompute_nearest(type_, positions)
+            self.path_finder.precompute(self.buildings[BuldingType.HOUSE])
+        else:
+            self.path_finder.precompute(
+                pos for positions in self.buildings.values() for pos in positions
+            )
+        self.destgen = DestinationGenerator(
+            self.buildings, self.streams.mobility, destinations, self.path_finder
+        )
+        self.routes = RouteTable(self.path_finder, height)
+        self.hospitals: Optional[Hospitals] = None
+        if self.params.hospital_capacity > 0:
+            self.hospitals = Hospitals(
+                self.building_index, height, self.params.hospital_capacity, N
+            )
 
         spawngen = SpawnPointGenerator(
             houses=self.buildings[BuldingType.HOUSE],
+            rng=self.streams.demographics,
         )
         agen = HumanAgentGenerator(self, spawngen)
 
         self.custom_agents = []
-        for _ in range(self.num_agents):
-            agent = agen.next()
-            agent.respawn()
-            self.custom_agents.append(agent)
-
-        self.datacollector = mesa.datacollection.DataCollector(
-            agent_reporters={
-                "pos": "pos",
-            }
-        )
+        self.population: Optional[Population] = None
+        self.counters = EpidemicCounters()
+        if engine == "arrays":
+            self.population = Population(self, self.num_agents)
+            self.counters.add(
+                self.population.status,
+                self.population.age_group,
+                self.population.location,
+            )
+        else:
+            for _ in range(self.num_agents):
+                agent = agen.next()
+                agent.respawn()
+                self.custom_agents.append(agent)
+                self.counters.add(
+                    agent.status.value,
+                    AGE_GROUPS.index(agent.age_group),
+                    self._location(agent.pos),
+                )
+
+        self.daily_schedule: Optional[DailySchedule] = None
+        if mobility == "schedule":
+            if self.population is not None:
+                activity = self.population.active
+            else:
+                activity = np.array([agent.active.value for agent in self.custom_agents])
+            self.daily_schedule = DailySchedule(activity, self.streams.generators["mobility"])
+            self.daily_schedule.advance(0)
+
+        self.contacts: Optional[ContactIndex] = None
+        if transmission != "virus" and self.population is None:
+            self.contacts = ContactIndex(width, height, self.params)
+            self.contacts.add(self.custom_agents)
+
+        self.scheduler: Optional[EventScheduler] = None
+        self.recorder: Optional[TrajectoryRecorder] = None
+        if record_every is not None:
+            self.recorder = TrajectoryRecorder(
+                capacity=record_capacity, every=record_every
+            )
         self.grid.add_property_layer(
             mesa.space.PropertyLayer(
                 "Virus",
@@ -68,9 +199,74 @@ class CovidModel(mesa.Model):
             ),
         )
 
+        self.virus = VirusField(
+            self.grid.properties["Virus"],
+            self.buildings,
+            diffusion=virus_diffusion,
+            ventilation=virus_ventilation,
+            decay_amount=self.params.decay_amount,
+            torus=self.grid.torus,
+        )
+
+        self.sink: Optional[ResultsSink] = None
+        self.profiler: Optional[Profiler] = None
+
         self.steps_elapsed = 0
         self.patient_zero_infected = False
 
+        if scheduling == "event":
+            self.scheduler = EventScheduler(self, self.custom_agents)
+
+    def __getstate__(self):
+        # the sink holds open files, it is not part of the simulation state,
+        # neither are the measurements of a profiler
+        state = self.__dict__.copy()
+        state["sink"] = None
+        state["profiler"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # route fields are not pickled, map them again from the compiled map
+        # the path finder was seeded from instead of searching them when needed
+        path = self.map.compiled_path
+        if path is not None and os.path.exists(os.path.join(path, "meta.json")):
+            try:
+                fields = load_compiled(path).route_fields
+            except ValueError:
+                # compiled by another version of maps.compiler
+                fields = None
+            if fields is not None:
+                self.path_finder.reattach_fields(*fields)
+
+    def enable_profiling(self, keep_steps: Optional[int] = 1000) -> Profiler:
+        """
+        Start measuring the phases of every following step, see Profiler.
+        Args:
+            keep_steps: Keep the measurements of this many most recent steps, all when None
+        """
+        self.profiler = Profiler(keep_steps)
+        self.path_finder.profiler = self.profiler
+        return self.profiler
+
+    def disable_profiling(self) -> None:
+        self.profiler = None
+        self.path_finder.profiler = None
+
+    def span(self, name: str):
+        """
+        Time a phase of the step while profiling, do nothing otherwise.
+        """
+        if self.profiler is None:
+            return NO_SPAN
+        return self.profiler.span(name)
+
+    def attach_sink(self, sink: Optional[ResultsSink]) -> None:
+        """
+        Stream the results of every following step to the given sink, or stop when None.
+        """
+        self.sink = sink
+
     def __init_buildings(self, map: Map):
         """
         Initialize the buildings on the map.
@@ -89,42 +285,341 @@ class CovidModel(mesa.Model):
         self.buildings[BuldingType.FASTFOOD] = fastfood
         self.buildings[BuldingType.LIBRARY] = library
         self.buildings[BuldingType.SHOP] = shop
+        self.building_index = BuildingIndex(self.buildings, self.width, self.height)
+
+    def on_status_change(
+        self, agent: HumanAgent, old: IllnessStates, new: IllnessStates
+    ) -> None:
+        """
+        Called by an agent whenever its illness state changes.
+        """
+        self.counters.transition(
+            old.value,
+            new.value,
+            AGE_GROUPS.index(agent.age_group),
+            self._location(agent.pos),
+        )
+        if self.hospitals is not None and old == IllnessStates.INFECTED:
+            self._discharge(agent.unique_id - 1)
+        if self.scheduler is not None:
+            self.scheduler.status_changed(agent, old, new)
+        if self.contacts is not None:
+            self.contacts.status_changed(agent)
+        if self.profiler is not None:
+            self.profiler.count(TRANSITION_COUNTERS[new])
+        if self.sink is not None and self.sink.events:
+            x, y = agent.pos
+            self.sink.append(
+                "events",
+                (self.steps_elapsed, agent.unique_id, x, y, old.value, new.value),
+            )
+
+    def on_status_changes(
+        self,
+        agent_ids: np.ndarray,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        old: np.ndarray,
+        new: int,
+    ) -> None:
+        """
+        Bulk form of ``on_status_change`` used by the array engine, with states as codes.
+        """
+        self.counters.transitions(
+            old,
+            new,
+            self.population.age_group[agent_ids - 1],
+            location_codes(self.building_index.grid[xs, ys]),
+        )
+        if self.hospitals is not None:
+            for index in (agent_ids[old == IllnessStates.INFECTED.value] - 1).tolist():
+                self._discharge(index)
+        if self.profiler is not None:
+            self.profiler.count(TRANSITION_COUNTERS[IllnessStates(new)], len(agent_ids))
+        if self.sink is not None and self.sink.events:
+            self.sink.extend(
+                "events",
+                {
+                    "step": np.full(len(agent_ids), self.steps_elapsed, dtype=np.int32),
+                    "agent_id": agent_ids,
+                    "x": xs,
+                    "y": ys,
+                    "from_status": old,
+                    "to_status": np.full(len(agent_ids), new, dtype=np.int8),
+                },
+            )
+
+    def on_hospital_arrival(self, agent: HumanAgent) -> None:
+        """
+        Called by an infected agent reaching its destination, to take a bed or
+        queue for one when it stands in a hospital with limited beds.
+        """
+        x, y = agent.pos
+        self.hospitals.arrive(agent.unique_id - 1, x * self.height + y)
+
+    def _discharge(self, index: int) -> None:
+        """
+        Free the bed of an agent that is no longer infected, for the next agent in the queue.
+        """
+        facility = self.hospitals.release(index)
+        if facility < 0:
+            return
+        waiting = self.hospitals.next_waiting(facility)
+        if waiting < 0:
+            return
+        if self.scheduler is None:
+            self.hospitals.admit(waiting, facility)
+            return
+        # the hospital stay of a sleeping agent starts now, not when it last woke up
+        agent = self.custom_agents[waiting]
+        self.scheduler.sync(agent, self.steps_elapsed)
+        self.hospitals.admit(waiting, facility)
+        self.scheduler.state_changed(agent)
+
+    def in_treatment(self, agent: HumanAgent) -> bool:
+        """
+        Whether an infected agent is being treated: it has a hospital bed, or
+        stands on a hospital tile when beds are not limited.
+        """
+        if self.hospitals is not None:
+            return bool(self.hospitals.bed[agent.unique_id - 1] >= 0)
+        return self.building_at_pos(agent.pos) == BuldingType.HOSPITAL
+
+    def outcome_chances(self, agent: HumanAgent) -> tuple[float, float]:
+        """
+        Chances of a treated agent to die and to recover at the end of its
+        hospital stay, raised and lowered by the load of its hospital.
+        """
+        if self.hospitals is None:
+            return agent.likelihood_of_death, agent.likelihood_of_recovery
+        death, recovery = outcome_chances(
+            agent.likelihood_of_death,
+            agent.likelihood_of_recovery,
+            self.hospitals.load(agent.unique_id - 1),
+            self.params,
+        )
+        return float(death), float(recovery)
+
+    def hospital_counts(self) -> tuple[int, int]:
+        """
+        Agents in hospital and agents waiting for a bed. Without a bed limit
+        the infected agents on hospital tiles are in hospital and none wait.
+        """
+        if self.hospitals is not None:
+            return self.hospitals.totals()
+        return self.counters.at(BuldingType.HOSPITAL, IllnessStates.INFECTED), 0
+
+    def on_agent_moved(self, agent: HumanAgent, old_pos: tuple[int, int]) -> None:
+        """
+        Called by an agent after every move on the grid.
+        """
+        self.counters.move(
+            agent.status.value, self._location(old_pos), self._location(agent.pos)
+        )
+        if self.contacts is not None:
+            self.contacts.moved(agent)
+        if self.scheduler is not None:
+            self.scheduler.moved(agent, old_pos)
+
+    def _location(self, pos: tuple[int, int]) -> int:
+        # position in stats.LOCATIONS
+        return int(self.building_index.grid[pos[0], pos[1]]) + 1
 
     def building_at_pos(self, pos: tuple[int, int]) -> Optional[BuldingType]:
-        for type_, list_ in self.buildings.items():
-            if pos in list_:
-                return type_
-        return None
+        return self.building_index.type_at(pos)
+
+    def building_instance_at_pos(self, pos: tuple[int, int]) -> Optional[Building]:
+        return self.building_index.building_at(pos)
+
+    def status_counts(self) -> dict[IllnessStates, int]:
+        """
+        Number of agents in each illness state.
+        """
+        return self.counters.counts()
 
     def step(self) -> None:
 
         self.steps_elapsed += 1
+        if self.profiler is not None:
+            self.profiler.step_started(self.steps_elapsed)
 
         # Infect patient zero after ~5 seconds (e.g., 300 steps at ~16ms intervals)
-        if not self.patient_zero_infected and self.steps_elapsed >= 100:
-            eligible = [a for a in self.custom_agents if not a.face_cover]
-            if eligible:
-                patient_zero = random.choice(eligible)
-                patient_zero.status = IllnessStates.INFECTED
-                self.patient_zero_infected = True
+        if not self.patient_zero_infected and self.steps_elapsed >= self.params.patient_zero_step:
+            if self.population is not None:
+                self.patient_zero_infected = self.population.infect_patient_zero()
+            else:
+                eligible = [a for a in self.custom_agents if not a.face_cover]
+                if eligible:
+                    patient_zero = self.streams.patient_zero.choice(eligible)
+                    if self.scheduler is not None and patient_zero in self.scheduler:
+                        self.scheduler.sync(patient_zero, self.steps_elapsed)
+                    patient_zero.set_status(IllnessStates.INFECTED)
+                    self.patient_zero_infected = True
+            if self.patient_zero_infected:
                 print(f"Patient zero infected at step {self.steps_elapsed}")
 
-        self.datacollector.collect(self)
-        for agent in self.custom_agents:
+        if self.daily_schedule is not None and self.daily_schedule.advance(self.steps_elapsed):
+            with self.span("schedule"):
+                if self.scheduler is not None:
+                    self.scheduler.replan()
+
+        if self.recorder is not None and self.recorder.due(self.steps_elapsed):
+            with self.span("record"):
+                self.recorder.record(self.steps_elapsed, *self._frame())
+        with self.span("agents"):
+            if self.population is not None:
+                shed_cells, shed_amounts = self.population.step()
+                shed_positions = np.column_stack(np.divmod(shed_cells, self.height))
+            elif self.scheduler is not None:
+                shed_positions, shed_amounts = self.scheduler.step(self.steps_elapsed)
+            else:
+                shed_positions, shed_amounts = self._step_agents()
+        if self.transmission != "virus":
+            with self.span("contacts"):
+                self._transmit_contacts()
+        if self.virus_transmission:
+            with self.span("deposit"):
+                self.virus.deposit(shed_positions, shed_amounts)
+            if self.profiler is not None:
+                self.profiler.count("deposits", len(shed_amounts))
+            # Zanikanie wirusa na wszystkich płytkach
+            if self.steps_elapsed % self.params.decay_every == 0:
+                with self.span("decay"):
+                    self.virus.decay()
+
+        if self.sink is not None:
+            with self.span("results"):
+                self._write_results()
+
+        if self.profiler is not None:
+            self.profiler.step_finished()
+
+    def _transmit_contacts(self) -> None:
+        """
+        Infect the susceptible agents within reach of infected ones, after all agents moved.
+        """
+        rng = self.streams.generators["infection"]
+        if self.population is not None:
+            population = self.population
+            infected, pairs = contact_infections(
+                self.width,
+                self.height,
+                population.x,
+                population.y,
+                population.contact_radius,
+                population.status,
+                population.face_cover,
+                self.params,
+                rng,
+            )
+            population.set_status(infected, IllnessStates.INFECTED.value)
+        else:
+            agents, pairs = self.contacts.infections(rng)
+            for agent in agents:
+                if self.scheduler is not None and agent in self.scheduler:
+                    # a sleeping agent skipped nothing in this step but its
+                    # infection check, so it counts as stepped up to now
+                    self.scheduler.sync(agent, self.steps_elapsed + 1)
+                agent.set_status(IllnessStates.INFECTED)
+        if self.profiler is not None:
+            self.profiler.count("contact_pairs", pairs)
+
+    def _write_results(self) -> None:
+        counts = self.status_counts()
+        hospitalized, waiting = self.hospital_counts()
+        self.sink.append(
+            "series",
+            (
+                self.steps_elapsed,
+                counts[IllnessStates.SUSCEPTIBLE],
+                counts[IllnessStates.INFECTED],
+                counts[IllnessStates.RECOVERED],
+                counts[IllnessStates.DEAD],
+                hospitalized,
+                waiting,
+            ),
+        )
+        if self.sink.wants_trajectories(self.steps_elapsed):
+            agent_id, x, y, status = self._frame()
+            self.sink.extend(
+                "trajectories",
+                {
+                    "step": np.full(len(agent_id), self.steps_elapsed, dtype=np.int32),
+                    "agent_id": agent_id,
+                    "x": x,
+                    "y": y,
+                    "status": status,
+                },
+            )
+
+    def _frame(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Ids, x and y positions and status codes of all agents.
+        """
+        if self.population is not None:
+            population = self.population
+            return (
+                np.arange(1, population.n + 1, dtype=np.int32),
+                population.x,
+                population.y,
+                population.status,
+            )
+
+        agents = self.custom_agents
+        positions = np.array([agent.pos for agent in agents]).reshape(-1, 2)
+        return (
+            np.fromiter((agent.unique_id for agent in agents), np.int32, len(agents)),
+            positions[:, 0],
+            positions[:, 1],
+            np.fromiter((agent.status.value for agent in agents), np.int8, len(agents)),
+        )
+
+    def _step_agents(self) -> tuple[list[tuple[int, int]], list[int]]:
+        shed_positions = []
+        shed_amounts = []
+        params = self.params
+        trips: Optional[dict[int, BuldingType]] = None
+        if self.daily_schedule is not None:
+            trips = self._scheduled_trips()
+        else:
+            mobility_draws = self.streams.uniforms("mobility", len(self.custom_agents))
+        infection_draws = self.streams.uniforms("infection", len(self.custom_agents))
+        for i, agent in enumerate(self.custom_agents):
 
             if isinstance(agent, HumanAgent):
-                act = agent.determine_action()
-                agent.step(act)
+                if trips is not None:
+                    planned = trips.get(i)
+                    act = (
+                        HumanAgentActions.GO_OUT
+                        if planned is not None
+                        else HumanAgentActions.STAY_IN_PLACE
+                    )
+                    agent.step(act, infection_draws[i], planned)
+                else:
+                    act = agent.determine_action(mobility_draws[i])
+                    agent.step(act, infection_draws[i])
                 if agent.status == IllnessStates.INFECTED:
                     # leave some virus on the ground
-                    virus: mesa.space.PropertyLayer = self.grid.properties["Virus"]
-                    virus.set_cell(agent.pos, virus.data[agent.pos] + (1 if agent.face_cover else 10))
-        # Zanikanie wirusa na wszystkich płytkach
-        virus: mesa.space.PropertyLayer = self.grid.properties["Virus"]
-        if self.steps_elapsed % 5 == 0:
-            virus: mesa.space.PropertyLayer = self.grid.properties["Virus"]
-            for x in range(self.width):
-                for y in range(self.height):
-                    current_level = virus.data[(x, y)]
-                    new_level = max(0.0, current_level - 1)
-                    virus.set_cell((x, y), new_level)
+                    shed_positions.append(agent.pos)
+                    shed_amounts.append(
+                        params.masked_shed_amount if agent.face_cover else params.shed_amount
+                    )
+        return shed_positions, shed_amounts
+
+    def _scheduled_trips(self) -> dict[int, BuldingType]:
+        """
+        Trips of the DailySchedule that start in this step, by agent index.
+        Agents still walking keep theirs until they arrive.
+        """
+        schedule = self.daily_schedule
+        due = schedule.due(self.steps_elapsed)
+        if len(due) == 0:
+            return {}
+        idle = np.array([not self.custom_agents[i].is_moving for i in due.tolist()], dtype=bool)
+        leaving = due[idle]
+        places = schedule.take(leaving, self.steps_elapsed)
+        return {
+            i: PLACES[place]
+            for i, place in zip(leaving.tolist(), places.tolist())
+            if place >= 0
+        }
@@ -1,4 +1,6 @@
+from __future__ import annotations
 from enum import Enum, auto
+from typing import Any
 
 
 class BuldingType(Enum):
@@ -63,3 +65,178 @@ class HumanAgentActions(Enum):
 
     STAY_IN_PLACE = auto()
     GO_OUT = auto()
+
+
+class EpidemicParams:
+    """
+    Constants of the epidemic, used by both engines and the event scheduler.
+    The defaults are the values the simulation was calibrated with.
+    """
+
+    # name -> type of every parameter, values are converted to it
+    FIELDS: dict[str, type] = {
+        "infection_scale": float,
+        "mask_factor": float,
+        "hospital_time": int,
+        "death_rate": float,
+        "recovery_rate": float,
+        "mask_after_recovery": float,
+        "immunity_time": int,
+        "shed_amount": int,
+        "masked_shed_amount": int,
+        "decay_every": int,
+        "decay_amount": float,
+        "face_cover_rate": float,
+        "patient_zero_step": int,
+        "contact_rate": float,
+        "contact_radius": float,
+        "hospital_capacity": int,
+        "overload_mortality": float,
+        "overload_recovery": float,
+    }
+    # parameters that are probabilities
+    PROBABILITIES = (
+        "mask_factor",
+        "death_rate",
+        "recovery_rate",
+        "mask_after_recovery",
+        "face_cover_rate",
+        "contact_rate",
+        "overload_recovery",
+    )
+
+    def __init__(
+        self,
+        infection_scale: float = 1000.0,
+        mask_factor: float = 0.05,
+        hospital_time: int = 300,
+        death_rate: float = 0.05,
+        recovery_rate: float = 0.2,
+        mask_after_recovery: float = 0.4,
+        immunity_time: int = 500,
+        shed_amount: int = 10,
+        masked_shed_amount: int = 1,
+        decay_every: int = 5,
+        decay_amount: float = 1.0,
+        face_cover_rate: float = 0.2,
+        patient_zero_step: int = 100,
+        contact_rate: float = 0.01,
+        contact_radius: float = 1.5,
+        hospital_capacity: int = 0,
+        overload_mortality: float = 1.0,
+        overload_recovery: float = 0.5,
+    ):
+        """
+        Args:
+            infection_scale (float): Virus level at which a susceptible agent
+                is infected for sure, the chance per step is ``virus / infection_scale``.
+            mask_factor (float): Factor of the infection chance of agents with a face cover.
+            hospital_time (int): Steps an infected agent stays in hospital before
+                it dies or recovers; the stay starts over if it does neither.
+            death_rate (float): Chance to die at the end of a hospital stay at age 100,
+                it scales linearly with age.
+            recovery_rate (float): Chance to recover at the end of a hospital stay.
+            mask_after_recovery (float): Chance that a recovered agent starts wearing a face cover.
+            immunity_time (int): Steps a recovered agent stays immune.
+            shed_amount (int): Virus an infected agent sheds on its cell per step.
+            masked_shed_amount (int): Virus shed per step with a face cover.
+            decay_every (int): The virus decays every n-th step.
+            decay_amount (float): Virus removed from every cell per decay, see VirusField.
+            face_cover_rate (float): Share of agents created with a face cover.
+            patient_zero_step (int): Step at which patient zero is infected.
+            contact_rate (float): Chance per step that an infected agent infects a susceptible
+                one within reach, with direct transmission, see ``contacts.contact_infections``.
+            contact_radius (float): Reach of agents without social distancing, in cells;
+                social distancing shrinks it, see ``contacts.DISTANCING_FACTORS``.
+            hospital_capacity (int): Beds per hospital building, agents arriving at a full
+                hospital queue for a bed, see ``facilities.Hospitals``. 0 for no limit, every
+                infected agent on a hospital tile is then treated.
+            overload_mortality (float): With limited beds, the chance to die at the end of
+                a stay is multiplied by ``1 + overload_mortality * load``, where load is
+                the share of taken beds in the hospital.
+            overload_recovery (float): With limited beds, the chance to recover is
+                multiplied by ``1 - overload_recovery * load``.
+        """
+        self.infection_scale = infection_scale
+        self.mask_factor = mask_factor
+        self.hospital_time = hospital_time
+        self.death_rate = death_rate
+        self.recovery_rate = recovery_rate
+        self.mask_after_recovery = mask_after_recovery
+        self.immunity_time = immunity_time
+        self.shed_amount = shed_amount
+        self.masked_shed_amount = masked_shed_amount
+        self.decay_every = decay_every
+        self.decay_amount = decay_amount
+        self.face_cover_rate = face_cover_rate
+        self.patient_zero_step = patient_zero_step
+        self.contact_rate = contact_rate
+        self.contact_radius = contact_radius
+        self.hospital_capacity = hospital_capacity
+        self.overload_mortality = overload_mortality
+        self.overload_recovery = overload_recovery
+        self._validate()
+
+    def _validate(self) -> None:
+        for name in self.PROBABILITIES:
+            if not 0.0 <= getattr(self, name) <= 1.0:
+                raise ValueError(f"{name} must be between 0 and 1, got {getattr(self, name)}")
+        for name in ("hospital_time", "immunity_time", "decay_every"):
+            if getattr(self, name) < 1:
+                raise ValueError(f"{name} must be at least 1, got {getattr(self, name)}")
+        for name in (
+            "shed_amount",
+            "masked_shed_amount",
+            "decay_amount",
+            "patient_zero_step",
+            "contact_radius",
+            "hospital_capacity",
+            "overload_mortality",
+        ):
+            if getattr(self, name) < 0:
+                raise ValueError(f"{name} must not be negative, got {getattr(self, name)}")
+        if self.infection_scale <= 0:
+            raise ValueError(f"infection_scale must be positive, got {self.infection_scale}")
+
+    @classmethod
+    def from_dict(cls, values: dict[str, Any]) -> EpidemicParams:
+        """
+        Parameters from a dict of some of the ``FIELDS``, the rest keep their defaults.
+        Values are converted to the type of their parameter; integers are rounded.
+        """
+        unknown = set(values) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown epidemic parameters: {', '.join(sorted(unknown))}")
+        return cls(**{name: cls.convert(name, value) for name, value in values.items()})
+
+    @classmethod
+    def convert(cls, name: str, value: Any) -> Any:
+        type_ = cls.FIELDS[name]
+        if type_ is int:
+            return int(round(float(value)))
+        return type_(value)
+
+    def replace(self, **changes: Any) -> EpidemicParams:
+        """
+        A copy with some parameters changed.
+        """
+        return self.from_dict({**self.to_dict(), **changes})
+
+    def to_dict(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, EpidemicParams):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        changed = {
+            name: value
+            for name, value in self.to_dict().items()
+            if value != getattr(DEFAULT_PARAMS, name)
+        }
+        return f"EpidemicParams({', '.join(f'{k}={v!r}' for k, v in changed.items())})"
+
+
+DEFAULT_PARAMS = EpidemicParams()
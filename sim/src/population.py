@@ -0,0 +1,388 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterator, Optional
+
+import numpy as np
+
+from sim.src.agents import HumanAgent
+from sim.src.contacts import contact_radii
+from sim.src.facilities import outcome_chances
+from sim.src.params import (
+    ActivityLikelihoods,
+    BuldingType,
+    HumanAgentActions,
+    IllnessStates,
+    SocialDistancingStates,
+)
+from sim.src.schedules import PLACES
+from sim.src.stats import age_group_codes, location_codes
+
+if TYPE_CHECKING:
+    from sim.src.model import CovidModel
+
+
+SUSCEPTIBLE = IllnessStates.SUSCEPTIBLE.value
+INFECTED = IllnessStates.INFECTED.value
+RECOVERED = IllnessStates.RECOVERED.value
+DEAD = IllnessStates.DEAD.value
+
+OUTING_TYPES = (BuldingType.SHOP, BuldingType.LIBRARY, BuldingType.FASTFOOD)
+
+
+class AgentView:
+    """
+    Read-only view of one agent of a ``Population``, with the attributes
+    ``HumanAgent.render`` needs. Meant for rendering and debugging.
+    """
+
+    render = HumanAgent.render
+
+    def __init__(self, population: Population, index: int):
+        self.population = population
+        self.index = index
+
+    @property
+    def unique_id(self) -> int:
+        return self.index + 1
+
+    @property
+    def pos(self) -> tuple[int, int]:
+        return self.population.position(self.index)
+
+    @property
+    def home(self) -> tuple[int, int]:
+        return divmod(int(self.population.home[self.index]), self.population.height)
+
+    @property
+    def status(self) -> IllnessStates:
+        return IllnessStates(int(self.population.status[self.index]))
+
+    @property
+    def face_cover(self) -> bool:
+        return bool(self.population.face_cover[self.index])
+
+    @property
+    def age(self) -> int:
+        return int(self.population.age[self.index])
+
+    @property
+    def is_moving(self) -> bool:
+        return bool(self.population.moving[self.index])
+
+    @property
+    def radius(self) -> float:
+        return float(self.population.radius[self.index])
+
+    @property
+    def color(self) -> tuple[int, int, int]:
+        return tuple(int(c) for c in self.population.color[self.index])
+
+    def __repr__(self) -> str:
+        return f"AgentView({self.unique_id}, pos={self.pos}, status={self.status.name})"
+
+
+class Population:
+    """
+    Struct-of-arrays store of all agents of a model.
+    Holds the same state as a list of ``HumanAgent`` objects, one NumPy column
+    per attribute, and steps all agents with whole-array operations.
+    Positions are flat cell indices ``x * height + y``.
+    """
+
+    def __init__(self, model: CovidModel, n: int):
+        """
+        Args:
+            model (CovidModel): The model the agents are part of.
+            n (int): Number of agents.
+        """
+        self.model = model
+        self.n = n
+        self.width: int = model.width
+        self.height: int = model.height
+        self.routes = model.routes
+
+        index = model.building_index
+        self._building_cells: dict[BuldingType, np.ndarray] = {
+            type_: (tiles[:, 0] * self.height + tiles[:, 1]).astype(np.int32)
+            for type_, tiles in index.tiles.items()
+        }
+        self._hospital = index.mask(BuldingType.HOSPITAL).ravel()
+        # stats.LOCATIONS code of every flat cell
+        self._location = location_codes(index.grid).ravel()
+
+        self._generate()
+
+    def _generate(self) -> None:
+        rng = self.model.streams.generators["demographics"]
+        n = self.n
+
+        self.status = np.full(n, SUSCEPTIBLE, dtype=np.int8)
+        params = self.model.params
+        self.face_cover = rng.random(n) < params.face_cover_rate
+        self.social_distance = rng.integers(
+            1, len(SocialDistancingStates) + 1, n, dtype=np.int8
+        )
+        self.vaccinated = rng.random(n) < 0.5
+        self.age = rng.integers(10, 101, n, dtype=np.int16)
+        self.age_group = age_group_codes(self.age)
+        active = rng.integers(0, len(ActivityLikelihoods), n)
+        self.go_out_probability = np.array(
+            [
+                table.count(HumanAgentActions.GO_OUT) / len(table)
+                for table in map(
+                    HumanAgent.determine_likelihood_of_mooving, ActivityLikelihoods
+                )
+            ],
+            dtype=np.float64,
+        )[active]
+        self.active = active.astype(np.int8) + 1
+
+        houses = self._building_cells[BuldingType.HOUSE]
+        self.home = houses[rng.integers(0, len(houses), n)]
+        self.cell = self.home.copy()
+
+        self.infection_time = np.zeros(n, dtype=np.int32)
+        self.hospital_time = np.zeros(n, dtype=np.int32)
+        self.recovered_time = np.zeros(n, dtype=np.int32)
+        self.likelihood_of_death = params.death_rate * (self.age / 100)
+        self.likelihood_of_recovery = np.full(n, params.recovery_rate)
+
+        self.moving = np.zeros(n, dtype=bool)
+        self.destination = np.full(n, -1, dtype=np.int32)
+        self.route = np.full(n, -1, dtype=np.int32)
+        self.cursor = np.zeros(n, dtype=np.int32)
+
+        self.contact_radius = contact_radii(self.social_distance, params)
+
+        self.radius = 0.3 + (self.age / 100) * 0.7
+        self.color = rng.integers(0, 129, (n, 3), dtype=np.uint8)
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.cell // self.height
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.cell % self.height
+
+    @property
+    def location(self) -> np.ndarray:
+        """
+        ``stats.LOCATIONS`` code of the cell every agent stands on.
+        """
+        return self._location[self.cell]
+
+    def position(self, index: int) -> tuple[int, int]:
+        return divmod(int(self.cell[index]), self.height)
+
+    def view(self, index: int) -> AgentView:
+        return AgentView(self, index)
+
+    def views(self) -> Iterator[AgentView]:
+        for index in range(self.n):
+            yield AgentView(self, index)
+
+    def status_counts(self) -> dict[IllnessStates, int]:
+        counts = np.bincount(self.status, minlength=DEAD + 1)
+        return {status: int(counts[status.value]) for status in IllnessStates}
+
+    def set_status(self, agents: np.ndarray, status: int) -> None:
+        """
+        Change the illness state of the given agents and let the model know.
+        """
+        if len(agents) == 0:
+            return
+        old = self.status[agents]
+        self.status[agents] = status
+        self.model.on_status_changes(
+            agents + 1,
+            self.cell[agents] // self.height,
+            self.cell[agents] % self.height,
+            old,
+            status,
+        )
+
+    def infect_patient_zero(self) -> bool:
+        """
+        Infect one random agent without a face cover.
+        """
+        eligible = np.flatnonzero(~self.face_cover)
+        if len(eligible) == 0:
+            return False
+        index = self.model.streams.patient_zero.choice(eligible)
+        self.set_status(np.array([index]), INFECTED)
+        return True
+
+    def _destinations(
+        self, agents: np.ndarray, places: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        # mirrors DestinationGenerator: infected go to hospital, the others to
+        # the planned place (schedules.PLACES index) when given, otherwise agents
+        # away from home go home and the rest pick a random place to go out to
+        rng = self.model.streams.generators["mobility"]
+        destinations = self.home[agents].copy()
+
+        infected = self.status[agents] == INFECTED
+        destinations[infected] = self._building_tiles(
+            BuldingType.HOSPITAL, agents[infected], rng
+        )
+        if places is not None:
+            for place, type_ in enumerate(PLACES):
+                if type_ == BuldingType.HOUSE:
+                    continue
+                chosen = np.flatnonzero(~infected & (places == place))
+                destinations[chosen] = self._building_tiles(type_, agents[chosen], rng)
+            return destinations
+
+        outing = ~infected & (self.cell[agents] == self.home[agents])
+        kinds = rng.integers(0, len(OUTING_TYPES), outing.sum())
+        outing_idx = np.flatnonzero(outing)
+        for kind, type_ in enumerate(OUTING_TYPES):
+            chosen = outing_idx[kinds == kind]
+            destinations[chosen] = self._building_tiles(type_, agents[chosen], rng)
+        return destinations
+
+    def _building_tiles(
+        self, type_: BuldingType, agents: np.ndarray, rng: np.random.Generator
+    ) -> np.ndarray:
+        # a tile of the building type for every agent, random or the nearest one
+        # like DestinationGenerator; agents that cannot reach one stay where they are
+        if self.model.destinations == "nearest":
+            tiles = self.model.path_finder.nearest_cells(type_)[self.cell[agents]]
+            return np.where(tiles >= 0, tiles, self.cell[agents])
+        cells = self._building_cells[type_]
+        return cells[rng.integers(0, len(cells), len(agents))]
+
+    def step(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Advance all agents by one step, following the same rules as ``HumanAgent.step``.
+        Returns:
+            Flat cells and amounts of the virus shed by infected agents.
+        """
+        streams = self.model.streams
+        params = self.model.params
+        alive = self.status != DEAD
+        span = self.model.span
+
+        with span("population.move"):
+            # actions realted to movement
+            moving = self.moving & alive
+            idle = alive & ~self.moving
+
+            walkers = np.flatnonzero(moving)
+            old_cells = self.cell[walkers]
+            self.cell[walkers] = self.routes.cells[
+                self.routes.starts[self.route[walkers]] + self.cursor[walkers]
+            ]
+            self.model.counters.moves(
+                self.status[walkers],
+                self._location[old_cells],
+                self._location[self.cell[walkers]],
+            )
+            self.cursor[walkers] += 1
+            arrived = walkers[self.cell[walkers] == self.destination[walkers]]
+            self.moving[arrived] = False
+            self.destination[arrived] = -1
+
+        with span("population.go_out"):
+            schedule = self.model.daily_schedule
+            if schedule is not None:
+                # agents still walking keep their trip until they arrive
+                due = schedule.due(self.model.steps_elapsed)
+                due = due[idle[due]]
+                places = schedule.take(due, self.model.steps_elapsed)
+                leaving = due[places >= 0]
+                places = places[places >= 0]
+                go_out = np.zeros(self.n, dtype=bool)
+                go_out[leaving] = True
+            else:
+                go_out = idle & (streams.uniforms("mobility", self.n) < self.go_out_probability)
+                leaving = np.flatnonzero(go_out)
+                places = None
+            hospitals = self.model.hospitals
+            if hospitals is not None and len(leaving):
+                # patients keep their bed or their place in the queue
+                keep = (hospitals.bed[leaving] < 0) & (hospitals.waiting[leaving] < 0)
+                go_out[leaving[~keep]] = False
+                leaving = leaving[keep]
+                if places is not None:
+                    places = places[keep]
+            stay = idle & ~go_out
+            self.destination[stay] = -1
+
+            if len(leaving):
+                destinations = self._destinations(leaving, places)
+                routes = self.routes.routes(self.cell[leaving], destinations)
+                self.destination[leaving] = destinations
+                self.route[leaving] = routes
+                self.cursor[leaving] = 0
+                self.moving[leaving] = self.routes.lengths[routes] > 0
+
+            if hospitals is not None:
+                # infected agents that reached a hospital, or stand in the one they were sent to
+                arrivals = np.concatenate((arrived, leaving[~self.moving[leaving]]))
+                for index in arrivals[self.status[arrivals] == INFECTED].tolist():
+                    hospitals.arrive(index, int(self.cell[index]))
+
+        if self.model.virus_transmission:
+            with span("population.infection"):
+                # infection of susceptible agents
+                infection_draws = streams.uniforms("infection", self.n)
+                susceptible = np.flatnonzero(self.status == SUSCEPTIBLE)
+                virus_level = self.model.virus.data.ravel()[self.cell[susceptible]]
+                chance = virus_level / params.infection_scale
+                chance[self.face_cover[susceptible]] *= params.mask_factor
+                self.set_status(susceptible[infection_draws[susceptible] < chance], INFECTED)
+
+        with span("population.illness"):
+            # illness progression
+            infected = self.status == INFECTED
+            self.infection_time[infected] += 1
+            if self.model.hospitals is not None:
+                in_hospital = infected & (self.model.hospitals.bed >= 0)
+            else:
+                in_hospital = infected & self._hospital[self.cell]
+            self.hospital_time[in_hospital] += 1
+            self.hospital_time[infected & ~in_hospital] = 0
+
+            treated = np.flatnonzero(in_hospital & (self.hospital_time >= params.hospital_time))
+            if len(treated):
+                rng = streams.generators["infection"]
+                death_chance = self.likelihood_of_death[treated]
+                recovery_chance = self.likelihood_of_recovery[treated]
+                if self.model.hospitals is not None:
+                    # both by the load before the first of them leaves
+                    death_chance, recovery_chance = outcome_chances(
+                        death_chance,
+                        recovery_chance,
+                        self.model.hospitals.load(treated),
+                        params,
+                    )
+                dies = rng.random(len(treated)) < death_chance
+                dead = treated[dies]
+                self.set_status(dead, DEAD)
+                self.moving[dead] = False
+                self.destination[dead] = -1
+
+                survivors = treated[~dies]
+                recovers = survivors[
+                    rng.random(len(survivors)) < recovery_chance[~dies]
+                ]
+                self.set_status(recovers, RECOVERED)
+                masks = recovers[
+                    ~self.face_cover[recovers] & (rng.random(len(recovers)) < params.mask_after_recovery)
+                ]
+                self.face_cover[masks] = True
+                self.recovered_time[recovers] = 0
+
+            # immunity wears off
+            recovered = self.status == RECOVERED
+            self.recovered_time[recovered] += 1
+            expired = np.flatnonzero(recovered & (self.recovered_time >= params.immunity_time))
+            self.set_status(expired, SUSCEPTIBLE)
+            self.recovered_time[expired] = 0
+
+        shedding = np.flatnonzero(self.status == INFECTED)
+        amounts = np.where(
+            self.face_cover[shedding], params.masked_shed_amount, params.shed_amount
+        )
+        return self.cell[shedding], amounts
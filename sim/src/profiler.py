@@ -0,0 +1,209 @@
+from __future__ import annotations
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Optional
+
+
+NO_SPAN = nullcontext()
+
+
+class StepProfile:
+    """
+    Everything measured during one model step.
+    """
+
+    __slots__ = ("step", "start", "end", "spans", "times", "counts")
+
+    def __init__(self, step: int, start: int):
+        self.step = step
+        self.start = start  # ns since the profiler was created
+        self.end = start
+        # (name, start, end) in ns, in the order they were closed
+        self.spans: list[tuple[str, int, int]] = []
+        # seconds per span or section name, sections being timed without a span
+        self.times: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) / 1e9
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> _Span:
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.profiler._close_span(self.name, self.start, time.perf_counter_ns())
+
+
+class Profiler:
+    """
+    Opt-in instrumentation of the model step.
+
+    Phases are timed with named spans (``with profiler.span("decay"):``), which
+    also end up in the Chrome trace. Code run once per agent, where a trace
+    event per call would be far too many, adds its time to a per-step total
+    with ``add_time`` instead. ``count`` keeps per-step counters such as the
+    number of BFS nodes expanded.
+
+    The model only calls into a profiler while one is enabled, see
+    ``CovidModel.enable_profiling``; anything measured outside of a step is dropped.
+    """
+
+    def __init__(self, keep_steps: Optional[int] = 1000):
+        """
+        Args:
+            keep_steps (Optional[int]): Keep the measurements of this many most recent steps,
+                all of them when None.
+        """
+        self.steps: deque[StepProfile] = deque(maxlen=keep_steps)
+        self._origin = time.perf_counter_ns()
+        self._current: Optional[StepProfile] = None
+
+    def step_started(self, step: int) -> None:
+        self._current = StepProfile(step, time.perf_counter_ns() - self._origin)
+
+    def step_finished(self) -> None:
+        current = self._current
+        if current is None:
+            return
+        current.end = time.perf_counter_ns() - self._origin
+        self.steps.append(current)
+        self._current = None
+
+    def span(self, name: str) -> _Span:
+        return _Span(self, name)
+
+    def _close_span(self, name: str, start: int, end: int) -> None:
+        current = self._current
+        if current is None:
+            return
+        current.spans.append((name, start - self._origin, end - self._origin))
+        current.times[name] = current.times.get(name, 0.0) + (end - start) / 1e9
+
+    def add_time(self, name: str, seconds: float) -> None:
+        current = self._current
+        if current is not None:
+            current.times[name] = current.times.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        current = self._current
+        if current is not None:
+            current.counts[name] = current.counts.get(name, 0) + n
+
+    @property
+    def last(self) -> Optional[StepProfile]:
+        """
+        The most recent finished step.
+        """
+        return self.steps[-1] if self.steps else None
+
+    def names(self) -> tuple[list[str], list[str]]:
+        """
+        All time and counter names seen in the kept steps, in the order they first appeared.
+        """
+        times: dict[str, None] = {}
+        counts: dict[str, None] = {}
+        for profile in self.steps:
+            times.update(dict.fromkeys(profile.times))
+            counts.update(dict.fromkeys(profile.counts))
+        return list(times), list(counts)
+
+    def totals(self) -> tuple[dict[str, float], dict[str, int]]:
+        """
+        Seconds and counts summed over the kept steps.
+        """
+        times: dict[str, float] = {}
+        counts: dict[str, int] = {}
+        for profile in self.steps:
+            for name, seconds in profile.times.items():
+                times[name] = times.get(name, 0.0) + seconds
+            for name, n in profile.counts.items():
+                counts[name] = counts.get(name, 0) + n
+        return times, counts
+
+    def format_table(self, last: Optional[int] = 20) -> str:
+        """
+        One row per step with the step time and the time of every phase in ms,
+        followed by the counters, for the ``last`` kept steps.
+        """
+        steps = list(self.steps)
+        if last is not None:
+            steps = steps[-last:]
+        time_names, count_names = self.names()
+        header = ["step", "total"] + time_names + count_names
+        rows = [header]
+        for profile in steps:
+            rows.append(
+                [str(profile.step), f"{profile.duration * 1000:.3f}"]
+                + [f"{profile.times.get(name, 0.0) * 1000:.3f}" for name in time_names]
+                + [str(profile.counts.get(name, 0)) for name in count_names]
+            )
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        return "\n".join(
+            "  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows
+        )
+
+    def chrome_trace(self) -> dict:
+        """
+        The kept steps in the Chrome trace event format, to be opened in
+        chrome://tracing or https://ui.perfetto.dev. Steps and spans are
+        complete events, per-agent section times and counters are counter tracks.
+        """
+        events: list[dict] = [
+            {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "CovidModel"}},
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": "step"}},
+        ]
+        for profile in self.steps:
+            events.append(
+                {
+                    "name": "step",
+                    "ph": "X",
+                    "ts": profile.start / 1000,
+                    "dur": (profile.end - profile.start) / 1000,
+                    "pid": 1,
+                    "tid": 1,
+                    "args": {"step": profile.step},
+                }
+            )
+            span_names = set()
+            for name, start, end in profile.spans:
+                span_names.add(name)
+                events.append(
+                    {
+                        "name": name,
+                        "ph": "X",
+                        "ts": start / 1000,
+                        "dur": (end - start) / 1000,
+                        "pid": 1,
+                        "tid": 1,
+                    }
+                )
+            sections = {
+                name: seconds * 1000
+                for name, seconds in profile.times.items()
+                if name not in span_names
+            }
+            if sections:
+                events.append(
+                    {"name": "sections (ms)", "ph": "C", "ts": profile.start / 1000, "pid": 1, "args": sections}
+                )
+            if profile.counts:
+                events.append(
+                    {"name": "counters", "ph": "C", "ts": profile.start / 1000, "pid": 1, "args": dict(profile.counts)}
+                )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+
+COLUMNS: dict[str, np.dtype] = {
+    "step": np.dtype(np.int32),
+    "agent_id": np.dtype(np.int32),
+    "x": np.dtype(np.int16),
+    "y": np.dtype(np.int16),
+    "status": np.dtype(np.int8),
+}
+
+
+class _Frame:
+    __slots__ = ("step", "chunk", "start", "length")
+
+    def __init__(self, step: int, chunk: int, start: int, length: int):
+        self.step = step
+        self.chunk = chunk
+        self.start = start
+        self.length = length
+
+
+class TrajectoryRecorder:
+    """
+    Columnar recorder of agent positions and statuses.
+    Every recorded step (a frame) is appended as one contiguous row range of
+    fixed-width NumPy columns ``COLUMNS``, held in preallocated chunks.
+
+    With ``capacity`` set the recorder becomes a ring buffer of that many rows
+    that drops the oldest frames to make room for new ones, so memory stays bounded.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 1 << 16,
+        capacity: Optional[int] = None,
+        every: int = 1,
+    ):
+        """
+        Args:
+            chunk_size (int): Rows per preallocated chunk.
+            capacity (Optional[int]): Keep at most this many rows, oldest frames first out.
+            every (int): Record every n-th step only.
+        """
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        self.chunk_size = capacity if capacity is not None else chunk_size
+        self.capacity = capacity
+        self.every = every
+        self._chunks: list[dict[str, np.ndarray]] = []
+        self._frames: deque[_Frame] = deque()
+        self._by_step: dict[int, _Frame] = {}
+        self._fill = 0  # rows used in the last chunk
+
+    def __getstate__(self):
+        # pickled with its settings only, a restored recorder starts empty
+        state = self.__dict__.copy()
+        state["_chunks"] = []
+        state["_frames"] = deque()
+        state["_by_step"] = {}
+        state["_fill"] = 0
+        return state
+
+    def __len__(self) -> int:
+        return sum(frame.length for frame in self._frames)
+
+    @property
+    def steps(self) -> list[int]:
+        """
+        The recorded steps that are still held, oldest first.
+        """
+        return [frame.step for frame in self._frames]
+
+    def due(self, step: int) -> bool:
+        return step % self.every == 0
+
+    def _new_chunk(self, rows: int) -> None:
+        self._chunks.append(
+            {name: np.empty(rows, dtype=dtype) for name, dtype in COLUMNS.items()}
+        )
+        self._fill = 0
+
+    def _drop_oldest(self) -> None:
+        frame = self._frames.popleft()
+        del self._by_step[frame.step]
+
+    def _reserve(self, n: int) -> tuple[int, int]:
+        if n == 0:
+            # an empty frame would sit at the head of a ring buffer and stop
+            # the frames behind it from being dropped
+            raise ValueError("A frame must have at least one row")
+        if self.capacity is None:
+            if not self._chunks or self._fill + n > len(self._chunks[-1]["step"]):
+                self._new_chunk(max(self.chunk_size, n))
+            return len(self._chunks) - 1, self._fill
+
+        if n > self.capacity:
+            raise ValueError(f"A frame of {n} rows does not fit in capacity {self.capacity}")
+        if not self._chunks:
+            self._new_chunk(self.capacity)
+        start = self._fill if self._fill + n <= self.capacity else 0
+        # drop every frame that overlaps the rows about to be written
+        while self._frames:
+            oldest = self._frames[0]
+            if oldest.start < start + n and start < oldest.start + oldest.length:
+                self._drop_oldest()
+            elif start == 0 and oldest.start >= self._fill:
+                # wrapping around, the frames at the tail are next in line
+                self._drop_oldest()
+            else:
+                break
+        self._fill = start
+        return 0, start
+
+    def record(self, step: int, agent_id, x, y, status) -> None:
+        """
+        Append one frame. All arguments but ``step`` are arrays with one entry per agent.
+        """
+        if step in self._by_step:
+            raise ValueError(f"Step {step} was already recorded")
+        n = len(agent_id)
+        chunk_index, start = self._reserve(n)
+        chunk = self._chunks[chunk_index]
+        end = start + n
+        chunk["step"][start:end] = step
+        chunk["agent_id"][start:end] = agent_id
+        chunk["x"][start:end] = x
+        chunk["y"][start:end] = y
+        chunk["status"][start:end] = status
+        self._fill = end
+
+        frame = _Frame(step, chunk_index, start, n)
+        self._frames.append(frame)
+        self._by_step[step] = frame
+
+    def _view(self, frame: _Frame) -> dict[str, np.ndarray]:
+        chunk = self._chunks[frame.chunk]
+        end = frame.start + frame.length
+        return {name: column[frame.start:end] for name, column in chunk.items()}
+
+    def latest_frame(self) -> Optional[dict[str, np.ndarray]]:
+        """
+        Views of the columns of the most recent frame, or None if nothing was recorded.
+        """
+        if not self._frames:
+            return None
+        return self._view(self._frames[-1])
+
+    def frame(self, step: int) -> dict[str, np.ndarray]:
+        """
+        Views of the columns of the frame recorded at ``step``.
+        """
+        return self._view(self._by_step[step])
+
+    def columns(self) -> dict[str, np.ndarray]:
+        """
+        All held rows in time order. Returns views when the rows are
+        contiguous in a single chunk, copies otherwise.
+        """
+        if not self._frames:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+        # group consecutive frames that are also consecutive in memory
+        spans: list[list[int]] = []
+        for frame in self._frames:
+            last = spans[-1] if spans else None
+            if last and last[0] == frame.chunk and last[2] == frame.start:
+                last[2] += frame.length
+            else:
+                spans.append([frame.chunk, frame.start, frame.start + frame.length])
+
+        parts = [
+            {name: column[start:end] for name, column in self._chunks[chunk].items()}
+            for chunk, start, end in spans
+        ]
+        if len(parts) == 1:
+            return parts[0]
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+    def to_pandas(self):
+        """
+        All held rows as a pandas DataFrame.
+        """
+        import pandas as pd
+
+        return pd.DataFrame(self.columns(), copy=False)
+
+    def to_arrow(self):
+        """
+        All held rows as a pyarrow Table. Requires the optional pyarrow package.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("to_arrow requires the pyarrow package") from e
+
+        return pa.table(self.columns())
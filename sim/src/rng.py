@@ -0,0 +1,76 @@
+from __future__ import annotations
+import random
+from typing import Optional
+
+import numpy as np
+
+
+class RandomStreams:
+    """
+    Independent, seeded random number streams for one model.
+    Every concern of the simulation draws from its own stream, so changing
+    how often one of them is used does not shift the numbers the others see.
+
+    Every stream is available both as a ``random.Random`` (cheap scalar draws)
+    and as a ``numpy.random.Generator`` (batch draws).
+    """
+
+    CONCERNS = ("mobility", "infection", "demographics", "patient_zero")
+
+    def __init__(self, seed: Optional[int] = None):
+        """
+        Args:
+            seed (Optional[int]): Seed all streams are derived from.
+                A fresh one is taken from the OS when None.
+        """
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.generators: dict[str, np.random.Generator] = {}
+        self.randoms: dict[str, random.Random] = {}
+        for concern, child in zip(
+            self.CONCERNS, self.seed_sequence.spawn(len(self.CONCERNS))
+        ):
+            self.generators[concern] = np.random.default_rng(child)
+            self.randoms[concern] = random.Random(int(child.generate_state(1)[0]))
+
+    @property
+    def seed(self) -> int:
+        """
+        The seed that reproduces these streams.
+        """
+        return self.seed_sequence.entropy
+
+    @property
+    def mobility(self) -> random.Random:
+        return self.randoms["mobility"]
+
+    @property
+    def infection(self) -> random.Random:
+        return self.randoms["infection"]
+
+    @property
+    def demographics(self) -> random.Random:
+        return self.randoms["demographics"]
+
+    @property
+    def patient_zero(self) -> random.Random:
+        return self.randoms["patient_zero"]
+
+    def uniforms(self, concern: str, n: int) -> np.ndarray:
+        """
+        Draw ``n`` uniforms from [0, 1) in one call.
+        """
+        return self.generators[concern].random(n)
+
+    def getstate(self) -> dict:
+        return {
+            concern: (
+                self.randoms[concern].getstate(),
+                self.generators[concern].bit_generator.state,
+            )
+            for concern in self.CONCERNS
+        }
+
+    def setstate(self, state: dict) -> None:
+        for concern, (random_state, generator_state) in state.items():
+            self.randoms[concern].setstate(random_state)
+            self.generators[concern].bit_generator.state = generator_state
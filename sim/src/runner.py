@@ -0,0 +1,103 @@
+from __future__ import annotations
+import csv
+from typing import Optional
+
+from maps.map import Map
+from sim.src.model import CovidModel
+from sim.src.params import EpidemicParams, IllnessStates
+from sim.src.sinks import ResultsSink
+
+
+SERIES_COLUMNS = (
+    "step", "susceptible", "infected", "recovered", "dead", "hospitalized", "waiting"
+)
+
+
+def simulate(
+    map: Map,
+    n_agents: int,
+    steps: int,
+    seed: Optional[int] = None,
+    sink: Optional[ResultsSink] = None,
+    params: Optional[EpidemicParams] = None,
+    transmission: str = "virus",
+    destinations: str = "random",
+    mobility: str = "random",
+    scheduling: str = "step",
+) -> dict[str, list[int]]:
+    """
+    Run a single simulation without rendering.
+    Args:
+        map (Map): The map to simulate on, usually loaded with ``headless=True``.
+        n_agents (int): Number of agents.
+        steps (int): Number of steps to run.
+        seed (Optional[int]): Seed for the model's random number generators.
+        sink (Optional[ResultsSink]): Where to stream results to during the run.
+            It is flushed, but not closed, at the end.
+        params (Optional[EpidemicParams]): Constants of the epidemic, the defaults when None.
+        transmission (str): "virus", "contact" or "both", see CovidModel.
+        destinations (str): "random" or "nearest" building tiles, see CovidModel.
+        mobility (str): "random" or "schedule", see CovidModel.
+        scheduling (str): "step" or "event", see CovidModel.
+    Returns:
+        The per-step number of agents in each illness state, in hospital and
+        waiting for a bed, see ``CovidModel.hospital_counts``, keyed by the
+        names in ``SERIES_COLUMNS``.
+    """
+    model = CovidModel(
+        N=n_agents,
+        width=map.width,
+        height=map.height,
+        map=map,
+        seed=seed,
+        params=params,
+        transmission=transmission,
+        destinations=destinations,
+        mobility=mobility,
+        scheduling=scheduling,
+    )
+    return run_model(model, steps, sink)
+
+
+def run_model(
+    model: CovidModel,
+    steps: int,
+    sink: Optional[ResultsSink] = None,
+) -> dict[str, list[int]]:
+    """
+    Step an existing model, e.g. one restored from a checkpoint, like ``simulate`` does.
+    Args:
+        model (CovidModel): The model to step.
+        steps (int): Number of steps to run.
+        sink (Optional[ResultsSink]): Where to stream results to during the run.
+            It is flushed, but not closed, at the end.
+    Returns:
+        The per-step counts, as returned by ``simulate``.
+    """
+    model.attach_sink(sink)
+
+    series: dict[str, list[int]] = {column: [] for column in SERIES_COLUMNS}
+    for _ in range(steps):
+        model.step()
+        counts = model.status_counts()
+        series["step"].append(model.steps_elapsed)
+        series["susceptible"].append(counts[IllnessStates.SUSCEPTIBLE])
+        series["infected"].append(counts[IllnessStates.INFECTED])
+        series["recovered"].append(counts[IllnessStates.RECOVERED])
+        series["dead"].append(counts[IllnessStates.DEAD])
+        hospitalized, waiting = model.hospital_counts()
+        series["hospitalized"].append(hospitalized)
+        series["waiting"].append(waiting)
+    if sink is not None:
+        sink.flush()
+    return series
+
+
+def write_series(series: dict[str, list[int]], path: str) -> None:
+    """
+    Write a series returned by ``simulate`` to a CSV file.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SERIES_COLUMNS)
+        writer.writerows(zip(*(series[column] for column in SERIES_COLUMNS)))
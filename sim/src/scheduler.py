@@ -0,0 +1,263 @@
+from __future__ import annotations
+import math
+from collections import defaultdict
+from typing import TYPE_CHECKING, Iterable, Optional
+
+import numpy as np
+
+from sim.src.agents import HumanAgent
+from sim.src.params import BuldingType, HumanAgentActions, IllnessStates
+
+if TYPE_CHECKING:
+    from sim.src.model import CovidModel
+
+
+class EventScheduler:
+    """
+    Steps only the agents that have something to do in a step.
+
+    Walking agents are stepped every step. An idle agent sleeps until its next
+    decision to go out, or until one of its illness timers expires (the end of
+    the hospital stay or of immunity), whichever comes first. Staying in place
+    with probability 1 - p every step until going out is the same as going out
+    after a geometrically distributed number of steps, so that number is drawn
+    once instead of a decision every step. With a DailySchedule the next
+    decision is simply the agent's next planned trip. The timers a sleeping
+    agent skipped are advanced when it wakes up.
+
+    Sleeping susceptible agents only need an infection check while their cell
+    holds virus, so every step the contaminated cells are swept and the
+    susceptible agents on them woken up. Infections by direct contact are
+    found by the model for sleeping agents too. An agent waiting for a
+    hospital bed sleeps until the bed is freed, see ``state_changed``. Dead
+    agents leave the schedule.
+
+    Wake-ups of sleeping agents are kept in a calendar queue, a list of
+    agents per step, walking agents in a set of their own.
+    """
+
+    def __init__(self, model: CovidModel, agents: Iterable[HumanAgent]):
+        """
+        Args:
+            model (CovidModel): The model the agents are part of.
+            agents (Iterable[HumanAgent]): The agents to schedule.
+        """
+        self.model = model
+        self._buckets: defaultdict[int, list[HumanAgent]] = defaultdict(list)
+        self._wake_at: dict[HumanAgent, int] = {}
+        # insertion ordered sets, keep the order agents are stepped in deterministic
+        self._walking: dict[HumanAgent, None] = {}
+        self._decision_at: dict[HumanAgent, int] = {}
+        self._last_step: dict[HumanAgent, int] = {}
+        self.infected: dict[HumanAgent, None] = {}
+        self._stepping: Optional[HumanAgent] = None
+        # scheduled agents per cell, for the sweep; the empty_mask of a mesa
+        # MultiGrid is not kept up to date as agents move
+        self._occupants = np.zeros((model.width, model.height), dtype=np.int32)
+
+        now = model.steps_elapsed
+        for agent in agents:
+            self._last_step[agent] = now
+            self._occupants[agent.pos] += 1
+            if agent.status == IllnessStates.INFECTED:
+                self.infected[agent] = None
+            self._reschedule(agent)
+
+    def __len__(self) -> int:
+        return len(self._last_step)
+
+    def __contains__(self, agent: HumanAgent) -> bool:
+        return agent in self._last_step
+
+    def wake_at(self, agent: HumanAgent) -> Optional[int]:
+        """
+        The step the agent is stepped next in, None if it left the schedule.
+        """
+        if agent in self._walking:
+            return self._last_step[agent] + 1
+        return self._wake_at.get(agent)
+
+    def _draw_decision(self, agent: HumanAgent, after: int) -> int:
+        # number of steps until the first GO_OUT, geometric with p = go_out_probability
+        u = self.model.streams.mobility.random()
+        return after + int(math.log(1.0 - u) / math.log(1.0 - agent.go_out_probability)) + 1
+
+    def _next_decision(self, agent: HumanAgent, after: int) -> Optional[int]:
+        # the next trip of a DailySchedule, or a random decision to go out
+        schedule = self.model.daily_schedule
+        if schedule is None:
+            return self._draw_decision(agent, after)
+        departure = schedule.next_departure(agent.unique_id - 1)
+        if departure is None:
+            return None
+        # a trip that came due while the agent was walking starts right away
+        return max(departure, after + 1)
+
+    def replan(self) -> None:
+        """
+        Take the trips of the idle agents from the day the DailySchedule just planned.
+        """
+        for agent in list(self._last_step):
+            if agent not in self._walking:
+                self._decision_at.pop(agent, None)
+                self._reschedule(agent)
+
+    def _reschedule(self, agent: HumanAgent) -> None:
+        if agent.status == IllnessStates.DEAD:
+            self._remove(agent)
+            return
+
+        if agent.is_moving:
+            if agent not in self._walking:
+                self._walking[agent] = None
+                self._wake_at.pop(agent, None)
+                self._decision_at.pop(agent, None)
+            return
+        self._walking.pop(agent, None)
+
+        last = self._last_step[agent]
+        decision = self._decision_at.get(agent)
+        if decision is None or decision <= last:
+            decision = self._next_decision(agent, last)
+            if decision is None:
+                self._decision_at.pop(agent, None)
+            else:
+                self._decision_at[agent] = decision
+        wake = decision
+        timer = agent.steps_to_next_timer()
+        if timer is not None:
+            wake = last + timer if wake is None else min(wake, last + timer)
+        if wake is None:
+            # nothing to do until the next day is planned, see replan
+            self._wake_at.pop(agent, None)
+            return
+
+        if self._wake_at.get(agent) != wake:
+            # an earlier entry of the agent is skipped when its step comes
+            self._wake_at[agent] = wake
+            self._buckets[wake].append(agent)
+
+    def _remove(self, agent: HumanAgent) -> None:
+        if agent in self._last_step:
+            self._occupants[agent.pos] -= 1
+        self._wake_at.pop(agent, None)
+        self._walking.pop(agent, None)
+        self._decision_at.pop(agent, None)
+        self._last_step.pop(agent, None)
+        self.infected.pop(agent, None)
+
+    def sync(self, agent: HumanAgent, now: int) -> None:
+        """
+        Advance the timers of a sleeping agent up to the step before ``now``,
+        before changing its state from outside of its own step.
+        """
+        skipped = now - self._last_step[agent] - 1
+        if skipped > 0:
+            agent.catch_up(skipped)
+            self._last_step[agent] = now - 1
+
+    def _wake(
+        self,
+        agent: HumanAgent,
+        now: int,
+        action: HumanAgentActions,
+        planned: Optional[BuldingType] = None,
+    ) -> None:
+        self.sync(agent, now)
+        self._last_step[agent] = now
+        self._stepping = agent
+        agent.step(action, planned=planned)
+        self._stepping = None
+        self._reschedule(agent)
+
+    def _go_out(self, agent: HumanAgent, now: int) -> None:
+        schedule = self.model.daily_schedule
+        if schedule is None:
+            self._wake(agent, now, HumanAgentActions.GO_OUT)
+            return
+        planned = schedule.take_one(agent.unique_id - 1, now)
+        if planned is None:
+            self._wake(agent, now, HumanAgentActions.STAY_IN_PLACE)
+        else:
+            self._wake(agent, now, HumanAgentActions.GO_OUT, planned)
+
+    def moved(self, agent: HumanAgent, old_pos: tuple[int, int]) -> None:
+        """
+        Called by the model after every move of an agent on the grid.
+        """
+        if agent in self._last_step:
+            self._occupants[old_pos] -= 1
+            self._occupants[agent.pos] += 1
+
+    def status_changed(self, agent: HumanAgent, old: IllnessStates, new: IllnessStates) -> None:
+        """
+        Called by the model whenever the illness state of an agent changes.
+        """
+        if new == IllnessStates.INFECTED:
+            self.infected[agent] = None
+        else:
+            self.infected.pop(agent, None)
+        self.state_changed(agent)
+
+    def state_changed(self, agent: HumanAgent) -> None:
+        """
+        Called by the model after changing the state of an agent, so an agent
+        changed from outside of its own step can wake up earlier.
+        """
+        if agent is not self._stepping and agent in self._last_step:
+            self._reschedule(agent)
+
+    def step(self, now: int) -> tuple[list[tuple[int, int]], list[int]]:
+        """
+        Step every agent that is due at step ``now``.
+        Returns:
+            Positions and amounts of the virus shed by infected agents.
+        """
+        span = self.model.span
+        with span("scheduler.walkers"):
+            # walkers are stepped every step, so they have nothing to catch up on
+            last_step = self._last_step
+            for agent in list(self._walking):
+                last_step[agent] = now
+                self._stepping = agent
+                agent.step(HumanAgentActions.STAY_IN_PLACE)
+                if not agent.is_moving or agent.status == IllnessStates.DEAD:
+                    self._reschedule(agent)
+            self._stepping = None
+
+        with span("scheduler.due"):
+            for agent in self._buckets.pop(now, ()):
+                if self._wake_at.get(agent) != now or self._last_step[agent] == now:
+                    continue
+                if self._decision_at.get(agent) == now:
+                    self._go_out(agent, now)
+                else:
+                    self._wake(agent, now, HumanAgentActions.STAY_IN_PLACE)
+
+        if self.model.virus_transmission:
+            with span("scheduler.sweep"):
+                # infection checks of the sleeping susceptible agents standing on virus
+                grid = self.model.grid
+                xs, ys = np.nonzero((self.model.virus.data > 0.0) & (self._occupants > 0))
+                for x, y in zip(xs.tolist(), ys.tolist()):
+                    for agent in list(grid[x, y]):
+                        # every sleeping agent, including those with no
+                        # wake-up pending until the next day is planned
+                        if (
+                            agent.status == IllnessStates.SUSCEPTIBLE
+                            and agent in self._last_step
+                            and agent not in self._walking
+                            and self._last_step[agent] != now
+                        ):
+                            self._wake(agent, now, HumanAgentActions.STAY_IN_PLACE)
+
+        shed_positions = []
+        shed_amounts = []
+        params = self.model.params
+        for agent in self.infected:
+            # leave some virus on the ground
+            shed_positions.append(agent.pos)
+            shed_amounts.append(
+                params.masked_shed_amount if agent.face_cover else params.shed_amount
+            )
+        return shed_positions, shed_amounts
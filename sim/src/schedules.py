@@ -0,0 +1,178 @@
+from __future__ import annotations
+from typing import Optional
+
+import numpy as np
+
+from sim.src.params import ActivityLikelihoods, BuldingType
+
+
+# steps in a simulated day
+DAY_LENGTH = 600
+# places a trip can lead to, trips store their index in this tuple
+PLACES = (
+    BuldingType.HOUSE,
+    BuldingType.SHOP,
+    BuldingType.LIBRARY,
+    BuldingType.FASTFOOD,
+)
+# the day of an agent of every activity level, as (departure time as a share
+# of the day, where to) legs; every outing ends by going home
+ARCHETYPES: dict[ActivityLikelihoods, tuple[tuple[float, BuldingType], ...]] = {
+    ActivityLikelihoods.LOW: (
+        (0.40, BuldingType.SHOP),
+        (0.55, BuldingType.HOUSE),
+    ),
+    ActivityLikelihoods.MEDIUM: (
+        (0.25, BuldingType.LIBRARY),
+        (0.40, BuldingType.HOUSE),
+        (0.60, BuldingType.SHOP),
+        (0.75, BuldingType.HOUSE),
+    ),
+    ActivityLikelihoods.HIGH: (
+        (0.20, BuldingType.LIBRARY),
+        (0.35, BuldingType.FASTFOOD),
+        (0.50, BuldingType.HOUSE),
+        (0.65, BuldingType.SHOP),
+        (0.80, BuldingType.HOUSE),
+    ),
+}
+# standard deviation of a departure around its planned time, as a share of the day
+DEPARTURE_SPREAD = 0.04
+
+# departure time of the legs past the last one of an agent
+_NEVER = np.iinfo(np.int64).max
+
+
+class DailySchedule:
+    """
+    Daily activity plans of all agents of a model, replacing the per-step
+    decision to go out.
+
+    At the start of every day the trips of all agents are planned in one batch:
+    the legs of their activity level's archetype, every departure drawn around
+    its planned time. Trips are then taken from a queue sorted by departure
+    time, so the cost of mobility is proportional to the number of trips, not
+    to agents times steps. A trip due while its agent is still walking waits
+    until the agent arrives; when several are due, the agent takes the latest.
+
+    Agents are identified by their index, ``unique_id - 1`` for HumanAgent
+    objects and the row for a Population.
+    """
+
+    def __init__(
+        self,
+        activity: np.ndarray,
+        rng: np.random.Generator,
+        day_length: int = DAY_LENGTH,
+    ):
+        """
+        Args:
+            activity (np.ndarray): ActivityLikelihoods value of every agent.
+            rng (np.random.Generator): Stream to draw the departure times from.
+            day_length (int): Steps in a simulated day.
+        """
+        self.n = len(activity)
+        self.activity = np.asarray(activity)
+        self.rng = rng
+        self.day_length = day_length
+        self.day = -1
+        width = max(len(legs) for legs in ARCHETYPES.values()) + 1
+        # departure step and PLACES index of every leg of every agent, by
+        # departure; the legs past the last one depart never
+        self.departures = np.full((self.n, width), _NEVER, dtype=np.int64)
+        self.places = np.full((self.n, width), -1, dtype=np.int8)
+        # index of the next leg of every agent
+        self.next_leg = np.zeros(self.n, dtype=np.int64)
+        # all legs of the day by departure, and how many of them were handed out
+        self._queue_times = np.zeros(0, dtype=np.int64)
+        self._queue_agents = np.zeros(0, dtype=np.int64)
+        self._queued = 0
+        # agents with a leg that is due
+        self._pending = np.zeros(0, dtype=np.int64)
+
+    def plan_day(self, day: int) -> None:
+        """
+        Draw the trips of all agents for ``day``, which covers the steps
+        ``day * day_length`` to ``(day + 1) * day_length - 1``. Trips left from
+        the day before are dropped.
+        """
+        start = day * self.day_length
+        self.day = day
+        self.departures.fill(_NEVER)
+        self.places.fill(-1)
+        self.next_leg.fill(0)
+        for level, legs in ARCHETYPES.items():
+            agents = np.flatnonzero(self.activity == level.value)
+            if len(agents) == 0:
+                continue
+            shares = np.array([share for share, _ in legs])
+            places = np.array([PLACES.index(place) for _, place in legs], dtype=np.int8)
+            noise = self.rng.normal(0.0, DEPARTURE_SPREAD, (len(agents), len(legs)))
+            times = start + np.rint((shares + noise) * self.day_length).astype(np.int64)
+            times = np.clip(times, start + 1, start + self.day_length - 1)
+            # a leg may be drawn before the one planned ahead of it, keep their order
+            times = np.maximum.accumulate(times, axis=1)
+            self.departures[agents, :len(legs)] = times
+            self.places[agents, :len(legs)] = places
+
+        legs = np.flatnonzero(self.departures != _NEVER)
+        times = self.departures.ravel()[legs]
+        order = np.argsort(times, kind="stable")
+        self._queue_times = times[order]
+        self._queue_agents = legs[order] // self.departures.shape[1]
+        self._queued = 0
+        self._pending = np.zeros(0, dtype=np.int64)
+
+    def advance(self, now: int) -> bool:
+        """
+        Plan the day step ``now`` falls in, if not planned yet.
+        Returns:
+            Whether a new day was planned.
+        """
+        day = now // self.day_length
+        if day == self.day:
+            return False
+        self.plan_day(day)
+        return True
+
+    def due(self, now: int) -> np.ndarray:
+        """
+        Indices of the agents with a trip due at step ``now``, in order.
+        """
+        end = int(np.searchsorted(self._queue_times, now, side="right"))
+        if end > self._queued:
+            self._pending = np.union1d(self._pending, self._queue_agents[self._queued:end])
+            self._queued = end
+        return self._pending
+
+    def take(self, agents: np.ndarray, now: int) -> np.ndarray:
+        """
+        Start the trips of the given agents that are due at step ``now``.
+        Returns:
+            The PLACES index of the latest due leg of every agent, -1 for agents with none.
+        """
+        rows = self.departures[agents]
+        reached = (rows <= now).sum(axis=1)
+        taken = reached > self.next_leg[agents]
+        places = np.where(
+            taken, self.places[agents, np.maximum(reached - 1, 0)], -1
+        ).astype(np.int8)
+        self.next_leg[agents] = np.maximum(self.next_leg[agents], reached)
+        pending = self._pending
+        if len(pending):
+            self._pending = pending[self.departures[pending, self.next_leg[pending]] <= now]
+        return places
+
+    def take_one(self, agent: int, now: int) -> Optional[BuldingType]:
+        """
+        ``take`` for one agent, the place of its trip or None.
+        """
+        place = int(self.take(np.array([agent]), now)[0])
+        return PLACES[place] if place >= 0 else None
+
+    def next_departure(self, agent: int) -> Optional[int]:
+        """
+        Step of the next trip of the agent today, None if it has no trips left.
+        """
+        departure = int(self.departures[agent, self.next_leg[agent]])
+        return departure if departure != _NEVER else None
@@ -0,0 +1,209 @@
+from __future__ import annotations
+import csv
+import os
+import warnings
+from abc import ABC, abstractmethod
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+TABLES: dict[str, tuple[str, ...]] = {
+    "series": (
+        "step", "susceptible", "infected", "recovered", "dead", "hospitalized", "waiting"
+    ),
+    "trajectories": ("step", "agent_id", "x", "y", "status"),
+    "events": ("step", "agent_id", "x", "y", "from_status", "to_status"),
+}
+
+
+def existing_results(directory: str) -> list[str]:
+    """
+    Tables of an earlier run in ``directory``, as CSV files or Parquet datasets.
+    """
+    found = []
+    for table in TABLES:
+        if os.path.isfile(os.path.join(directory, f"{table}.csv")):
+            found.append(f"{table}.csv")
+        dataset = os.path.join(directory, table)
+        if os.path.isdir(dataset) and os.listdir(dataset):
+            found.append(table)
+    return found
+
+
+class ResultsSink(ABC):
+    """
+    Buffered writer of simulation results.
+    Rows are collected per table in memory and written out in chunks of
+    ``chunk_rows``, so a run of any length keeps a constant amount of memory.
+    Every chunk is complete on disk as soon as it is written, which allows
+    reading the results while the run is still going.
+
+    Tables and their columns are listed in ``TABLES``. A directory holding
+    the tables of an earlier run is refused instead of mixed with them.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        chunk_rows: int = 10_000,
+        trajectories_every: Optional[int] = None,
+        events: bool = True,
+    ):
+        """
+        Args:
+            directory (str): Directory the tables are written to, created if missing.
+            chunk_rows (int): Rows buffered per table before they are written out.
+            trajectories_every (Optional[int]): Write agent positions every n-th step,
+                never when None.
+            events (bool): Write a row for every illness state change.
+        """
+        found = existing_results(directory)
+        if found:
+            raise FileExistsError(
+                f"{directory} already holds results of an earlier run: {', '.join(found)}"
+            )
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.trajectories_every = trajectories_every
+        self.events = events
+        os.makedirs(directory, exist_ok=True)
+
+        self._rows: dict[str, list[tuple]] = {table: [] for table in TABLES}
+        self._blocks: dict[str, list[dict[str, np.ndarray]]] = {
+            table: [] for table in TABLES
+        }
+        self._buffered: dict[str, int] = {table: 0 for table in TABLES}
+        self.closed = False
+
+    def wants_trajectories(self, step: int) -> bool:
+        return self.trajectories_every is not None and step % self.trajectories_every == 0
+
+    def append(self, table: str, row: Sequence) -> None:
+        """
+        Buffer a single row, given in the column order of ``TABLES[table]``.
+        """
+        self._rows[table].append(tuple(row))
+        self._buffered[table] += 1
+        if self._buffered[table] >= self.chunk_rows:
+            self._flush_table(table)
+
+    def extend(self, table: str, columns: dict[str, np.ndarray]) -> None:
+        """
+        Buffer many rows given as one array per column.
+        """
+        self._move_rows_to_blocks(table)
+        n = len(next(iter(columns.values())))
+        if n == 0:
+            return
+        self._blocks[table].append(
+            {name: np.asarray(columns[name]) for name in TABLES[table]}
+        )
+        self._buffered[table] += n
+        if self._buffered[table] >= self.chunk_rows:
+            self._flush_table(table)
+
+    def _move_rows_to_blocks(self, table: str) -> None:
+        # keeps single rows and bulk rows in the order they were added
+        rows = self._rows[table]
+        if rows:
+            self._blocks[table].append(
+                dict(zip(TABLES[table], (np.array(c) for c in zip(*rows))))
+            )
+            rows.clear()
+
+    def _flush_table(self, table: str) -> None:
+        self._move_rows_to_blocks(table)
+        blocks = self._blocks[table]
+        if not blocks:
+            return
+        columns = {
+            name: np.concatenate([block[name] for block in blocks])
+            for name in TABLES[table]
+        }
+        blocks.clear()
+        self._buffered[table] = 0
+        self._write_chunk(table, columns)
+
+    @abstractmethod
+    def _write_chunk(self, table: str, columns: dict[str, np.ndarray]) -> None:
+        """
+        Write out one chunk of a table, given as one array per column.
+        """
+
+    def flush(self) -> None:
+        for table in TABLES:
+            self._flush_table(table)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.flush()
+            self.closed = True
+
+    def __enter__(self) -> ResultsSink:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class CsvSink(ResultsSink):
+    """
+    Writes every table to ``<directory>/<table>.csv``, appending one chunk at a time.
+    """
+
+    def _write_chunk(self, table: str, columns: dict[str, np.ndarray]) -> None:
+        path = os.path.join(self.directory, f"{table}.csv")
+        new_file = not os.path.exists(path)
+        with open(path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(TABLES[table])
+            writer.writerows(zip(*(columns[name].tolist() for name in TABLES[table])))
+
+
+class ParquetSink(ResultsSink):
+    """
+    Writes every chunk as its own file ``<directory>/<table>/part-NNNNN.parquet``,
+    so the directory can be read as a dataset at any time during the run.
+    Requires the optional pyarrow package.
+    """
+
+    def __init__(self, *args, **kwargs):
+        import pyarrow  # noqa: F401  fail early when pyarrow is missing
+
+        super().__init__(*args, **kwargs)
+        self._parts: dict[str, int] = {table: 0 for table in TABLES}
+
+    def _write_chunk(self, table: str, columns: dict[str, np.ndarray]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        directory = os.path.join(self.directory, table)
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{self._parts[table]:05d}.parquet"
+        # write under a hidden temporary name so readers never see a partial file
+        tmp_path = os.path.join(directory, f".{name}.tmp")
+        pq.write_table(pa.table(columns), tmp_path)
+        os.replace(tmp_path, os.path.join(directory, name))
+        self._parts[table] += 1
+
+
+def open_sink(directory: str, format: str = "parquet", **kwargs) -> ResultsSink:
+    """
+    Create a sink writing to ``directory``.
+    Falls back to CSV when Parquet is asked for but pyarrow is not installed.
+    Args:
+        directory (str): Output directory.
+        format (str): "parquet" or "csv".
+        **kwargs: Passed on to ``ResultsSink``.
+    """
+    if format == "parquet":
+        try:
+            return ParquetSink(directory, **kwargs)
+        except ImportError:
+            warnings.warn("pyarrow is not installed, writing CSV instead of Parquet")
+            return CsvSink(directory, **kwargs)
+    if format == "csv":
+        return CsvSink(directory, **kwargs)
+    raise ValueError(f"Unknown results format: {format}")
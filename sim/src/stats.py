@@ -0,0 +1,136 @@
+from __future__ import annotations
+from typing import Optional
+
+import numpy as np
+
+from sim.src.buildings import BUILDING_TYPES
+from sim.src.params import AgeGroups, BuldingType, IllnessStates
+
+
+AGE_GROUPS: list[AgeGroups] = list(AgeGroups)
+# age groups start at these ages, in the order of AGE_GROUPS
+AGE_GROUP_BOUNDS = np.array([18, 30, 65])
+
+OUTDOORS = 0
+# location 0 is outdoors, location i + 1 is the i-th entry of BUILDING_TYPES
+LOCATIONS: list[Optional[BuldingType]] = [None] + BUILDING_TYPES
+
+_STATES = len(IllnessStates) + 1  # columns are indexed by the state values, 0 is unused
+
+
+def age_group_codes(ages: np.ndarray) -> np.ndarray:
+    """
+    Positions in ``AGE_GROUPS`` of the given ages, as ``HumanAgent.determine_age_group`` decides.
+    """
+    return np.digitize(ages, AGE_GROUP_BOUNDS).astype(np.int8)
+
+
+def location_codes(building_codes: np.ndarray) -> np.ndarray:
+    """
+    Positions in ``LOCATIONS`` of the given ``BuildingIndex`` codes.
+    """
+    return building_codes.astype(np.int8) + 1
+
+
+class EpidemicCounters:
+    """
+    Number of agents in every illness state, overall, per age group and per
+    location (outdoors or a building type), kept up to date on every state
+    change and every move instead of being counted over all agents.
+    Also counts every infection, recovery and death since the start.
+
+    Age groups and locations are passed as codes, positions in
+    ``AGE_GROUPS`` and ``LOCATIONS``.
+    """
+
+    def __init__(self):
+        self._by_age = np.zeros((len(AGE_GROUPS), _STATES), dtype=np.int64)
+        self._by_location = np.zeros((len(LOCATIONS), _STATES), dtype=np.int64)
+        self.cumulative_infections = 0
+        self.cumulative_recoveries = 0
+        self.cumulative_deaths = 0
+
+    def add(self, statuses, age_groups, locations) -> None:
+        """
+        Count new agents. All arguments are arrays (or scalars) of codes.
+        """
+        np.add.at(self._by_age, (age_groups, statuses), 1)
+        np.add.at(self._by_location, (locations, statuses), 1)
+
+    def transition(self, old: int, new: int, age_group: int, location: int) -> None:
+        """
+        One agent changed its illness state from ``old`` to ``new`` (state values).
+        """
+        self._by_age[age_group, old] -= 1
+        self._by_age[age_group, new] += 1
+        self._by_location[location, old] -= 1
+        self._by_location[location, new] += 1
+        self._count_cumulative(new, 1)
+
+    def transitions(
+        self, old: np.ndarray, new: int, age_groups: np.ndarray, locations: np.ndarray
+    ) -> None:
+        """
+        Bulk form of ``transition`` for agents that all move to the same state.
+        """
+        if len(old) == 0:
+            return
+        np.subtract.at(self._by_age, (age_groups, old), 1)
+        np.subtract.at(self._by_location, (locations, old), 1)
+        self._by_age[:, new] += np.bincount(age_groups, minlength=len(AGE_GROUPS))
+        self._by_location[:, new] += np.bincount(locations, minlength=len(LOCATIONS))
+        self._count_cumulative(new, len(old))
+
+    def _count_cumulative(self, new: int, n: int) -> None:
+        if new == IllnessStates.INFECTED.value:
+            self.cumulative_infections += n
+        elif new == IllnessStates.RECOVERED.value:
+            self.cumulative_recoveries += n
+        elif new == IllnessStates.DEAD.value:
+            self.cumulative_deaths += n
+
+    def move(self, status: int, old: int, new: int) -> None:
+        """
+        One agent went from location ``old`` to location ``new``.
+        """
+        if old != new:
+            self._by_location[old, status] -= 1
+            self._by_location[new, status] += 1
+
+    def moves(self, statuses: np.ndarray, old: np.ndarray, new: np.ndarray) -> None:
+        """
+        Bulk form of ``move``.
+        """
+        changed = old != new
+        if changed.any():
+            statuses = statuses[changed]
+            np.subtract.at(self._by_location, (old[changed], statuses), 1)
+            np.add.at(self._by_location, (new[changed], statuses), 1)
+
+    def count(self, status: IllnessStates) -> int:
+        return int(self._by_age[:, status.value].sum())
+
+    def at(self, location: Optional[BuldingType], status: IllnessStates) -> int:
+        """
+        Number of agents in a state standing in a building type, None for outdoors.
+        """
+        return int(self._by_location[LOCATIONS.index(location), status.value])
+
+    def counts(self) -> dict[IllnessStates, int]:
+        totals = self._by_age.sum(axis=0)
+        return {status: int(totals[status.value]) for status in IllnessStates}
+
+    def by_age_group(self) -> dict[AgeGroups, dict[IllnessStates, int]]:
+        return {
+            group: {status: int(row[status.value]) for status in IllnessStates}
+            for group, row in zip(AGE_GROUPS, self._by_age)
+        }
+
+    def by_location(self) -> dict[Optional[BuldingType], dict[IllnessStates, int]]:
+        """
+        Counts per building type the agents stand in, None for outdoors.
+        """
+        return {
+            location: {status: int(row[status.value]) for status in IllnessStates}
+            for location, row in zip(LOCATIONS, self._by_location)
+        }
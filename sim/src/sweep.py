@@ -0,0 +1,392 @@
+from __future__ import annotations
+import contextlib
+import csv
+import io
+import itertools
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Optional, Sequence, Union
+
+import numpy as np
+from scipy import stats
+from scipy.stats import qmc
+
+from maps.compiler import load_compiled
+from maps.map import Map
+from sim.src.ensemble import replicate_seeds
+from sim.src.model import CovidModel
+from sim.src.params import EpidemicParams
+from sim.src.runner import run_model
+
+
+# outcomes of one run, every one can be the target of a sweep
+METRICS = (
+    "peak_infected",
+    "peak_step",
+    "total_infections",
+    "total_deaths",
+    "final_infected",
+    "peak_hospitalized",
+    "peak_waiting",
+)
+
+# map shared by all replicates that run in a worker process
+_worker_map: Optional[Map] = None
+
+
+def _init_worker(map: Union[Map, str]) -> None:
+    global _worker_map
+    # a compiled map is memory mapped by every worker instead of sent to it
+    _worker_map = load_compiled(map) if isinstance(map, str) else map
+
+
+def epidemic_metrics(model: CovidModel, series: dict[str, list[int]]) -> dict[str, float]:
+    """
+    The ``METRICS`` of a finished run.
+    Args:
+        model (CovidModel): The model after the run.
+        series (dict[str, list[int]]): The series ``run_model`` returned.
+    """
+    infected = np.asarray(series["infected"])
+    peak = int(infected.argmax())
+    return {
+        "peak_infected": float(infected[peak]),
+        "peak_step": float(series["step"][peak]),
+        "total_infections": float(model.counters.cumulative_infections),
+        "total_deaths": float(series["dead"][-1]),
+        "final_infected": float(infected[-1]),
+        "peak_hospitalized": float(max(series["hospitalized"])),
+        "peak_waiting": float(max(series["waiting"])),
+    }
+
+
+def _run_replicate(
+    point: int,
+    replicate: int,
+    seed: int,
+    values: dict[str, Any],
+    n_agents: int,
+    steps: int,
+    engine: str,
+    transmission: str,
+    destinations: str,
+    mobility: str,
+    scheduling: str,
+) -> tuple[int, int, dict[str, float]]:
+    model = CovidModel(
+        N=n_agents,
+        width=_worker_map.width,
+        height=_worker_map.height,
+        map=_worker_map,
+        seed=seed,
+        engine=engine,
+        params=EpidemicParams.from_dict(values),
+        transmission=transmission,
+        destinations=destinations,
+        mobility=mobility,
+        scheduling=scheduling,
+    )
+    # the model reports deaths on the console, thousands of runs would drown the progress
+    with contextlib.redirect_stdout(io.StringIO()):
+        series = run_model(model, steps)
+    return point, replicate, epidemic_metrics(model, series)
+
+
+def grid_design(levels: dict[str, Sequence[Any]]) -> list[dict[str, Any]]:
+    """
+    Every combination of the given values of every parameter.
+    """
+    names = list(levels)
+    return [
+        {name: EpidemicParams.convert(name, value) for name, value in zip(names, combination)}
+        for combination in itertools.product(*(levels[name] for name in names))
+    ]
+
+
+def _scale(unit: np.ndarray, bounds: dict[str, tuple[float, float]]) -> list[dict[str, Any]]:
+    # samples from the unit hypercube to parameter values
+    names = list(bounds)
+    low = np.array([bounds[name][0] for name in names], dtype=float)
+    high = np.array([bounds[name][1] for name in names], dtype=float)
+    samples = low + unit * (high - low)
+    return [
+        {name: EpidemicParams.convert(name, value) for name, value in zip(names, row)}
+        for row in samples.tolist()
+    ]
+
+
+def latin_hypercube_design(
+    bounds: dict[str, tuple[float, float]], points: int, seed: Optional[int] = None
+) -> list[dict[str, Any]]:
+    """
+    ``points`` points whose values of every parameter fall one into each of
+    ``points`` equally wide bins between its bounds.
+    """
+    sampler = qmc.LatinHypercube(d=len(bounds), seed=np.random.default_rng(seed))
+    return _scale(sampler.random(points), bounds)
+
+
+def sobol_design(
+    bounds: dict[str, tuple[float, float]], points: int, seed: Optional[int] = None
+) -> list[dict[str, Any]]:
+    """
+    A scrambled Sobol sequence between the bounds. Its balance properties only
+    hold for powers of two, so ``points`` is rounded up to the next one.
+    """
+    sampler = qmc.Sobol(d=len(bounds), seed=np.random.default_rng(seed))
+    return _scale(sampler.random_base2(max(0, math.ceil(math.log2(points)))), bounds)
+
+
+def confidence_half_width(values: Sequence[float], confidence: float = 0.95) -> float:
+    """
+    Half width of the Student t confidence interval of the mean, infinite below two values.
+    """
+    n = len(values)
+    if n < 2:
+        return math.inf
+    std = float(np.std(values, ddof=1))
+    return float(stats.t.ppf((1 + confidence) / 2, n - 1)) * std / math.sqrt(n)
+
+
+class PointResult:
+    """
+    The replicates of one point of a sweep.
+    """
+
+    def __init__(self, values: dict[str, Any], metrics: dict[str, list[float]], converged: bool):
+        """
+        Args:
+            values (dict[str, Any]): The swept parameters of the point.
+            metrics (dict[str, list[float]]): Every metric of every replicate, in replicate order.
+            converged (bool): Whether the confidence interval of the target got
+                tight enough before the replicates ran out.
+        """
+        self.values = values
+        self.metrics = metrics
+        self.converged = converged
+
+    @property
+    def replicates(self) -> int:
+        return len(self.metrics[METRICS[0]])
+
+    def mean(self, metric: str) -> float:
+        return float(np.mean(self.metrics[metric]))
+
+    def half_width(self, metric: str, confidence: float = 0.95) -> float:
+        return confidence_half_width(self.metrics[metric], confidence)
+
+    def __repr__(self) -> str:
+        return f"PointResult({self.values}, replicates={self.replicates})"
+
+
+class SweepResult:
+    """
+    The results of all points of a sweep, in design order.
+    """
+
+    def __init__(self, points: list[PointResult], target: str, confidence: float):
+        self.points = points
+        self.target = target
+        self.confidence = confidence
+
+    @property
+    def replicates(self) -> int:
+        """
+        Replicates run over all points, not counting those discarded after a point converged.
+        """
+        return sum(point.replicates for point in self.points)
+
+    def sensitivity(self, metric: Optional[str] = None) -> dict[str, float]:
+        """
+        Standardized regression coefficients of the mean of ``metric`` (the target
+        by default) on the swept parameters: how many standard deviations the metric
+        moves per standard deviation of each parameter, the others held fixed.
+        Parameters that were not varied are left out.
+        """
+        metric = metric or self.target
+        names = [
+            name
+            for name in self.points[0].values
+            if len({point.values[name] for point in self.points}) > 1
+        ]
+        if len(self.points) <= len(names):
+            raise ValueError(
+                f"Need more points than varied parameters ({len(names)}) for a sensitivity analysis"
+            )
+        x = np.array([[point.values[name] for name in names] for point in self.points], dtype=float)
+        y = np.array([point.mean(metric) for point in self.points])
+        if y.std() == 0:
+            return {name: 0.0 for name in names}
+        x = (x - x.mean(axis=0)) / x.std(axis=0)
+        y = (y - y.mean()) / y.std()
+        coefficients, *_ = np.linalg.lstsq(np.column_stack([np.ones(len(y)), x]), y, rcond=None)
+        return dict(zip(names, coefficients[1:].tolist()))
+
+    def write_csv(self, path: str) -> None:
+        """
+        One row per point: its parameters, replicates, and the mean and
+        confidence interval half width of every metric.
+        """
+        names = list(self.points[0].values) if self.points else []
+        header = names + ["replicates", "converged"]
+        for metric in METRICS:
+            header += [f"{metric}_mean", f"{metric}_ci"]
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for point in self.points:
+                row = [point.values[name] for name in names]
+                row += [point.replicates, int(point.converged)]
+                for metric in METRICS:
+                    row += [point.mean(metric), point.half_width(metric, self.confidence)]
+                writer.writerow(row)
+
+
+class _PointState:
+    # bookkeeping of a point while the sweep runs
+    def __init__(self):
+        self.results: dict[int, dict[str, float]] = {}
+        self.submitted = 0
+        self.checked = 0  # replicates 0..checked-1 were tested for convergence
+        self.done: Optional[PointResult] = None
+
+
+def run_sweep(
+    map: Map,
+    design: list[dict[str, Any]],
+    n_agents: int,
+    steps: int,
+    target: str = "peak_infected",
+    min_replicates: int = 3,
+    max_replicates: int = 30,
+    tolerance: float = 0.05,
+    confidence: float = 0.95,
+    base_seed: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    engine: str = "agents",
+    transmission: str = "virus",
+    destinations: str = "random",
+    mobility: str = "random",
+    scheduling: str = "step",
+    on_point: Optional[Callable[[int, PointResult], None]] = None,
+) -> SweepResult:
+    """
+    Run replicates of every point of a design in parallel until the mean of the
+    target metric is known well enough.
+
+    A point stops once the confidence interval of its target is at most
+    ``tolerance`` times its mean wide on either side, or after ``max_replicates``.
+    Replicate ``i`` of every point uses the same seed (common random numbers), so
+    differences between points are not drowned in seed noise. Convergence is
+    tested on replicates in seed order, never on whichever finished first, so a
+    sweep gives the same result for any number of workers; replicates that were
+    already running when their point converged are discarded.
+    Args:
+        map (Map): The map to simulate on, sent to every worker process once,
+            or memory mapped by them when it is a compiled map.
+        design (list[dict[str, Any]]): The points, values of ``EpidemicParams``
+            fields, e.g. from ``latin_hypercube_design``.
+        n_agents (int): Number of agents.
+        steps (int): Number of steps per replicate.
+        target (str): The metric to converge, one of ``METRICS``.
+        min_replicates (int): Replicates of every point before testing convergence, at least 2.
+        max_replicates (int): Replicates after which a point stops anyway.
+        tolerance (float): Relative half width of the confidence interval to stop at.
+        confidence (float): Confidence level of the interval.
+        base_seed (Optional[int]): Seed the replicate seeds are derived from.
+        max_workers (Optional[int]): Number of worker processes, all cores by default.
+        engine (str): Model engine, "agents" or "arrays".
+        transmission (str): "virus", "contact" or "both", see CovidModel.
+        destinations (str): "random" or "nearest" building tiles, see CovidModel.
+        mobility (str): "random" or "schedule", see CovidModel.
+        scheduling (str): "step" or "event", see CovidModel.
+        on_point (Callable): Called with ``(index, result)`` as every point finishes.
+    """
+    if target not in METRICS:
+        raise ValueError(f"Unknown target metric: {target}")
+    if not 2 <= min_replicates <= max_replicates:
+        raise ValueError("Need 2 <= min_replicates <= max_replicates")
+    for values in design:
+        # fail here rather than in every worker
+        EpidemicParams.from_dict(values)
+
+    seeds = replicate_seeds(base_seed, max_replicates)
+    states = [_PointState() for _ in design]
+    max_workers = max_workers or os.cpu_count()
+
+    def next_task() -> Optional[int]:
+        # the unfinished point with the fewest replicates started; a point runs
+        # at most min_replicates ahead of the replicates tested so far, so not
+        # too many are wasted when it converges
+        best = None
+        for index, state in enumerate(states):
+            if state.done is not None or state.submitted >= max_replicates:
+                continue
+            if state.submitted >= state.checked + min_replicates:
+                continue
+            if best is None or state.submitted < states[best].submitted:
+                best = index
+        return best
+
+    def finish(index: int, n: int, converged: bool) -> None:
+        state = states[index]
+        metrics = {
+            metric: [state.results[i][metric] for i in range(n)] for metric in METRICS
+        }
+        state.done = PointResult(design[index], metrics, converged)
+        state.results.clear()
+        if on_point is not None:
+            on_point(index, state.done)
+
+    def check(index: int) -> None:
+        state = states[index]
+        while state.done is None and state.checked in state.results:
+            state.checked += 1
+            n = state.checked
+            if n >= min_replicates:
+                values = [state.results[i][target] for i in range(n)]
+                if confidence_half_width(values, confidence) <= tolerance * abs(np.mean(values)):
+                    finish(index, n, True)
+                elif n == max_replicates:
+                    finish(index, n, False)
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(map.compiled_path or map,),
+    ) as executor:
+        running: set[Future] = set()
+        while True:
+            while len(running) < 2 * max_workers:
+                index = next_task()
+                if index is None:
+                    break
+                state = states[index]
+                running.add(
+                    executor.submit(
+                        _run_replicate,
+                        index,
+                        state.submitted,
+                        seeds[state.submitted],
+                        design[index],
+                        n_agents,
+                        steps,
+                        engine,
+                        transmission,
+                        destinations,
+                        mobility,
+                        scheduling,
+                    )
+                )
+                state.submitted += 1
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index, replicate, metrics = future.result()
+                if states[index].done is None:
+                    states[index].results[replicate] = metrics
+                    check(index)
+
+    return SweepResult([state.done for state in states], target, confidence)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+from typing import Optional
+
+import mesa
+import numpy as np
+
+from sim.src.params import BuldingType
+
+
+class VirusField:
+    """
+    Whole-array operations on the "Virus" property layer.
+    Agents shed virus onto the cells they stand on, the virus decays over time
+    and can optionally spread to neighbouring cells (diffusion) or be removed
+    faster in some places (ventilation).
+
+    Diffusion and ventilation rates are given per building type. The ``None``
+    key stands for every cell that is not part of a building.
+    """
+
+    def __init__(
+        self,
+        layer: mesa.space.PropertyLayer,
+        buildings: dict[BuldingType, list[tuple[int, int]]],
+        diffusion: Optional[dict[Optional[BuldingType], float]] = None,
+        ventilation: Optional[dict[Optional[BuldingType], float]] = None,
+        decay_amount: float = 1.0,
+        torus: bool = True,
+    ):
+        """
+        Args:
+            layer (mesa.space.PropertyLayer): The layer holding the virus levels.
+            buildings (dict[BuldingType, list[tuple[int, int]]]): Building tiles by type.
+            diffusion (dict[Optional[BuldingType], float]): Fraction of a cell's virus
+                that moves to each of its 4 neighbours per decay, between 0 and 0.25.
+            ventilation (dict[Optional[BuldingType], float]): Fraction of a cell's
+                virus removed per decay, between 0 and 1.
+            decay_amount (float): Virus removed from every cell per decay.
+            torus (bool): Whether diffusion wraps around the grid edges.
+        """
+        self.layer = layer
+        self.decay_amount = decay_amount
+        self.torus = torus
+        self.diffusion_rate = self._rate_grid(buildings, diffusion)
+        self.ventilation_rate = self._rate_grid(buildings, ventilation)
+
+        if self.diffusion_rate is not None and (
+            self.diffusion_rate.min() < 0.0 or self.diffusion_rate.max() > 0.25
+        ):
+            raise ValueError("Diffusion rate must be between 0 and 0.25")
+        if self.ventilation_rate is not None and (
+            self.ventilation_rate.min() < 0.0 or self.ventilation_rate.max() > 1.0
+        ):
+            raise ValueError("Ventilation rate must be between 0 and 1")
+
+        # number of neighbours each cell can pass virus on to
+        self._degree = np.full(self.data.shape, 4.0)
+        if not torus:
+            self._degree[[0, -1], :] -= 1
+            self._degree[:, [0, -1]] -= 1
+
+    @property
+    def data(self) -> np.ndarray:
+        return self.layer.data
+
+    def _rate_grid(
+        self,
+        buildings: dict[BuldingType, list[tuple[int, int]]],
+        rates: Optional[dict[Optional[BuldingType], float]],
+    ) -> Optional[np.ndarray]:
+        if not rates or not any(rates.values()):
+            return None
+        grid = np.full(self.data.shape, rates.get(None, 0.0), dtype=float)
+        for type_, positions in buildings.items():
+            if type_ in rates and positions:
+                xs, ys = np.array(positions, dtype=np.intp).T
+                grid[xs, ys] = rates[type_]
+        return grid
+
+    def deposit(self, positions, amounts) -> None:
+        """
+        Add virus to many cells at once. Repeated positions accumulate.
+        Args:
+            positions: Sequence or (n, 2) array of (x, y) cells.
+            amounts: Scalar or length n array of virus amounts.
+        """
+        positions = np.asarray(positions, dtype=np.intp).reshape(-1, 2)
+        if len(positions) == 0:
+            return
+        np.add.at(self.data, (positions[:, 0], positions[:, 1]), amounts)
+
+    def decay(self) -> None:
+        """
+        Remove ``decay_amount`` from every cell, never going below zero,
+        then apply ventilation and diffusion if they are configured.
+        """
+        data = self.data
+        np.subtract(data, self.decay_amount, out=data)
+        np.maximum(data, 0.0, out=data)
+
+        if self.ventilation_rate is not None:
+            data *= 1.0 - self.ventilation_rate
+        if self.diffusion_rate is not None:
+            self._diffuse(data)
+
+    def _diffuse(self, data: np.ndarray) -> None:
+        outflow = data * self.diffusion_rate
+        inflow = np.zeros_like(data)
+        inflow[1:, :] += outflow[:-1, :]
+        inflow[:-1, :] += outflow[1:, :]
+        inflow[:, 1:] += outflow[:, :-1]
+        inflow[:, :-1] += outflow[:, 1:]
+        if self.torus:
+            inflow[0, :] += outflow[-1, :]
+            inflow[-1, :] += outflow[0, :]
+            inflow[:, 0] += outflow[:, -1]
+            inflow[:, -1] += outflow[:, 0]
+        data -= outflow * self._degree
+        data += inflow
+        np.maximum(data, 0.0, out=data)
@@ -0,0 +1,151 @@
+"""
+Parameter sweeps over the epidemic constants.
+
+Usage:
+    python -m sim.sweep --design grid --param mask_factor=0.05,0.2,0.5 --param immunity_time=300,500
+    python -m sim.sweep --design lhs --points 64 --param infection_scale=500:2000 --param hospital_time=100:500
+    python -m sim.sweep --design sobol --points 128 --target total_deaths --param death_rate=0.02:0.2 --param recovery_rate=0.1:0.5
+
+Every point runs replicates until the confidence interval of --target is
+within --tolerance of its mean, see sim.src.sweep.run_sweep.
+"""
+
+import argparse
+import time
+
+from maps.compiler import load_map
+from sim.src.params import EpidemicParams
+from sim.src.sweep import (
+    METRICS,
+    grid_design,
+    latin_hypercube_design,
+    run_sweep,
+    sobol_design,
+)
+
+
+def parse_param(text: str, design: str) -> tuple[str, object]:
+    """
+    ``NAME=V1,V2,...`` for a grid, ``NAME=LOW:HIGH`` for the sampled designs.
+    """
+    name, sep, spec = text.partition("=")
+    name = name.strip()
+    if not sep:
+        raise ValueError(f"Expected NAME=VALUES, got {text!r}")
+    if name not in EpidemicParams.FIELDS:
+        raise ValueError(f"Unknown epidemic parameter: {name}")
+    if design == "grid":
+        return name, [float(value) for value in spec.split(",")]
+    low, sep, high = spec.partition(":")
+    if not sep:
+        raise ValueError(f"Expected {name}=LOW:HIGH, got {text!r}")
+    return name, (float(low), float(high))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--design", choices=("grid", "lhs", "sobol"), default="lhs")
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=VALUES",
+        help="A swept parameter, V1,V2,... for a grid and LOW:HIGH otherwise; "
+        f"one of: {', '.join(EpidemicParams.FIELDS)}",
+    )
+    parser.add_argument(
+        "--points", type=int, default=32, help="Points of a lhs or sobol design"
+    )
+    parser.add_argument("--target", choices=METRICS, default="peak_infected")
+    parser.add_argument("--min-replicates", type=int, default=3)
+    parser.add_argument("--max-replicates", type=int, default=30)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.05,
+        help="Stop a point once the confidence interval of --target is this close to its mean",
+    )
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--steps", type=int, default=2000, help="Number of steps per replicate")
+    parser.add_argument("--agents", type=int, default=30, help="Number of agents")
+    parser.add_argument("--engine", choices=("agents", "arrays"), default="agents")
+    parser.add_argument("--transmission", choices=("virus", "contact", "both"), default="virus")
+    parser.add_argument("--destinations", choices=("random", "nearest"), default="random")
+    parser.add_argument("--mobility", choices=("random", "schedule"), default="random")
+    parser.add_argument(
+        "--scheduling",
+        choices=("step", "event"),
+        default="step",
+        help="Step every agent every step, or only the agents that have something to do",
+    )
+    parser.add_argument(
+        "--map", default="maps/walkway_map.tmx", help="Path to the Tiled map"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the design and the replicates")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes")
+    parser.add_argument("--out", default="sweep.csv", help="Where to write one row per point")
+    args = parser.parse_args(argv)
+    if not args.param:
+        parser.error("at least one --param is needed")
+    try:
+        args.space = dict(parse_param(text, args.design) for text in args.param)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.design == "grid":
+        design = grid_design(args.space)
+    elif args.design == "lhs":
+        design = latin_hypercube_design(args.space, args.points, args.seed)
+    else:
+        design = sobol_design(args.space, args.points, args.seed)
+
+    start = time.perf_counter()
+    mapa = load_map(args.map)
+    result = run_sweep(
+        mapa,
+        design,
+        args.agents,
+        args.steps,
+        target=args.target,
+        min_replicates=args.min_replicates,
+        max_replicates=args.max_replicates,
+        tolerance=args.tolerance,
+        confidence=args.confidence,
+        base_seed=args.seed,
+        max_workers=args.workers,
+        engine=args.engine,
+        transmission=args.transmission,
+        destinations=args.destinations,
+        mobility=args.mobility,
+        scheduling=args.scheduling,
+        on_point=lambda index, point: print(
+            f"point {index + 1}/{len(design)} {point.values}: "
+            f"{args.target}={point.mean(args.target):.1f} "
+            f"±{point.half_width(args.target, args.confidence):.1f} "
+            f"after {point.replicates} replicates"
+            + ("" if point.converged else " (not converged)"),
+            flush=True,
+        ),
+    )
+    result.write_csv(args.out)
+    elapsed = time.perf_counter() - start
+
+    if len(design) > len(args.space):
+        print(f"\nsensitivity of {args.target} (standardized regression coefficients):")
+        for name, coefficient in sorted(
+            result.sensitivity().items(), key=lambda item: -abs(item[1])
+        ):
+            print(f"  {name:<20} {coefficient:+.3f}")
+    print(
+        f"\n{len(design)} points, {result.replicates} replicates in {elapsed:.1f}s, "
+        f"results written to {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()